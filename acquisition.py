@@ -0,0 +1,181 @@
+import os
+import re
+import threading
+import numpy as np
+from serial_reader import SerialReader
+from ecg_store import ECGDataStore
+from ecg_recording import RecordingWriter, ECGRecording
+from qrs_detector import QRSDetector
+from alarm_engine import AlarmEngine, BPMThresholdRule, SignalLossRule, SoundBackend, LogBackend
+from sample_sources import open_source
+from perf_metrics import Metrics
+from hrv_stats import HRVEngine
+from signal_filters import FilterChain
+from channel_schema import DEFAULT_SCHEMA
+from event_index import Annotation, DROPOUT_SECONDS, as_annotation
+
+BAUDRATE = 115200
+
+
+# 通过系统枚举串口，不再逐个尝试打开
+def discover_ports():
+    from serial.tools import list_ports
+    return [port.device for port in sorted(list_ports.comports())]
+
+
+class AcquisitionPipeline:
+    # 单台设备的完整采集链路：串口读取 -> 滤波 -> 存储 -> 写盘 -> R波检测 -> 滚动统计 -> 报警
+    # 处理都在该设备自己的读取线程上完成，各设备之间互不影响
+    # port 也可以是 sample_sources 支持的合成/回放/伪终端来源描述
+    # metrics 为 None 时不统计性能指标；mains_frequency 为工频陷波频率（50 或 60Hz）
+    # schema 为设备的通道声明（含采样率），缺省为单导联 ECG,Respiration,BPM 并使用 sample_rate
+    # stream 为 stream_server.StreamServer 时向远程订阅者推送滤波后的样本和报警事件
+    # retention 为存储在内存中保留的全分辨率时长（秒），memory_limit 为存储的内存上限（字节，含样本列、R波和汇总金字塔），
+    # 更早的数据从本设备的录制中读取（见 ECGDataStore 的保留策略）
+    def __init__(self, port, sample_rate, recording_dir, bpm_low=40, bpm_high=120, alarm_interval=3,
+                 metrics=None, mains_frequency=50.0, schema=None, stream=None, retention=None, memory_limit=None):
+        self.port = port
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.name = self.unique_name(re.sub(r'[^\w.-]', '_', os.path.basename(port.rstrip('/\\@')) or port),
+                                     recording_dir)
+        self.ser = open_source(port, BAUDRATE)
+        # 模拟来源自带通道声明和采样率，真实串口使用配置的声明
+        schema = getattr(self.ser, 'schema', None) or schema
+        if schema is None:
+            schema = DEFAULT_SCHEMA.with_sample_rate(getattr(self.ser, 'sample_rate', sample_rate))
+        self.schema = schema
+        self.sample_rate = sample_rate = schema.sample_rate
+        self.filters = FilterChain(sample_rate, mains_frequency,
+                                   kinds=[schema.channels[i].kind for i in schema.filtered])
+        self.store = ECGDataStore(schema, hot_seconds=retention, max_bytes=memory_limit,
+                                  open_cold=self.open_recording)
+        # 原始通道与滤波后的通道都写盘，回看时两者均可导出
+        self.recorder = RecordingWriter(os.path.join(recording_dir, self.name), sample_rate,
+                                        channels=schema.storage_names)
+        self.detector = QRSDetector(sample_rate)
+        self.analytics = HRVEngine(sample_rate=sample_rate)
+        self.alarm_engine = AlarmEngine(
+            rules=[BPMThresholdRule(bpm_low, bpm_high, hysteresis=5, sustain=2.0, name=f"{self.name} 心率越限"),
+                   SignalLossRule(timeout=3.0, name=f"{self.name} 信号丢失")],
+            backends=[SoundBackend(), LogBackend()],
+            repeat_interval=alarm_interval,
+            on_event=self.record_event
+        )
+        self.reader = SerialReader(self.ser, on_batch=self.ingest, metrics=self.metrics, schema=schema)
+        # 存储中新增的事件（含回看时添加的标记）同时写入录制
+        self.store.on_event = self.recorder.write_event
+        self._dropped = 0
+        # 检测器最近一次给出的心率；有值之后报警只使用主机端心率
+        self._host_bpm = None
+        # 超过最低心率对应的RR间期仍没有R波时，不再沿用最近的心率
+        self._beat_timeout = 60.0 / bpm_low
+        self.stream = stream
+        if stream is not None:
+            stream.register(self.name, schema.filtered_names, sample_rate)
+
+    # 同名来源（如两次回放同一目录、相同的合成来源）加序号区分，
+    # 避免共用录制目录，以及在推流和导出窗口中按名称区分设备时冲突
+    _names = set()
+    _names_lock = threading.Lock()
+
+    @classmethod
+    def unique_name(cls, name, recording_dir):
+        with cls._names_lock:
+            unique, index = name, 2
+            while unique in cls._names or os.path.exists(os.path.join(recording_dir, unique)):
+                unique = f"{name}_{index}"
+                index += 1
+            cls._names.add(unique)
+        return unique
+
+    def start(self):
+        self.recorder.start()
+        self.alarm_engine.start()
+        self.reader.start()
+
+    def stop(self):
+        self.reader.stop()
+        # 等读取线程退出（最多一个串口超时）再关闭串口，避免读到一半的句柄被关闭
+        if self.reader.is_alive():
+            self.reader.join(timeout=2.0)
+        self.alarm_engine.stop()
+        self.recorder.close()
+        self.ser.close()
+
+    # 已写盘的录制，作为存储中移出内存部分的冷数据
+    def open_recording(self):
+        return ECGRecording(self.recorder.directory)
+
+    # 报警、数据中断事件与数据一起保存并加入事件索引；报警的重复提醒只推送，不记录
+    def record_event(self, event):
+        if self.stream is not None:
+            self.stream.publish_event(self.name, event)
+        if getattr(event, 'state', None) != 'repeat':
+            self.store.append_event(as_annotation(event))
+
+    # 两批样本之间的到达间隔明显长于这批样本本身的时长（设备停发、线路中断），或二进制帧序号出现缺口时，
+    # 记一次数据中断事件
+    def check_dropout(self, previous, timestamps):
+        dropped = self.reader.dropped_count
+        lost, self._dropped = dropped - self._dropped, dropped
+        if previous is None:
+            return
+        gap = timestamps[-1] - previous - len(timestamps) / self.sample_rate
+        if gap > DROPOUT_SECONDS:
+            self.record_event(Annotation(float(previous), 'dropout', '数据中断', f"{gap:.1f} 秒未收到数据"))
+        elif lost:
+            self.record_event(Annotation(float(previous), 'dropout', '样本丢失', f"传输中丢失 {lost} 个样本"))
+
+    # 在读取线程上处理一个批次，返回存储中单调化后的时间戳和供实时显示的滤波后数据
+    # （列顺序与 schema.filtered 一致）
+    def ingest(self, timestamps, values):
+        metrics = self.metrics
+        schema = self.schema
+        previous = self.store.last_timestamp
+        with metrics.timer('filter'):
+            filtered = self.filters.process(values[:, list(schema.filtered)])
+        with metrics.timer('store'):
+            self.store.append(timestamps, values, filtered)
+        timestamps = self.store.column('timestamp')[-len(values):]
+        self.recorder.write(timestamps, np.hstack((values, filtered)))
+        self.check_dropout(previous, timestamps)
+
+        # R波检测使用原始主导联（检测器自带带通）
+        with metrics.timer('detect'):
+            beat_times, rr_intervals, host_bpm = self.detector.process(timestamps, values[:, schema.primary])
+        self.store.append_beats(beat_times, rr_intervals, host_bpm)
+        self.recorder.write_beats(beat_times, rr_intervals, host_bpm)
+        with metrics.timer('analytics'):
+            if schema.resp is not None:
+                self.analytics.update(beat_times, rr_intervals, host_bpm, timestamps, values[:, schema.resp])
+            else:
+                self.analytics.update(beat_times, rr_intervals, host_bpm)
+
+        # 检测器给出心率后只提交主机端心率，没有R波的批次沿用最近一次的值，两种心率不混在同一序列中；
+        # 距上次R波超过 _beat_timeout（停搏、信号变平但仍有样本）时改为按 60/距上次R波的时间衰减，触发低心率报警；
+        # 此前使用设备上报的心率，设备不上报时仍提交时间戳，供信号丢失检测
+        valid_bpm = host_bpm[np.isfinite(host_bpm)]
+        if len(valid_bpm):
+            self._host_bpm = float(valid_bpm[-1])
+        if self._host_bpm is not None and len(beat_times):
+            self.alarm_engine.submit(beat_times, host_bpm)
+        elif self._host_bpm is not None:
+            since_beat = timestamps - self.detector.last_beat_time
+            self.alarm_engine.submit(timestamps, np.where(since_beat > self._beat_timeout,
+                                                          60.0 / np.maximum(since_beat, 1e-9), self._host_bpm))
+        elif schema.bpm is not None:
+            self.alarm_engine.submit(timestamps, values[:, schema.bpm])
+        else:
+            self.alarm_engine.submit(timestamps, np.full(len(timestamps), np.nan))
+
+        if metrics.enabled:
+            metrics.gauge('store_bytes', self.store.nbytes)
+            metrics.gauge('store_hot_seconds', round(self.store.hot_seconds))
+            metrics.gauge('store_spilled_samples', self.store.spilled)
+            metrics.gauge('store_discarded_samples', self.store.discarded)
+            metrics.gauge('pyramid_bytes', self.store.pyramid.nbytes)
+            metrics.gauge('alarm_dropped_batches', self.alarm_engine.dropped_batches)
+            metrics.gauge('filter_latency_ms', round(self.filters.latency['ecg'] * 1000, 1))
+        if self.stream is not None:
+            self.stream.publish(self.name, timestamps, filtered)
+        return timestamps, filtered
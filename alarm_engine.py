@@ -0,0 +1,194 @@
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+
+# 报警事件：state 为 'raised'（触发）、'repeat'（持续期间重复提醒）或 'cleared'（解除）
+AlarmEvent = namedtuple('AlarmEvent', ['timestamp', 'rule', 'state', 'message'])
+
+
+class BPMThresholdRule:
+    # 心率越限报警：低于 low 或高于 high 进入越限状态，回到 [low+hysteresis, high-hysteresis] 才解除
+    # 越限持续 sustain 秒后才触发，避免单个异常值误报
+    def __init__(self, low=40, high=120, hysteresis=5, sustain=0.0, name='心率越限'):
+        self.low = low
+        self.high = high
+        self.hysteresis = hysteresis
+        self.sustain = sustain
+        self.name = name
+        self.out_of_range = False
+        self.onset_time = None
+        self.active = False
+
+    def evaluate(self, timestamps, bpm):
+        events = []
+        bpm = np.asarray(bpm, dtype=float)
+        valid = np.isfinite(bpm)
+        timestamps, bpm = np.asarray(timestamps)[valid], bpm[valid]
+        if not len(bpm):
+            return events
+
+        # 向量化的滞回状态：越限样本置1，回到内带样本置0，其余沿用前一个状态
+        outside = (bpm < self.low) | (bpm > self.high)
+        inside = (bpm >= self.low + self.hysteresis) & (bpm <= self.high - self.hysteresis)
+        decided = np.where(outside | inside, np.arange(len(bpm)), -1)
+        decided = np.maximum.accumulate(decided)
+        state = np.where(decided >= 0, outside[np.maximum(decided, 0)], self.out_of_range)
+
+        # 只遍历状态变化点
+        previous = self.out_of_range
+        for index in np.flatnonzero(np.diff(np.concatenate(([previous], state)).astype(int))):
+            if state[index]:
+                self.onset_time = timestamps[index]
+            else:
+                self.onset_time = None
+                if self.active:
+                    self.active = False
+                    events.append(AlarmEvent(timestamps[index], self.name, 'cleared',
+                                             f"心率恢复: {bpm[index]:.0f} bpm"))
+        self.out_of_range = bool(state[-1])
+
+        if self.out_of_range and not self.active and timestamps[-1] - self.onset_time >= self.sustain:
+            self.active = True
+            events.append(AlarmEvent(timestamps[-1], self.name, 'raised',
+                                     f"心率异常: {bpm[-1]:.0f} bpm"))
+        return events
+
+    def tick(self, now, last_data_time):
+        return []
+
+
+class SignalLossRule:
+    # 信号丢失报警：超过 timeout 秒没有收到任何数据
+    def __init__(self, timeout=3.0, name='信号丢失'):
+        self.timeout = timeout
+        self.name = name
+        self.active = False
+
+    def evaluate(self, timestamps, bpm):
+        if self.active and len(timestamps):
+            self.active = False
+            return [AlarmEvent(timestamps[0], self.name, 'cleared', "信号已恢复")]
+        return []
+
+    def tick(self, now, last_data_time):
+        if not self.active and last_data_time is not None and now - last_data_time >= self.timeout:
+            self.active = True
+            return [AlarmEvent(now, self.name, 'raised', f"{self.timeout:.0f} 秒内未收到数据")]
+        return []
+
+
+class SoundBackend:
+    # Windows 下使用 winsound 蜂鸣，其他平台输出终端响铃字符
+    def notify(self, event):
+        if event.state == 'cleared':
+            return
+        try:
+            import winsound
+            winsound.Beep(1000, 500)
+        except ImportError:
+            sys.stdout.write('\a')
+            sys.stdout.flush()
+
+
+class LogBackend:
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+
+    def notify(self, event):
+        if event.state == 'repeat':
+            return
+        line = f"[报警] {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.timestamp))} " \
+               f"{event.rule} {event.state}: {event.message}"
+        if self.file_path is None:
+            print(line)
+        else:
+            with open(self.file_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class CallbackBackend:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def notify(self, event):
+        self.callback(event)
+
+
+class NullBackend:
+    # 不产生任何提醒，只保存收到的事件，便于测试
+    def __init__(self):
+        self.events = []
+
+    def notify(self, event):
+        self.events.append(event)
+
+
+class AlarmEngine(threading.Thread):
+    # 报警工作线程：采集/界面线程只做非阻塞的入队，规则判断和提醒（包括蜂鸣）都在这里执行
+    def __init__(self, rules, backends, repeat_interval=3.0, tick_interval=0.5, max_pending=1000,
+                 on_event=None):
+        super().__init__(daemon=True)
+        self.rules = rules
+        self.backends = backends
+        self.repeat_interval = repeat_interval
+        self.tick_interval = tick_interval
+        self.on_event = on_event
+        self.dropped_batches = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop_event = threading.Event()
+        self._last_data_time = None
+        self._last_notify = {}
+
+    def submit(self, timestamps, bpm):
+        try:
+            self._queue.put_nowait((np.asarray(timestamps, dtype=float), np.asarray(bpm, dtype=float)))
+        except queue.Full:
+            # 队列满说明报警线程跟不上，丢弃而不是阻塞采集
+            self.dropped_batches += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                timestamps, bpm = self._queue.get(timeout=self.tick_interval)
+                self._last_data_time = time.time()
+                for rule in self.rules:
+                    self._dispatch(rule.evaluate(timestamps, bpm))
+            except queue.Empty:
+                pass
+            now = time.time()
+            for rule in self.rules:
+                self._dispatch(rule.tick(now, self._last_data_time))
+            self._repeat_active(now)
+
+    def _dispatch(self, events):
+        for event in events:
+            if self.on_event is not None:
+                self.on_event(event)
+            if event.state == 'raised':
+                self._last_notify[event.rule] = (time.time(), event)
+            elif event.state == 'cleared':
+                self._last_notify.pop(event.rule, None)
+            self._notify(event)
+
+    # 重复提醒同样交给 on_event，订阅方（如推流客户端）也能收到
+    def _repeat_active(self, now):
+        for rule_name, (last_time, event) in list(self._last_notify.items()):
+            if now - last_time >= self.repeat_interval:
+                self._last_notify[rule_name] = (now, event)
+                repeat = event._replace(state='repeat')
+                if self.on_event is not None:
+                    self.on_event(repeat)
+                self._notify(repeat)
+
+    def _notify(self, event):
+        for backend in self.backends:
+            try:
+                backend.notify(event)
+            except Exception as e:
+                print(f"报警输出错误: {e}")
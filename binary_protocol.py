@@ -0,0 +1,174 @@
+import binascii
+import numpy as np
+
+# 二进制帧格式（小端）：
+#   同步字 0xA5 0x5A | 负载长度 uint8 | 序号 uint16 | ECG int16 × 导联数 | 呼吸 int16 | 心率 float32 | CRC16 uint16
+# CRC 为 CRC-16/CCITT-FALSE，覆盖长度字节和负载；ECG、呼吸按 SCALE 定点化
+# 序号每帧加一（65535 后回到 0），用于统计传输中丢失的样本
+# 负载长度随导联数变化，解码器只接受与自身导联数一致的帧；单导联即原有的15字节帧
+SYNC = b'\xa5\x5a'
+ECG_SCALE = 1000.0
+RESP_SCALE = 1000.0
+
+
+class FrameLayout:
+    # 给定导联数的帧结构
+    def __init__(self, n_leads=1):
+        self.n_leads = n_leads
+        self.dtype = np.dtype([('sync', '<u2'), ('length', 'u1'), ('sequence', '<u2'), ('ecg', '<i2', (n_leads,)),
+                               ('resp', '<i2'), ('bpm', '<f4'), ('crc', '<u2')])
+        self.size = self.dtype.itemsize
+        self.payload_size = self.size - len(SYNC) - 1 - 2
+        if self.payload_size > 255:
+            raise ValueError(f"导联数过多，帧负载超过255字节: {n_leads}")
+        self.header = np.frombuffer(SYNC + bytes([self.payload_size]), dtype=np.uint8)
+
+
+SINGLE_LEAD = FrameLayout(1)
+FRAME_DTYPE = SINGLE_LEAD.dtype
+FRAME_SIZE = SINGLE_LEAD.size
+PAYLOAD_SIZE = SINGLE_LEAD.payload_size
+HEADER = SINGLE_LEAD.header
+
+
+# 帧数不少于该值时按列向量化计算CRC，否则逐帧调用C实现
+VECTOR_CRC_MIN_FRAMES = 256
+
+
+def _crc_table(poly=0x1021):
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+    return table
+
+
+CRC_TABLE = _crc_table()
+
+
+# CRC-16/CCITT-FALSE（即 binascii.crc_hqx 初值取 0xFFFF）
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+# 计算从 starts 各位置开始、长 frame_size 字节的帧的CRC；少量帧逐帧计算，大量帧对 (帧数, 字节数) 矩阵逐列查表
+def frame_crcs(data, buffer, starts, frame_size=FRAME_SIZE):
+    first, last = len(SYNC), frame_size - 2
+    if len(starts) < VECTOR_CRC_MIN_FRAMES:
+        return np.array([crc16(data[p + first:p + last]) for p in starts.tolist()], dtype=np.uint16)
+    rows = buffer[starts[:, None] + np.arange(first, last)]
+    crc = np.full(len(starts), 0xFFFF, dtype=np.uint16)
+    for column in rows.T:
+        index = (crc >> 8) ^ column
+        crc <<= 8
+        crc ^= CRC_TABLE[index]
+    return crc
+
+
+# 将 (n, 导联数 + 2) 的 导联...,resp,bpm 数组编码为连续的二进制帧，供模拟来源和固件联调使用
+def encode_frames(values, start_sequence=0):
+    values = np.asarray(values, dtype=float)
+    n_leads = values.shape[1] - 2
+    layout = SINGLE_LEAD if n_leads == 1 else FrameLayout(n_leads)
+    frames = np.zeros(len(values), dtype=layout.dtype)
+    frames['sync'] = np.frombuffer(SYNC, dtype='<u2')[0]
+    frames['length'] = layout.payload_size
+    frames['sequence'] = (start_sequence + np.arange(len(values))) % 65536
+    frames['ecg'] = np.clip(np.round(values[:, :n_leads] * ECG_SCALE), -32768, 32767)
+    frames['resp'] = np.clip(np.round(values[:, n_leads] * RESP_SCALE), -32768, 32767)
+    frames['bpm'] = values[:, n_leads + 1]
+    raw = frames.tobytes()
+    frames['crc'] = frame_crcs(raw, np.frombuffer(raw, dtype=np.uint8), np.arange(len(frames)) * layout.size,
+                               layout.size)
+    return frames.tobytes()
+
+
+class BinaryFrameDecoder:
+    # 整块缓冲区向量化解码：找出所有同步字，校验长度和CRC，坏帧或噪声字节跳过后在下一个同步字处重新对齐
+    # 输出 (n, 导联数 + 2) 的 导联...,resp,bpm 数组
+    def __init__(self, n_leads=1):
+        self.layout = SINGLE_LEAD if n_leads == 1 else FrameLayout(n_leads)
+        self.n_fields = n_leads + 2
+        self._pending = b''
+        self._last_sequence = None
+        self.corrupt_count = 0
+        self.dropped_count = 0
+        self.skipped_bytes = 0
+
+    def feed(self, chunk):
+        data = self._pending + chunk
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        if len(buffer) < self.layout.size:
+            self._pending = data
+            return np.empty((0, self.n_fields))
+
+        frames, consumed = self._aligned(data, buffer)
+        if frames is None:
+            frames, consumed = self._resync(data, buffer)
+        self._pending = data[consumed:]
+        if not len(frames):
+            return np.empty((0, self.n_fields))
+
+        # 序号连续时只需比较首尾，出现缺口才逐帧统计
+        sequence = frames['sequence']
+        previous = self._last_sequence if self._last_sequence is not None else (int(sequence[0]) - 1) % 65536
+        if (previous + len(sequence)) % 65536 != sequence[-1]:
+            steps = np.diff(np.concatenate(([previous], sequence.astype(np.int64))))
+            self.dropped_count += int(np.sum((steps - 1) % 65536))
+        self._last_sequence = int(sequence[-1])
+
+        n_leads = self.layout.n_leads
+        values = np.empty((len(frames), self.n_fields))
+        np.multiply(frames['ecg'], 1 / ECG_SCALE, out=values[:, :n_leads])
+        np.multiply(frames['resp'], 1 / RESP_SCALE, out=values[:, n_leads])
+        values[:, n_leads + 1] = frames['bpm']
+        return values
+
+    # 常见情况：缓冲区从帧头开始且全部是完好的帧，直接按结构化类型零拷贝解释
+    def _aligned(self, data, buffer):
+        size, header = self.layout.size, self.layout.header
+        count = len(buffer) // size
+        if not (buffer[:count * size].reshape(count, size)[:, :len(header)] == header).all():
+            return None, 0
+        frames = np.frombuffer(data, dtype=self.layout.dtype, count=count)
+        if not (frame_crcs(data, buffer, np.arange(0, count * size, size), size) == frames['crc']).all():
+            return None, 0
+        return frames, count * size
+
+    # 存在噪声、坏帧或错位时，逐个同步字候选校验
+    def _resync(self, data, buffer):
+        n = len(buffer)
+        size = self.layout.size
+        starts = np.flatnonzero((buffer[:-1] == SYNC[0]) & (buffer[1:] == SYNC[1]))
+        starts = starts[starts + size <= n]
+        starts = starts[buffer[starts + len(SYNC)] == self.layout.payload_size]
+        expected = buffer[starts + size - 2].astype(np.uint16) | (buffer[starts + size - 1].astype(np.uint16) << 8)
+        ok = frame_crcs(data, buffer, starts, size) == expected
+        accepted = starts[ok]
+
+        # 负载中恰好出现同步字且CRC也通过的情况极少，此时按先到先得剔除重叠的帧
+        if len(accepted) > 1 and np.any(np.diff(accepted) < size):
+            keep = []
+            end = -1
+            for position in accepted.tolist():
+                if position >= end:
+                    keep.append(position)
+                    end = position + size
+            accepted = np.array(keep, dtype=starts.dtype)
+            ok = np.isin(starts, accepted)
+
+        # 校验失败且不在任何有效帧内部的同步字计为坏帧
+        failed = starts[~ok]
+        if len(failed) and len(accepted):
+            owner = np.searchsorted(accepted, failed, side='right') - 1
+            inside = (owner >= 0) & (failed < accepted[np.maximum(owner, 0)] + size)
+            failed = failed[~inside]
+        self.corrupt_count += len(failed)
+
+        # 最后一个有效帧之后、可能是半帧的尾部留到下一块
+        consumed = max(int(accepted[-1]) + size if len(accepted) else 0, n - size + 1)
+        self.skipped_bytes += consumed - len(accepted) * size
+        frames = buffer[accepted[:, None] + np.arange(size)].view(self.layout.dtype).ravel()
+        return frames, consumed
@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+# 通道描述：kind 为 'ecg'（心电导联）、'resp'（呼吸）、'bpm'（设备端心率）或 'other'
+Channel = namedtuple('Channel', ['name', 'kind'])
+# 滤波后的通道在原通道名后加此后缀，存储、录制、导出中与原始通道并列
+FILTERED_SUFFIX = '_filtered'
+# 滤波的通道类型
+FILTERED_KINDS = ('ecg', 'resp')
+# R波检测优先使用的导联（R波通常最明显）
+PREFERRED_LEAD = 'II'
+
+LEADS_12 = ('I', 'II', 'III', 'aVR', 'aVL', 'aVF', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6')
+# 8 个独立导联，其余 4 个肢体导联可由 I、II 推算
+LEADS_8 = ('I', 'II', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6')
+
+
+class ChannelSchema:
+    # 设备数据的通道声明：每个样本按 channels 顺序给出各通道的值，sample_rate 为采样率
+    # 解析、存储、显示、导出都按此处的顺序和类型处理，不再假定固定的三个字段
+    def __init__(self, channels, sample_rate):
+        self.channels = tuple(Channel(*channel) for channel in channels)
+        self.sample_rate = sample_rate
+        self.names = tuple(channel.name for channel in self.channels)
+        self.leads = tuple(i for i, channel in enumerate(self.channels) if channel.kind == 'ecg')
+        self.resp = next((i for i, channel in enumerate(self.channels) if channel.kind == 'resp'), None)
+        self.bpm = next((i for i, channel in enumerate(self.channels) if channel.kind == 'bpm'), None)
+        # 需要滤波的通道（心电导联与呼吸），滤波结果按此顺序排列
+        self.filtered = tuple(i for i, channel in enumerate(self.channels) if channel.kind in FILTERED_KINDS)
+        self.filtered_names = tuple(self.names[i] + FILTERED_SUFFIX for i in self.filtered)
+        if not self.leads:
+            raise ValueError("通道声明中至少需要一个心电导联")
+        lead_names = [self.names[i] for i in self.leads]
+        self.primary = self.leads[lead_names.index(PREFERRED_LEAD)] if PREFERRED_LEAD in lead_names else self.leads[0]
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __repr__(self):
+        return f"ChannelSchema({list(self.names)}, {self.sample_rate})"
+
+    @property
+    def primary_name(self):
+        return self.names[self.primary]
+
+    @property
+    def resp_name(self):
+        return self.names[self.resp] if self.resp is not None else None
+
+    # 存储和录制中的全部通道：原始通道在前，滤波后的通道在后
+    @property
+    def storage_names(self):
+        return self.names + self.filtered_names
+
+    # 二进制帧只支持 [导联..., 呼吸, 心率] 的排列，返回导联数；其他排列返回 None
+    @property
+    def binary_leads(self):
+        n = len(self.leads)
+        if self.leads == tuple(range(n)) and self.resp == n and self.bpm == n + 1 and len(self) == n + 2:
+            return n
+        return None
+
+    def with_sample_rate(self, sample_rate):
+        return ChannelSchema(self.channels, sample_rate)
+
+
+def lead_schema(leads, sample_rate):
+    return ChannelSchema([(name, 'ecg') for name in leads] + [('Respiration', 'resp'), ('BPM', 'bpm')], sample_rate)
+
+
+DEFAULT_SCHEMA = ChannelSchema((('ECG', 'ecg'), ('Respiration', 'resp'), ('BPM', 'bpm')), 250)
+SCHEMAS = {
+    'default': DEFAULT_SCHEMA,
+    '8lead': lead_schema(LEADS_8, 500),
+    '12lead': lead_schema(LEADS_12, 500),
+}
+
+
+def _infer_kind(name):
+    if name == 'Respiration':
+        return 'resp'
+    if name == 'BPM':
+        return 'bpm'
+    return 'ecg'
+
+
+# 录制、归档、导出数据只保存了通道名，按名称推断类型；滤波通道和辅助列不计入
+def infer_schema(names, sample_rate=None):
+    names = [name for name in names if name not in ('timestamp', 'Beat') and not name.endswith(FILTERED_SUFFIX)]
+    return ChannelSchema([(name, _infer_kind(name)) for name in names], sample_rate)
+
+
+# 数据源（存储、快照、录制、归档）或 select_range 结果的通道声明
+def schema_of(source):
+    schema = getattr(source, 'schema', None)
+    if schema is not None:
+        return schema
+    names = getattr(source, 'channels', None)
+    if names is None:
+        names = list(source)
+    return infer_schema(names, getattr(source, 'sample_rate', None))
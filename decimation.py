@@ -0,0 +1,31 @@
+import numpy as np
+
+
+# 每像素最小/最大值包络抽稀：把 y[start:end] 压缩到约 2*n_pixels 个点
+# 每个桶保留最小值和最大值（按原始先后顺序），R波峰不会被抽掉
+def minmax_decimate(y, start, end, n_pixels):
+    start = max(0, start)
+    end = min(len(y), end)
+    count = end - start
+    n_pixels = max(1, int(n_pixels))
+    if count <= 2 * n_pixels:
+        indices = np.arange(start, end)
+        return indices, y[start:end]
+
+    bucket = count // n_pixels
+    n_full = count // bucket
+    segments = y[start:start + n_full * bucket].reshape(n_full, bucket)
+    imin = segments.argmin(axis=1)
+    imax = segments.argmax(axis=1)
+    base = start + np.arange(n_full) * bucket
+    indices = np.column_stack((base + np.minimum(imin, imax),
+                               base + np.maximum(imin, imax))).ravel()
+
+    # 末尾不足一个桶的部分单独取最小/最大值
+    tail_start = start + n_full * bucket
+    if tail_start < end:
+        tail = y[tail_start:end]
+        tail_indices = tail_start + np.sort([tail.argmin(), tail.argmax()])
+        indices = np.concatenate((indices, tail_indices))
+
+    return indices, y[indices]
@@ -0,0 +1,253 @@
+import json
+import lzma
+import mmap
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+import os
+import numpy as np
+from event_index import EventIndex, parse_event, load_events, append_events
+
+# 长期归档格式（.ecgz），单个文件：
+#   文件头 MAGIC
+#   数据块 × N    每块为一段连续样本，独立压缩，可单独解压
+#   块索引        每块一项 (文件偏移, 压缩长度, 样本数, 首/末时间戳)
+#   R波           压缩的 int64 微秒时间（与样本时间戳相同的量化，读出后可精确定位到样本）
+#                 + float64 RR间期 + float64 心率，与录制格式的R波文件一致
+#   元数据JSON    采样率、通道、量化系数、压缩方式、各部分位置、事件（报警、数据中断、标记）
+#   文件尾        元数据偏移 + 长度 + MAGIC
+# 块内：时间戳量化为整数微秒、各通道按 ARCHIVE_SCALES 量化为int32，均做一阶差分，
+# 再按字节平面重排（相邻样本的高位字节几乎全为0），最后整体压缩
+MAGIC = b'ECGARC01'
+TRAILER = struct.Struct('<QI8s')
+# 每块样本数，250Hz下约10秒；打开任意10秒窗口最多解压两块
+BLOCK_SAMPLES = 2500
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+# 各通道的量化系数（值 × 系数后取整）；ECG、呼吸与二进制协议的分辨率一致
+ARCHIVE_SCALES = {'ECG': 1000.0, 'Respiration': 1000.0, 'BPM': 100.0,
+                  'ECG_filtered': 1000.0, 'Respiration_filtered': 1000.0}
+DEFAULT_SCALE = 1000.0
+TIME_SCALE = 1e6
+# 量化后表示缺失值（NaN）的整数
+MISSING = np.iinfo(np.int32).min
+BLOCK_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u4'), ('count', '<u4'),
+                        ('first', '<f8'), ('last', '<f8')])
+BEAT_COLUMNS = ('timestamp', 'RR', 'BPM')
+# 最近解压的块缓存数量，缩放、平移同一区域时不必重复解压
+BLOCK_CACHE = 16
+# 归档写成后不再修改，回看时添加的标记存到同名的旁路文件中
+EVENTS_SUFFIX = '_events.jsonl'
+
+
+def _shuffle(values):
+    # (n,) 整数数组 -> 按字节平面排列的字节串
+    return np.ascontiguousarray(values.view(np.uint8).reshape(len(values), values.itemsize).T).tobytes()
+
+
+def _unshuffle(buffer, dtype, count):
+    planes = np.frombuffer(buffer, dtype=np.uint8).reshape(np.dtype(dtype).itemsize, count)
+    return np.ascontiguousarray(planes.T).view(dtype).ravel()
+
+
+def quantize(values, scale):
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    quantized = np.round(np.where(missing, 0.0, values) * scale)
+    quantized = np.clip(quantized, MISSING + 1, np.iinfo(np.int32).max).astype(np.int32)
+    quantized[missing] = MISSING
+    return quantized
+
+
+def dequantize(quantized, scale):
+    values = quantized / scale
+    values[quantized == MISSING] = np.nan
+    return values
+
+
+def encode_block(timestamps, columns, scales, compress):
+    ticks = np.round(np.asarray(timestamps) * TIME_SCALE).astype(np.int64)
+    parts = [_shuffle(np.diff(ticks, prepend=np.int64(0)))]
+    for column, scale in zip(columns, scales):
+        # int32 差分按模 2^32 回绕，解码时 cumsum 同样回绕，结果精确
+        quantized = quantize(column, scale)
+        parts.append(_shuffle(np.diff(quantized, prepend=np.int32(0))))
+    return compress(b''.join(parts))
+
+
+def decode_block(payload, count, scales, decompress):
+    raw = decompress(payload)
+    timestamps = np.cumsum(_unshuffle(raw[:count * 8], np.int64, count)) / TIME_SCALE
+    columns = []
+    offset = count * 8
+    for scale in scales:
+        deltas = _unshuffle(raw[offset:offset + count * 4], np.int32, count)
+        columns.append(dequantize(np.cumsum(deltas, dtype=np.int32), scale))
+        offset += count * 4
+    return timestamps, columns
+
+
+# 把 select_range 得到的数据写成归档
+# progress(已写样本数, 总数) 每写完一块调用一次，可在其中抛出异常中止写入；events 为范围内的事件
+# beats 为数据源 beats_in_range 的结果，原样保存R波的RR和心率（跨数据中断的RR、范围内第一个R波的RR都保留）；
+# 未提供时退回按 data 中的 Beat 列取R波时间，RR由相邻R波时间差得到
+def write_archive(file_path, data, progress=None, codec='zlib', sample_rate=None, block_samples=BLOCK_SAMPLES,
+                  events=(), beats=None):
+    compress = CODECS[codec][0]
+    timestamps = np.asarray(data['timestamp'], dtype=float)
+    channels = tuple(name for name in data if name not in ('timestamp', 'Beat'))
+    scales = [ARCHIVE_SCALES.get(name, DEFAULT_SCALE) for name in channels]
+    total = len(timestamps)
+    if sample_rate is None:
+        duration = timestamps[-1] - timestamps[0] if total > 1 else 0
+        sample_rate = (total - 1) / duration if duration > 0 else 0
+
+    index = np.zeros((total + block_samples - 1) // block_samples, dtype=BLOCK_DTYPE)
+    with open(file_path, 'wb') as f:
+        f.write(MAGIC)
+        for i, start in enumerate(range(0, total, block_samples)):
+            end = min(start + block_samples, total)
+            payload = encode_block(timestamps[start:end], [data[name][start:end] for name in channels],
+                                   scales, compress)
+            index[i] = (f.tell(), len(payload), end - start, timestamps[start], timestamps[end - 1])
+            f.write(payload)
+            if progress is not None:
+                progress(end, total)
+
+        index_offset = f.tell()
+        f.write(index.tobytes())
+        if beats is not None:
+            beat_times = np.asarray(beats['timestamp'], dtype=float)
+            inside = ((beat_times >= timestamps[0]) & (beat_times <= timestamps[-1]) if total
+                      else np.zeros(len(beat_times), dtype=bool))
+            beat_times, rr, bpm = (np.asarray(beats[name], dtype=float)[inside] for name in BEAT_COLUMNS)
+        else:
+            beat_times = timestamps[np.asarray(data['Beat'], dtype=bool)] if 'Beat' in data else np.empty(0)
+            rr = np.diff(beat_times, prepend=np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bpm = 60.0 / rr
+        beat_block = zlib.compress(np.round(beat_times * TIME_SCALE).astype('<i8').tobytes()
+                                   + rr.astype('<f8').tobytes() + bpm.astype('<f8').tobytes())
+        beats_offset = f.tell()
+        f.write(beat_block)
+
+        metadata = json.dumps({
+            'sample_rate': float(sample_rate), 'channels': list(channels), 'scales': scales, 'codec': codec,
+            'blocks': len(index), 'samples': total, 'index_offset': index_offset,
+            'beats_offset': beats_offset, 'beats_size': len(beat_block), 'beat_count': len(beat_times),
+            'beat_columns': list(BEAT_COLUMNS),
+            'events': [event._asdict() for event in events],
+        }, ensure_ascii=False).encode('utf-8')
+        metadata_offset = f.tell()
+        f.write(metadata)
+        f.write(TRAILER.pack(metadata_offset, len(metadata), MAGIC))
+
+
+class ECGArchive:
+    # 以内存映射方式打开归档，对外提供与 ECGDataStore / ECGRecording 相同的读取接口
+    # slice_range 只解压与时间范围重叠的块
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._map)
+        if size < len(MAGIC) + TRAILER.size or self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"不是有效的心电归档文件: {path}")
+        metadata_offset, metadata_size, magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f"归档文件不完整: {path}")
+        metadata = json.loads(self._map[metadata_offset:metadata_offset + metadata_size].decode('utf-8'))
+
+        self.sample_rate = metadata['sample_rate']
+        self.channels = tuple(metadata['channels'])
+        self.scales = metadata['scales']
+        self._decompress = CODECS[metadata['codec']][1]
+        index_offset = metadata['index_offset']
+        self.index = np.frombuffer(self._map[index_offset:index_offset + metadata['blocks'] * BLOCK_DTYPE.itemsize],
+                                   dtype=BLOCK_DTYPE)
+        self._size = metadata['samples']
+        self.pyramid = None
+        self.events_path = os.path.splitext(path)[0] + EVENTS_SUFFIX
+        self.events = EventIndex([parse_event(record) for record in metadata.get('events', [])]
+                                 + load_events(self.events_path))
+
+        beats_offset = metadata['beats_offset']
+        beats = zlib.decompress(self._map[beats_offset:beats_offset + metadata['beats_size']])
+        count = metadata['beat_count']
+        beat_times = np.frombuffer(beats[:count * 8], dtype='<i8') / TIME_SCALE
+        if 'beat_columns' in metadata:
+            rr = np.frombuffer(beats[count * 8:count * 16], dtype='<f8')
+            bpm = np.frombuffer(beats[count * 16:count * 24], dtype='<f8')
+        else:
+            # 旧版归档只保存了R波时间
+            rr = np.diff(beat_times, prepend=np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bpm = 60.0 / rr
+        self.beats = {'timestamp': beat_times, 'RR': rr, 'BPM': bpm}
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    @property
+    def first_timestamp(self):
+        return float(self.index['first'][0]) if len(self.index) else None
+
+    @property
+    def last_timestamp(self):
+        return float(self.index['last'][-1]) if len(self.index) else None
+
+    def _block(self, i):
+        with self._cache_lock:
+            block = self._cache.get(i)
+            if block is not None:
+                self._cache.move_to_end(i)
+                return block
+        offset, size, count = (int(x) for x in self.index[['offset', 'size', 'count']][i])
+        block = decode_block(self._map[offset:offset + size], count, self.scales, self._decompress)
+        # 缓存的块会以切片形式返回给多个调用者，设为只读
+        for array in (block[0], *block[1]):
+            array.flags.writeable = False
+        with self._cache_lock:
+            self._cache[i] = block
+            if len(self._cache) > BLOCK_CACHE:
+                self._cache.popitem(last=False)
+        return block
+
+    def slice_range(self, start, end):
+        lo = int(np.searchsorted(self.index['last'], start, side='left'))
+        hi = int(np.searchsorted(self.index['first'], end, side='right'))
+        blocks = [self._block(i) for i in range(lo, hi)]
+        if not blocks:
+            return {name: np.empty(0) for name in ('timestamp',) + self.channels}
+        if len(blocks) == 1:
+            timestamps, columns = blocks[0]
+        else:
+            timestamps = np.concatenate([block[0] for block in blocks])
+            columns = [np.concatenate([block[1][i] for block in blocks]) for i in range(len(self.channels))]
+        first = int(np.searchsorted(timestamps, start, side='left'))
+        last = int(np.searchsorted(timestamps, end, side='right'))
+        data = {'timestamp': timestamps[first:last]}
+        data.update((name, column[first:last]) for name, column in zip(self.channels, columns))
+        return data
+
+    def append_event(self, event):
+        event = self.events.add(event)
+        append_events(self.events_path, [event])
+
+    def beats_in_range(self, start, end):
+        timestamps = self.beats['timestamp']
+        lo = int(np.searchsorted(timestamps, start, side='left'))
+        hi = int(np.searchsorted(timestamps, end, side='right'))
+        return {name: self.beats[name][lo:hi] for name in BEAT_COLUMNS}
@@ -0,0 +1,144 @@
+import argparse
+import glob
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from ecg_recording import ECGRecording
+from ecg_archive import ECGArchive
+from ecg_store import select_range
+from export_pipeline import export_data, EXPORTERS
+from hrv_stats import summarize_range
+from event_index import query_events
+from plot_utils import ECGPlotter
+
+# 无界面批处理：对录制目录按时间范围导出数据并渲染图像
+PLOT_FORMATS = ('png', 'pdf')
+DATA_FORMATS = tuple(extension.lstrip('.') for extension in EXPORTERS)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
+plt.rcParams['axes.unicode_minus'] = False
+
+
+# 输入可以是单个录制目录或归档文件，也可以是包含录制目录的任意上级目录
+# （如实时界面的 recordings/<会话>/<设备>），逐层查找含 segment_00000.ecgrec 的目录
+def find_recordings(paths):
+    recordings = []
+    for path in paths:
+        if path.lower().endswith('.ecgz') or glob.glob(os.path.join(path, 'segment_*.ecgrec')):
+            recordings.append(path)
+        else:
+            recordings.extend(sorted(directory for directory, _, files in os.walk(path)
+                                     if 'segment_00000.ecgrec' in files))
+    return recordings
+
+
+# 输出文件名前缀：默认取录制目录名（归档去掉扩展名）；不同会话下的同名设备（如 sessA/COM3 与 sessB/COM3）
+# 并行处理时会互相覆盖，重名的逐级加上上级目录名直到互不相同
+def output_names(paths):
+    parts = {}
+    for path in paths:
+        components = [part for part in os.path.abspath(path).split(os.sep) if part]
+        if path.lower().endswith('.ecgz'):
+            components[-1] = os.path.splitext(components[-1])[0]
+        parts[path] = components
+    depth = dict.fromkeys(paths, 1)
+    while True:
+        names = {path: '_'.join(parts[path][-depth[path]:]) for path in paths}
+        counts = Counter(names.values())
+        clashes = [path for path in paths if counts[names[path]] > 1 and depth[path] < len(parts[path])]
+        if not clashes:
+            return names
+        for path in clashes:
+            depth[path] += 1
+
+
+def parse_time(value):
+    return datetime.strptime(value, TIME_FORMAT).timestamp()
+
+
+def process_recording(path, ranges, formats, output_dir, name=None):
+    recording = ECGArchive(path) if path.lower().endswith('.ecgz') else ECGRecording(path)
+    if not recording:
+        return path, []
+    if not ranges:
+        ranges = [(recording.first_timestamp, recording.last_timestamp)]
+
+    if name is None:
+        name = output_names([path])[path]
+    outputs = []
+    for start, end in ranges:
+        data = select_range(recording, min(start, end), max(start, end))
+        if not len(data['timestamp']):
+            continue
+        stem = os.path.join(output_dir, "{}_{}_{}".format(
+            name,
+            datetime.fromtimestamp(start).strftime("%Y%m%d_%H%M%S"),
+            datetime.fromtimestamp(end).strftime("%Y%m%d_%H%M%S")))
+
+        summary = None
+        for fmt in formats:
+            file_path = f"{stem}.{fmt}"
+            if fmt in PLOT_FORMATS:
+                fig, _ = ECGPlotter.build_figure(data)
+                FigureCanvasAgg(fig)
+                # 与 ECGPlotter.save_figure 相同的输出参数
+                fig.savefig(file_path, dpi=300, bbox_inches='tight')
+            else:
+                if summary is None:
+                    summary = summarize_range(recording, data)
+                    events, _ = query_events(recording, data['timestamp'][0], data['timestamp'][-1])
+                    beats = recording.beats_in_range(data['timestamp'][0], data['timestamp'][-1])
+                export_data(file_path, data, summary=summary, events=events, beats=beats)
+            outputs.append(file_path)
+    return path, outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="心电记录批量导出与绘图")
+    parser.add_argument('inputs', nargs='+', help="录制目录、归档文件(.ecgz)，或包含多个录制目录的父目录")
+    parser.add_argument('-r', '--range', nargs=2, action='append', default=[], metavar=('START', 'END'),
+                        help=f"时间范围（{TIME_FORMAT.replace('%', '%%')}），可重复指定；缺省为整段记录")
+    parser.add_argument('-f', '--format', action='append', choices=DATA_FORMATS + PLOT_FORMATS,
+                        help="输出格式，可重复指定；缺省为 xlsx 和 png")
+    parser.add_argument('-o', '--output-dir', default='.', help="输出目录")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="并行进程数")
+    args = parser.parse_args(argv)
+
+    try:
+        ranges = [(parse_time(start), parse_time(end)) for start, end in args.range]
+    except ValueError as e:
+        parser.error(f"时间格式错误: {e}")
+    formats = args.format or ['xlsx', 'png']
+
+    # 同一录制被多个输入重复包含时只处理一次
+    recordings = list(dict.fromkeys(find_recordings(args.inputs)))
+    if not recordings:
+        parser.error("未找到心电记录")
+    names = output_names(recordings)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(process_recording, path, ranges, formats, args.output_dir, names[path]): path
+                   for path in recordings}
+        for future in as_completed(futures):
+            try:
+                path, outputs = future.result()
+                print(f"{path}: 已生成 {len(outputs)} 个文件")
+            except Exception as e:
+                failed += 1
+                print(f"{futures[future]}: 处理失败: {e}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from acquisition import AcquisitionPipeline
+from alarm_engine import NullBackend
+from ecg_store import ECGDataStore, select_range
+from export_pipeline import export_data
+from plot_utils import ECGPlotter
+from sample_sources import SyntheticECGSource, format_lines
+from channel_schema import DEFAULT_SCHEMA, SCHEMAS
+
+# 无界面基准测试：合成数据驱动采集、筛选、导出、绘图各条路径，结果写入JSON便于版本间对比
+SAMPLE_RATE = 250
+FRAME_SAMPLES = 25
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {f"p{p}_ms": float(np.percentile(latencies, p)) for p in (50, 90, 99)} | {
+        'max_ms': float(latencies.max())}
+
+
+# 先不加跟踪计时，再在 tracemalloc 下重跑一遍取峰值内存（跟踪本身会显著拖慢Python代码）
+def measure(function, *args, trace_memory=True):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def build_store(n_samples):
+    source = SyntheticECGSource(SAMPLE_RATE, seed=0)
+    store = ECGDataStore()
+    start = datetime(2024, 1, 1).timestamp()
+    for offset in range(0, n_samples, 1000000):
+        count = min(1000000, n_samples - offset)
+        values = source.generate(offset, count)
+        store.append(start + (offset + np.arange(count)) / SAMPLE_RATE, values)
+    return store
+
+
+def bench_ingest(n_samples, schema=DEFAULT_SCHEMA, trace_memory=True):
+    # 驱动真实的 AcquisitionPipeline（合成来源 + 临时录制目录）：文本解析后由 ingest 完成
+    # 滤波、存储、写盘、R波检测、滚动统计和报警提交，计时包含等待写盘线程写完
+    # schema 决定导联数和采样率，多导联时 channel_samples_per_s 为全部通道合计的吞吐
+    sample_rate = schema.sample_rate
+    frame_samples = FRAME_SAMPLES * sample_rate // SAMPLE_RATE
+    values = SyntheticECGSource(sample_rate, seed=0, schema=schema).generate(0, n_samples)
+    chunks = [format_lines(values[i:i + frame_samples]) for i in range(0, n_samples, frame_samples)]
+    port = f"synthetic:{sample_rate}:0.02:{len(schema.leads)}"
+
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            pipeline = AcquisitionPipeline(port, sample_rate, directory, schema=schema)
+            # 报警只做判断，不蜂鸣、不打印
+            pipeline.alarm_engine.backends = [NullBackend()]
+            pipeline.recorder.start()
+            pipeline.alarm_engine.start()
+            latencies = []
+            clock = datetime(2024, 1, 1).timestamp()
+            for chunk in chunks:
+                clock += frame_samples / sample_rate
+                start = time.perf_counter()
+                pipeline.reader.feed(chunk, clock)
+                latencies.append(time.perf_counter() - start)
+                pipeline.reader.drain()
+            pipeline.stop()
+        return pipeline.store, latencies
+
+    (store, latencies), elapsed, peak = measure(run, trace_memory=trace_memory)
+    return {'schema': list(schema.names), 'sample_rate': sample_rate, 'samples': n_samples,
+            'samples_per_s': n_samples / elapsed, 'channel_samples_per_s': n_samples * len(schema) / elapsed,
+            'batch_latency': percentiles(latencies),
+            'peak_memory_bytes': peak, 'store_bytes': store.nbytes}
+
+
+def bench_filter(store, repeats=50, trace_memory=True):
+    # ECGExportWindow.get_filtered_data 的核心：按时间范围二分切片
+    first, last = store.first_timestamp, store.last_timestamp
+
+    def run():
+        rng = np.random.default_rng(0)
+        latencies = []
+        for _ in range(repeats):
+            start, end = np.sort(rng.uniform(first, last, 2))
+            t = time.perf_counter()
+            select_range(store, start, end)
+            latencies.append(time.perf_counter() - t)
+        return latencies
+
+    latencies, _, peak = measure(run, trace_memory=trace_memory)
+    return {'samples': len(store), 'latency': percentiles(latencies), 'peak_memory_bytes': peak}
+
+
+def bench_export(store, fmt, directory, trace_memory=True):
+    data = select_range(store, store.first_timestamp, store.last_timestamp)
+    path = os.path.join(directory, f"bench.{fmt}")
+    _, elapsed, peak = measure(export_data, path, data, trace_memory=trace_memory)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {'samples': len(store), 'format': fmt, 'seconds': elapsed, 'rows_per_s': len(store) / elapsed,
+            'file_bytes': size, 'peak_memory_bytes': peak}
+
+
+def bench_plot(store, trace_memory=True):
+    # ECGPlotter.create_plot_window 的绘图部分：建图 + 抽稀 + Agg渲染
+    data = select_range(store, store.first_timestamp, store.last_timestamp)
+
+    def run():
+        fig, _ = ECGPlotter.build_figure(data, store.pyramid)
+        FigureCanvasAgg(fig).draw()
+
+    _, elapsed, peak = measure(run, trace_memory=trace_memory)
+    return {'samples': len(store), 'seconds': elapsed, 'peak_memory_bytes': peak}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="心电数据处理基准测试")
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1000000, 10000000],
+                        help="筛选/绘图使用的样本数")
+    parser.add_argument('--ingest-samples', type=int, default=250 * 600, help="采集基准的样本数")
+    parser.add_argument('--schema', action='append', choices=sorted(SCHEMAS),
+                        help="采集基准使用的通道声明，可重复指定；缺省为 default")
+    parser.add_argument('--export-samples', type=int, default=200000, help="导出基准的样本数")
+    parser.add_argument('-f', '--format', action='append', choices=('csv', 'parquet', 'xlsx'),
+                        help="导出格式，可重复指定；缺省为全部")
+    parser.add_argument('--no-memory', action='store_true', help="跳过 tracemalloc 峰值内存测量（每项只运行一次）")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="结果JSON文件")
+    args = parser.parse_args(argv)
+    # 无中文字体的环境下忽略缺字警告，不影响计时
+    warnings.filterwarnings('ignore', message='Glyph .* missing from font')
+    trace_memory = not args.no_memory
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'platform': platform.platform(),
+        'ingest': [], 'filter': [], 'export': [], 'plot': []
+    }
+
+    for name in args.schema or ['default']:
+        print(f"采集: {args.ingest_samples} 样本 ({name})")
+        results['ingest'].append(bench_ingest(args.ingest_samples, SCHEMAS[name], trace_memory=trace_memory))
+
+    for size in args.sizes:
+        print(f"筛选/绘图: {size} 样本")
+        store = build_store(size)
+        results['filter'].append(bench_filter(store, trace_memory=trace_memory))
+        results['plot'].append(bench_plot(store, trace_memory=trace_memory))
+        del store
+
+    store = build_store(args.export_samples)
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in args.format or ['csv', 'parquet', 'xlsx']:
+            print(f"导出: {args.export_samples} 样本 -> {fmt}")
+            results['export'].append(bench_export(store, fmt, directory, trace_memory=trace_memory))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,24 +1,57 @@
 from tkinter import Tk, Frame, Label, Button, StringVar, ttk, messagebox, Toplevel
-from pandas.core.frame import console
-import tkcalendar
+import math
+import threading
 import numpy as np
-import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from plot_utils import ECGPlotter
+from ecg_store import ECGDataStore, StoreSnapshot, select_range
+from ecg_recording import ECGRecording
+from ecg_archive import ECGArchive
+from export_pipeline import export_data, ExportCancelled
+from hrv_stats import summarize_range
+from event_index import Annotation, EVENT_KINDS, KIND_NAMES, query_events
+
+# 筛选、绘图、导出在后台线程池中执行，界面线程按此间隔（毫秒）轮询结果
+WORKER_THREADS = 2
+POLL_INTERVAL = 100
+# 事件列表的类型筛选；列表最多显示的条数（R波可能有十几万条）；跳转时显示事件前后的秒数
+EVENT_FILTERS = (('全部事件', EVENT_KINDS), ('报警', ('alarm',)), ('数据中断', ('dropout',)),
+                 ('标记', ('marker',)), ('R波', ('beat',)))
+EVENT_LIST_LIMIT = 2000
+JUMP_SECONDS = 10
+_worker_pool = None
+
+
+def worker_pool():
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix='ecg-export')
+    return _worker_pool
+
 
 class ECGExportWindow:
-    def __init__(self, runtime_data):
+    # master 为已有的Tk窗口时作为非模态子窗口共用其事件循环；否则自建 Tk() 并进入 mainloop
+    def __init__(self, runtime_data, master=None):
+        # 多台设备时传入 {设备名: 存储}，界面上可切换设备
+        self.sources = runtime_data if isinstance(runtime_data, dict) else {}
+        if self.sources:
+            runtime_data = next(iter(self.sources.values()))
+        elif isinstance(runtime_data, dict):
+            runtime_data = None
         self.runtime_data = runtime_data
         self.start_timestamp = None
         self.end_timestamp = None
+        self.export_future = None
+        self.export_cancel_event = None
+        self.closed = False
         
         # 新增时间戳初始化逻辑
         if runtime_data:
             try:
-                # 提取所有时间戳并转换为datetime对象
-                timestamps = [datetime.fromtimestamp(float(ts)) for ts in runtime_data.keys()]
-                self.start_timestamp = min(timestamps).strftime("%Y-%m-%d %H:%M:%S")
-                self.end_timestamp = max(timestamps).strftime("%Y-%m-%d %H:%M:%S")
+                # 时间戳有序，首尾即为最小/最大值
+                self.start_timestamp = datetime.fromtimestamp(runtime_data.first_timestamp).strftime("%Y-%m-%d %H:%M:%S")
+                self.end_timestamp = datetime.fromtimestamp(runtime_data.last_timestamp).strftime("%Y-%m-%d %H:%M:%S")
             except ValueError as e:
                 messagebox.showerror("错误", f"时间戳格式错误: {str(e)}")
                 # 设置默认时间戳为当前时间
@@ -32,14 +65,16 @@ class ECGExportWindow:
             self.start_timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
             self.end_timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
         
-        self.setup_window()
+        self.setup_window(master)
         self.setup_ui()
-        self.window.mainloop()
+        if master is None:
+            self.window.mainloop()
 
-    def setup_window(self):
-        self.window = Tk()
+    def setup_window(self, master=None):
+        self.window = Toplevel(master) if master is not None else Tk()
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
         self.window.title("心电图数据导出")
-        self.window.geometry("1200x200")
+        self.window.geometry("1200x480")
         self.window.configure(bg="#f0f0f0")
 
     def setup_ui(self):
@@ -55,10 +90,38 @@ class ECGExportWindow:
         self.horizontal_frame = Frame(self.content_frame, bg="#f0f0f0")
         self.horizontal_frame.pack(side="top", fill="x", padx=20)
         
+        if len(self.sources) > 1:
+            self.setup_device_selection()
         self.setup_date_selection()
         self.setup_plot_frame()
         self.setup_status_bar()
         self.setup_buttons()
+        self.setup_event_list()
+
+    def setup_device_selection(self):
+        device_frame = Frame(self.horizontal_frame, bg="#f0f0f0")
+        device_frame.pack(side="left", padx=(0, 10))
+        
+        Label(device_frame, text="设备:", font=("Microsoft YaHei", 10), bg="#f0f0f0").pack(side="left", padx=5)
+        self.device_var = StringVar(value=next(iter(self.sources)))
+        device_box = ttk.Combobox(device_frame, values=list(self.sources), textvariable=self.device_var,
+                                  width=10, state="readonly", font=("Microsoft YaHei", 10))
+        device_box.pack(side="left", padx=5)
+        device_box.bind("<<ComboboxSelected>>", lambda event: self.select_device(self.device_var.get()))
+
+    def select_device(self, name):
+        source = self.sources[name]
+        if not source:
+            messagebox.showwarning("警告", f"设备 {name} 没有可用的数据")
+            return
+        self.runtime_data = source
+        self.reset_time_range(source)
+        self.refresh_events()
+        self.status_var.set(f"已切换到设备: {name}（{len(source)} 条数据）")
+
+    def reset_time_range(self, source):
+        self.start_datetime_var.set(datetime.fromtimestamp(source.first_timestamp).strftime("%Y-%m-%d %H:%M:%S"))
+        self.end_datetime_var.set(datetime.fromtimestamp(source.last_timestamp).strftime("%Y-%m-%d %H:%M:%S"))
 
     def setup_date_selection(self):
         # 创建日期选择器框架
@@ -133,7 +196,8 @@ class ECGExportWindow:
             "%Y-%m-%d %H:%M:%S"
         )
         
-        # 创建日历选择器
+        # 创建日历选择器（tkcalendar 只在打开选择器时加载）
+        import tkcalendar
         cal = tkcalendar.Calendar(
             picker, selectmode='day',
             year=current_datetime.year,
@@ -219,6 +283,13 @@ class ECGExportWindow:
         status_label = Label(status_frame, textvariable=self.status_var,
                             font=("Microsoft YaHei", 9), bg="#f0f0f0", anchor="w")
         status_label.pack(side="left")
+        
+        # 导出进度条与取消按钮
+        self.cancel_button = Button(status_frame, text="取消导出", command=self.cancel_export,
+                                    state="disabled", font=("Microsoft YaHei", 9))
+        self.cancel_button.pack(side="right", padx=5)
+        self.progress_bar = ttk.Progressbar(status_frame, length=300, mode="determinate")
+        self.progress_bar.pack(side="right", padx=5)
 
     def setup_buttons(self):
         # 创建按钮框架
@@ -228,7 +299,9 @@ class ECGExportWindow:
         # 创建按钮
         buttons = [
             ("绘制图像", self.plot_data, "#007bff"),
-            ("导出Excel", self.export_to_excel, "#28a745")
+            ("导出数据", self.export_to_excel, "#28a745"),
+            ("打开记录", self.open_recording, "#6c757d"),
+            ("打开归档", self.open_archive, "#6c757d")
         ]
         
         for text, command, bg_color in buttons:
@@ -244,160 +317,330 @@ class ECGExportWindow:
             )
             btn.pack(side="left", padx=5)
 
-    def plot_data(self):
+    def open_recording(self):
+        from tkinter import filedialog
+        directory = filedialog.askdirectory(title="选择心电记录目录")
+        if not directory:
+            return
         try:
-            # 获取用户输入的时间范围
-            start_datetime_str = self.start_datetime_var.get()
-            end_datetime_str = self.end_datetime_var.get()
-            print("start_datetime_str", start_datetime_str)
-            print("end_datetime_str", end_datetime_str)
-            
-            # 转换为datetime格式
-            print(f"原始开始时间字符串: {start_datetime_str}")
-            print(f"原始结束时间字符串: {end_datetime_str}")
-            
-            try:
-                start_time_obj = datetime.strptime(start_datetime_str, "%Y-%m-%d %H:%M:%S")
-                end_time_obj = datetime.strptime(end_datetime_str, "%Y-%m-%d %H:%M:%S")
-            except ValueError as e:
-                messagebox.showerror("格式错误", f"时间格式转换错误: {str(e)}\n请确保使用YYYY-MM-DD HH:MM:SS格式")
+            recording = ECGRecording(directory)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"打开记录失败: {str(e)}")
+            return
+        if not recording:
+            messagebox.showwarning("警告", "记录中没有数据")
+            return
+        
+        # 切换数据源为内存映射的记录，并把时间范围重置为整段记录
+        self.runtime_data = recording
+        self.reset_time_range(recording)
+        self.refresh_events()
+        self.status_var.set(f"已打开记录: {directory}（{len(recording)} 条数据）")
+
+    def open_archive(self):
+        from tkinter import filedialog
+        file_path = filedialog.askopenfilename(title="选择心电归档文件", filetypes=[("心电归档", "*.ecgz")])
+        if not file_path:
+            return
+        try:
+            archive = ECGArchive(file_path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"打开归档失败: {str(e)}")
+            return
+        if not archive:
+            messagebox.showwarning("警告", "归档中没有数据")
+            return
+
+        # 归档按块压缩，筛选、绘图时只解压所选时间范围内的块
+        self.runtime_data = archive
+        self.reset_time_range(archive)
+        self.refresh_events()
+        self.status_var.set(f"已打开归档: {file_path}（{len(archive)} 条数据）")
+
+    def setup_event_list(self):
+        event_frame = Frame(self.main_frame, bg="#f0f0f0")
+        event_frame.pack(fill="both", expand=True, pady=(10, 0))
+
+        toolbar = Frame(event_frame, bg="#f0f0f0")
+        toolbar.pack(side="top", fill="x", pady=(0, 5))
+        Label(toolbar, text="事件:", font=("Microsoft YaHei", 10), bg="#f0f0f0").pack(side="left", padx=5)
+        self.event_kind_var = StringVar(value=EVENT_FILTERS[0][0])
+        kind_box = ttk.Combobox(toolbar, values=[name for name, _ in EVENT_FILTERS], textvariable=self.event_kind_var,
+                                width=10, state="readonly", font=("Microsoft YaHei", 10))
+        kind_box.pack(side="left", padx=5)
+        kind_box.bind("<<ComboboxSelected>>", lambda event: self.refresh_events())
+
+        Label(toolbar, text="前后(秒):", font=("Microsoft YaHei", 10), bg="#f0f0f0").pack(side="left", padx=5)
+        self.jump_seconds_var = StringVar(value=str(JUMP_SECONDS))
+        ttk.Combobox(toolbar, values=["5", "10", "30", "60", "300"], textvariable=self.jump_seconds_var,
+                     width=5, font=("Microsoft YaHei", 10)).pack(side="left", padx=5)
+
+        for text, command in (("刷新", self.refresh_events), ("跳转绘图", self.jump_to_event),
+                              ("添加标记", self.add_marker)):
+            Button(toolbar, text=text, command=command, font=("Microsoft YaHei", 9)).pack(side="left", padx=5)
+
+        # 事件表：双击或“跳转绘图”显示所选事件前后的数据
+        columns = ("time", "kind", "label", "message")
+        self.event_tree = ttk.Treeview(event_frame, columns=columns, show="headings", height=8)
+        for column, heading, width in zip(columns, ("时间", "类型", "名称", "说明"), (190, 80, 180, 600)):
+            self.event_tree.heading(column, text=heading)
+            self.event_tree.column(column, width=width, anchor="w")
+        scrollbar = ttk.Scrollbar(event_frame, orient="vertical", command=self.event_tree.yview)
+        self.event_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.event_tree.pack(side="left", fill="both", expand=True)
+        self.event_tree.bind("<Double-1>", lambda event: self.jump_to_event())
+
+        self.listed_events = []
+        self.refresh_events()
+
+    # 列出当前数据源的全部事件：事件索引按时间排序，查询为二分查找，与记录时长无关
+    def refresh_events(self):
+        self.event_tree.delete(*self.event_tree.get_children())
+        self.listed_events = []
+        if not self.runtime_data:
+            return
+        kinds = dict(EVENT_FILTERS)[self.event_kind_var.get()]
+        events, truncated = query_events(self.runtime_data, -math.inf, math.inf, kinds, EVENT_LIST_LIMIT)
+        for i, event in enumerate(events):
+            time_text = datetime.fromtimestamp(event.timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+            self.event_tree.insert("", "end", iid=str(i),
+                                   values=(time_text, KIND_NAMES[event.kind], event.label, event.message))
+        self.listed_events = events
+        note = f"（只显示前 {EVENT_LIST_LIMIT} 条）" if truncated else ""
+        self.status_var.set(f"共 {len(events)} 个事件{note}")
+
+    def selected_event(self):
+        selection = self.event_tree.selection()
+        return self.listed_events[int(selection[0])] if selection else None
+
+    # 把时间范围设为所选事件前后 N 秒并绘图，只读取该范围内的数据
+    def jump_to_event(self):
+        event = self.selected_event()
+        if event is None:
+            messagebox.showinfo("提示", "请先在事件列表中选择一个事件")
+            return
+        try:
+            seconds = float(self.jump_seconds_var.get())
+        except ValueError:
+            messagebox.showerror("错误", "前后秒数必须是数字")
+            return
+        self.start_datetime_var.set(
+            datetime.fromtimestamp(math.floor(event.timestamp - seconds)).strftime("%Y-%m-%d %H:%M:%S"))
+        self.end_datetime_var.set(
+            datetime.fromtimestamp(math.ceil(event.timestamp + seconds)).strftime("%Y-%m-%d %H:%M:%S"))
+        self.plot_data(highlight=event.timestamp)
+
+    # 在所选事件处（未选择时在当前时间范围的中点）添加标记，随数据源持久保存
+    def add_marker(self):
+        source = self.runtime_data
+        if not source or not hasattr(source, "append_event"):
+            messagebox.showerror("错误", "当前数据源不支持添加标记")
+            return
+        event = self.selected_event()
+        if event is not None:
+            timestamp = event.timestamp
+        else:
+            time_range = self.read_time_range()
+            if time_range is None:
                 return
-            
-            # 读取数据
-            data_list = self.get_filtered_data(start_time_obj, end_time_obj)
-            
-            # 使用ECGPlotter创建图表窗口
-            plot_window, fig, ax = ECGPlotter.create_plot_window(self.window, data_list)
-            if plot_window:
-                self.status_var.set("已在新窗口中绘制图表")
-                
+            timestamp = (time_range[0].timestamp() + time_range[1].timestamp()) / 2
+        from tkinter import simpledialog
+        text = simpledialog.askstring(
+            "添加标记", f"{datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')} 处的标记说明:",
+            parent=self.window)
+        if text is None:
+            return
+        try:
+            source.append_event(Annotation(timestamp, "marker", "标记", text))
+        except OSError as e:
+            messagebox.showerror("错误", f"保存标记失败: {str(e)}")
+            return
+        self.refresh_events()
+        self.status_var.set("已添加标记")
+
+    def close(self):
+        self.closed = True
+        self.cancel_export()
+        self.window.destroy()
+
+    # 在后台线程池中执行 function(*args)，完成后在界面线程上调用 on_done(结果)
+    def run_in_background(self, function, on_done, *args):
+        future = worker_pool().submit(function, *args)
+        self.window.after(POLL_INTERVAL, self.poll_background, future, on_done)
+
+    def poll_background(self, future, on_done):
+        if self.closed:
+            return
+        if not future.done():
+            self.window.after(POLL_INTERVAL, self.poll_background, future, on_done)
+            return
+        try:
+            result = future.result()
         except Exception as e:
-            messagebox.showerror("错误", f"绘制图表时出错: {str(e)}")
+            messagebox.showerror("错误", f"处理数据时出错: {str(e)}")
             self.status_var.set(f"错误: {str(e)}")
+            return
+        on_done(result)
 
-    def get_filtered_data(self, start_time, end_time):
+    # 读取界面上的时间范围，格式错误时提示并返回 None
+    def read_time_range(self):
+        start_datetime_str = self.start_datetime_var.get()
+        end_datetime_str = self.end_datetime_var.get()
+        print(f"原始开始时间字符串: {start_datetime_str}")
+        print(f"原始结束时间字符串: {end_datetime_str}")
         try:
-            # 验证数据可用性
-            if not hasattr(self, 'runtime_data'):
-                messagebox.showerror("错误", "runtime_data属性不存在")
-                return []
-            if not self.runtime_data:
-                messagebox.showerror("错误", "没有可用的数据")
-                return []
-            if not isinstance(self.runtime_data, dict):
-                messagebox.showerror("错误", "数据格式错误：runtime_data必须是字典类型")
-                return []
-            
-            # 确保开始时间不晚于结束时间
-            if start_time > end_time:
-                start_time, end_time = end_time, start_time
-            
-            # 筛选指定时间范围内的数据
-            filtered_data = []
-            invalid_format_count = 0
-            missing_field_count = 0
-            print("start_time", start_time)
-            print("end_time", end_time)
-            for timestamp_str, data in self.runtime_data.items():
-                # 验证数据结构
-                if not isinstance(data, dict):
-                    continue
-                
-                if 'ECG' not in data:
-                    missing_field_count += 1
-                    continue
-                
-                try:
-                    # 将时间戳转换为datetime对象
-                    timestamp = float(timestamp_str)
-                    data_time = datetime.fromtimestamp(timestamp)
-                    
-                    if start_time <= data_time <= end_time:
-                        # 验证ECG数据
-                        if pd.isna(data['ECG']):
-                            continue
-                        # 构建标准格式的数据记录
-                        record = {
-                            'Time': data_time.strftime("%Y-%m-%d %H:%M:%S"),
-                            'ECG': data['ECG'],
-                            'Respiration': data.get('Respiration', None),
-                            'BPM': data.get('BPM', None)
-                        }
-                        filtered_data.append(record)
-                except ValueError:
-                    invalid_format_count += 1
-                    continue
-                except Exception as e:
-                    self.status_var.set(f"处理数据时出错: {str(e)}")
-                    continue
-            
-            # 设置状态信息
-            if not filtered_data:
-                error_msg = "未找到指定时间范围内的有效数据\n"
-                if invalid_format_count > 0:
-                    error_msg += f"发现 {invalid_format_count} 条时间格式错误的数据\n"
-                if missing_field_count > 0:
-                    error_msg += f"发现 {missing_field_count} 条缺少必要字段的数据"
-                messagebox.showwarning("警告", error_msg.strip())
-                self.status_var.set("筛选完成，但未找到有效数据")
-            else:
-                self.status_var.set(f"已找到 {len(filtered_data)} 条有效数据")
-            
-            return filtered_data
-            
-        except Exception as e:
-            error_msg = f"数据筛选失败: {str(e)}"
-            messagebox.showerror("错误", error_msg)
-            self.status_var.set(error_msg)
-            return []
-    
+            start_time_obj = datetime.strptime(start_datetime_str, "%Y-%m-%d %H:%M:%S")
+            end_time_obj = datetime.strptime(end_datetime_str, "%Y-%m-%d %H:%M:%S")
+        except ValueError as e:
+            messagebox.showerror("格式错误", f"时间格式转换错误: {str(e)}\n请确保使用YYYY-MM-DD HH:MM:SS格式")
+            return None
+        return start_time_obj, end_time_obj
+
+    # 在界面线程上检查数据源；实时存储取只读快照，后台处理期间采集照常进行
+    def snapshot_source(self):
+        if not self.runtime_data:
+            messagebox.showerror("错误", "没有可用的数据")
+            return None
+        if not isinstance(self.runtime_data, (ECGDataStore, StoreSnapshot, ECGRecording, ECGArchive)):
+            messagebox.showerror("错误", "数据格式错误：runtime_data必须是ECGDataStore、ECGRecording或ECGArchive类型")
+            return None
+        if isinstance(self.runtime_data, ECGDataStore):
+            return self.runtime_data.snapshot()
+        return self.runtime_data
+
+    # highlight 为要在图上标出的时间（从事件列表跳转时为事件时间）
+    def plot_data(self, highlight=None):
+        time_range = self.read_time_range()
+        source = self.snapshot_source() if time_range else None
+        if source is None:
+            return
+        self.status_var.set("正在筛选数据并绘图...")
+        self.run_in_background(self.build_plot, self.show_plot, source, *time_range, highlight)
+
+    # 后台线程：筛选数据并生成图表（只创建Figure，嵌入窗口仍在界面线程上进行）
+    def build_plot(self, source, start_time, end_time, highlight=None):
+        data_list = self.get_filtered_data(source, start_time, end_time)
+        if not len(data_list['timestamp']):
+            return data_list, None
+        figure = ECGPlotter.build_figure(data_list, getattr(source, 'pyramid', None))
+        if highlight is not None:
+            position = int(np.searchsorted(data_list['timestamp'], highlight))
+            for ax in figure[0].axes:
+                ax.axvline(position, color='#ff8c00', linewidth=1.5, alpha=0.8)
+        return data_list, figure
+
+    def show_plot(self, result):
+        data_list, figure = result
+        if not self.check_filtered_data(data_list):
+            return
+        if ECGPlotter.create_plot_window(self.window, data_list, figure=figure):
+            self.status_var.set("已在新窗口中绘制图表")
+
+    # 后台线程：时间戳天然有序，二分查找得到连续切片（不复制）
+    def get_filtered_data(self, source, start_time, end_time):
+        # 确保开始时间不晚于结束时间
+        if start_time > end_time:
+            start_time, end_time = end_time, start_time
+        return select_range(source, start_time.timestamp(), end_time.timestamp())
+
+    def check_filtered_data(self, data_list):
+        count = len(data_list['timestamp'])
+        if not count:
+            messagebox.showwarning("警告", "未找到指定时间范围内的有效数据")
+            self.status_var.set("筛选完成，但未找到有效数据")
+            return False
+        self.status_var.set(f"已找到 {count} 条有效数据")
+        return True
+
     def export_to_excel(self):
+        time_range = self.read_time_range()
+        source = self.snapshot_source() if time_range else None
+        if source is None:
+            return
+        self.status_var.set("正在筛选数据...")
+        self.run_in_background(self.get_filtered_data, lambda data_list: self.choose_export_file(source, data_list),
+                               source, *time_range)
+
+    def choose_export_file(self, source, data_list):
+        if not self.check_filtered_data(data_list):
+            return
+
+        # 设置默认文件名
+        default_filename = f"ECG数据_{self.start_datetime_var.get()}_{self.end_datetime_var.get()}.xlsx"
+
+        # 选择保存路径，按扩展名决定导出格式
+        from tkinter import filedialog
+        file_path = filedialog.asksaveasfilename(
+            parent=self.window,
+            defaultextension=".xlsx",
+            filetypes=[("Excel文件", "*.xlsx"), ("CSV文件", "*.csv"), ("Parquet文件", "*.parquet"),
+                       ("心电归档", "*.ecgz")],
+            initialfile=default_filename
+        )
+
+        if file_path:
+            self.start_export(file_path, source, data_list)
+
+    def start_export(self, file_path, source, data):
+        if self.export_future is not None and not self.export_future.done():
+            messagebox.showwarning("警告", "已有导出任务正在进行")
+            return
+        
+        # 在后台线程池中分块写出，界面线程只轮询进度
+        self.export_progress = (0, len(data['timestamp']))
+        self.export_result = None
+        self.export_cancel_event = threading.Event()
+        self.export_future = worker_pool().submit(self.run_export, file_path, source, data)
+        
+        self.progress_bar["value"] = 0
+        self.cancel_button.config(state="normal")
+        self.status_var.set(f"正在导出: {file_path}")
+        self.window.after(POLL_INTERVAL, self.poll_export)
+
+    def run_export(self, file_path, source, data):
+        def progress(done, total):
+            self.export_progress = (done, total)
         try:
-            # 获取用户输入的时间范围
-            start_datetime_str = self.start_datetime_var.get()
-            end_datetime_str = self.end_datetime_var.get()
-            print("start_datetime_str", start_datetime_str)
-            print("end_datetime_str", end_datetime_str)
-            # 转换为datetime格式
-            print(f"原始开始时间字符串: {start_datetime_str}")
-            print(f"原始结束时间字符串: {end_datetime_str}")
-            
-            try:
-                start_time_obj = datetime.strptime(start_datetime_str, "%Y-%m-%d %H:%M:%S")
-                end_time_obj = datetime.strptime(end_datetime_str, "%Y-%m-%d %H:%M:%S")
-            except ValueError as e:
-                messagebox.showerror("格式错误", f"时间格式转换错误: {str(e)}\n请确保使用YYYY-MM-DD HH:MM:SS格式")
-                return
-            
-            # 获取筛选后的数据
-            data_list = self.get_filtered_data(start_time_obj, end_time_obj)
-            if not data_list:
-                return
-            
-            # 创建DataFrame
-            df = pd.DataFrame(data_list)
-            df = df.sort_values('Time')
-            
-            # 设置默认文件名
-            default_filename = f"ECG数据_{start_datetime_str}_{end_datetime_str}.xlsx"
-            
-            # 选择保存路径
-            from tkinter import filedialog
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel文件", "*.xlsx")],
-                initialfile=default_filename
-            )
-            
-            if file_path:
-                # 导出到Excel
-                df.to_excel(file_path, index=False)
-                self.status_var.set(f"数据已导出到: {file_path}")
-                messagebox.showinfo("成功", "数据导出完成！")
-            
+            # 导出范围内的心率、HRV、呼吸频率汇总，随数据一起写出
+            summary = summarize_range(source, data)
+            events, _ = query_events(source, data['timestamp'][0], data['timestamp'][-1])
+            beats = (source.beats_in_range(data['timestamp'][0], data['timestamp'][-1])
+                     if hasattr(source, 'beats_in_range') else None)
+            export_data(file_path, data, progress, self.export_cancel_event, summary=summary, events=events,
+                        beats=beats)
+            self.export_result = ("done", file_path)
+        except ExportCancelled:
+            self.export_result = ("cancelled", file_path)
         except Exception as e:
-            messagebox.showerror("错误", f"导出Excel失败: {str(e)}")
-            self.status_var.set(f"错误: {str(e)}")
+            self.export_result = ("error", str(e))
+
+    def poll_export(self):
+        if self.closed:
+            return
+        done, total = self.export_progress
+        self.progress_bar["value"] = 100 * done / total if total else 100
+        
+        if self.export_result is None:
+            self.window.after(POLL_INTERVAL, self.poll_export)
+            return
+        
+        self.cancel_button.config(state="disabled")
+        status, detail = self.export_result
+        if status == "done":
+            self.status_var.set(f"数据已导出到: {detail}")
+            messagebox.showinfo("成功", "数据导出完成！")
+        elif status == "cancelled":
+            self.progress_bar["value"] = 0
+            self.status_var.set("导出已取消")
+        else:
+            messagebox.showerror("错误", f"导出失败: {detail}")
+            self.status_var.set(f"错误: {detail}")
+
+    def cancel_export(self):
+        if self.export_cancel_event is not None:
+            self.export_cancel_event.set()
+            self.status_var.set("正在取消导出...")
 
-def show_export_window(runtime_data):
-    ECGExportWindow(runtime_data)
\ No newline at end of file
+def show_export_window(runtime_data, master=None):
+    return ECGExportWindow(runtime_data, master)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import numpy as np
+
+# 金字塔各层的桶宽（秒）：1秒、10秒、1分钟、10分钟
+PYRAMID_LEVELS = (1, 10, 60, 600)
+
+
+class PyramidLevel:
+    # 单层汇总：每个桶记录各通道的最小/最大/求和/有效计数，桶按时间有序
+    # 各统计量为 (桶, 通道) 二维数组，所有通道一次归约
+    # 最后一个桶保持打开状态，后续同一桶内的样本直接合并进去
+    STATS = ('min', 'max', 'sum', 'count')
+
+    def __init__(self, width, channels, capacity=1024):
+        self.width = width
+        self.channels = tuple(channels)
+        self._size = 0
+        self._bucket_ids = np.empty(capacity, dtype=np.int64)
+        self._stats = {stat: np.empty((capacity, len(self.channels))) for stat in self.STATS}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._bucket_ids.nbytes + sum(table.nbytes for table in self._stats.values())
+
+    def _reserve(self, needed):
+        capacity = len(self._bucket_ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        grown = np.empty(new_capacity, dtype=np.int64)
+        grown[:self._size] = self._bucket_ids[:self._size]
+        self._bucket_ids = grown
+        for stat, table in self._stats.items():
+            grown = np.empty((new_capacity, len(self.channels)))
+            grown[:self._size] = table[:self._size]
+            self._stats[stat] = grown
+
+    def append(self, timestamps, values):
+        bucket_ids = np.floor(timestamps / self.width).astype(np.int64)
+        # 时间戳有序，相同桶号的样本连续，按分组边界一次性归约
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket_ids)) + 1))
+        ids = bucket_ids[starts]
+
+        finite = np.isfinite(values)
+        reduced = {
+            'min': np.fmin.reduceat(values, starts, axis=0),
+            'max': np.fmax.reduceat(values, starts, axis=0),
+            'sum': np.add.reduceat(np.where(finite, values, 0.0), starts, axis=0),
+            'count': np.add.reduceat(finite.astype(float), starts, axis=0)
+        }
+
+        # 第一组若落在当前打开的桶内，则与其合并
+        if self._size and ids[0] == self._bucket_ids[self._size - 1]:
+            last = self._size - 1
+            stats = self._stats
+            stats['min'][last] = np.fmin(stats['min'][last], reduced['min'][0])
+            stats['max'][last] = np.fmax(stats['max'][last], reduced['max'][0])
+            stats['sum'][last] += reduced['sum'][0]
+            stats['count'][last] += reduced['count'][0]
+            ids = ids[1:]
+            if not len(ids):
+                return
+            reduced = {stat: table[1:] for stat, table in reduced.items()}
+
+        n = len(ids)
+        self._reserve(self._size + n)
+        end = self._size + n
+        self._bucket_ids[self._size:end] = ids
+        for stat, table in reduced.items():
+            self._stats[stat][self._size:end] = table
+        self._size = end
+
+    def bucket_times(self):
+        return self._bucket_ids[:self._size] * self.width
+
+    def stat(self, channel, name):
+        column = self.channels.index(channel)
+        if name == 'mean':
+            count = self._stats['count'][:self._size, column]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return self._stats['sum'][:self._size, column] / count
+        return self._stats[name][:self._size, column]
+
+    # 返回 [start, end] 内的桶范围（按桶起始时间二分查找）
+    def range_indices(self, start, end):
+        times = self.bucket_times()
+        lo = int(np.searchsorted(times, start - self.width, side='right'))
+        hi = int(np.searchsorted(times, end, side='right'))
+        return lo, hi
+
+    # 返回区间内每个桶的起始时间及 min/max 交错的包络
+    def envelope(self, channel, start, end):
+        lo, hi = self.range_indices(start, end)
+        times = self.bucket_times()[lo:hi]
+        mins = self.stat(channel, 'min')[lo:hi]
+        maxs = self.stat(channel, 'max')[lo:hi]
+        return np.repeat(times, 2), np.column_stack((mins, maxs)).ravel()
+
+
+class SummaryPyramid:
+    # 多分辨率汇总金字塔，随样本到达增量维护，查询代价与会话时长无关
+    def __init__(self, channels, levels=PYRAMID_LEVELS):
+        self.levels = [PyramidLevel(width, channels) for width in levels]
+
+    # 各层随会话时长线性增长，最细一层每通道每小时约 0.15MB
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    # values 为 (样本数, 通道数) 的二维数组，列顺序与 channels 一致
+    def append(self, timestamps, values):
+        if not len(timestamps):
+            return
+        for level in self.levels:
+            level.append(timestamps, values)
+
+    # 选择桶宽不超过单个像素时长的最粗一层；区间太短（不足1秒/像素）时返回None，由调用方使用原始数据
+    def select_level(self, start, end, max_points):
+        pixel_duration = (end - start) / max(1, max_points)
+        chosen = None
+        for level in self.levels:
+            if level.width <= pixel_duration:
+                chosen = level
+        return chosen
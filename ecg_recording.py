@@ -0,0 +1,282 @@
+import os
+import glob
+import json
+import queue
+import struct
+import threading
+import time
+import numpy as np
+from event_index import EventIndex, load_events, append_events
+
+# 分段录制格式：
+#   segment_XXXXX.ecgrec  固定长度文件头 + 定宽记录（时间戳float64 + 各通道float32）
+#   segment_XXXXX.idx     稀疏时间索引，每 INDEX_INTERVAL 条记录一项 (记录号int64, 时间戳float64)
+#   beats.ecgbeat         主机端检测到的R波 (时间戳, RR间期, 心率)，均为float64
+#   events.jsonl          报警、数据中断、用户标记等事件，每行一个JSON对象（见 event_index）
+# 崩溃后末尾可能残留半条记录，读取时按整条记录截断即可
+MAGIC = b'ECGREC01'
+HEADER_SIZE = 256
+HEADER_STRUCT = struct.Struct('<8sIdI')
+DEFAULT_CHANNELS = ('ECG', 'Respiration', 'BPM')
+SEGMENT_RECORDS = 250 * 3600
+INDEX_INTERVAL = 4096
+FSYNC_INTERVAL = 5.0
+INDEX_DTYPE = np.dtype([('record', '<i8'), ('timestamp', '<f8')])
+BEAT_DTYPE = np.dtype([('timestamp', '<f8'), ('RR', '<f8'), ('BPM', '<f8')])
+BEATS_FILE = 'beats.ecgbeat'
+EVENTS_FILE = 'events.jsonl'
+
+
+def record_dtype(channels):
+    return np.dtype([('timestamp', '<f8')] + [(name, '<f4') for name in channels])
+
+
+# 文件头长度为 HEADER_SIZE 的整数倍，多导联的通道描述放不下时按倍数加长（长度记录在文件头中）
+def write_header(f, sample_rate, channels):
+    layout = json.dumps(list(channels)).encode('utf-8')
+    header_size = -(-(HEADER_STRUCT.size + len(layout)) // HEADER_SIZE) * HEADER_SIZE
+    header = HEADER_STRUCT.pack(MAGIC, header_size, float(sample_rate), len(layout)) + layout
+    f.write(header.ljust(header_size, b'\0'))
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        magic, header_size, sample_rate, layout_size = HEADER_STRUCT.unpack_from(header)
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的心电记录文件: {path}")
+        header += f.read(header_size - HEADER_SIZE)
+    layout = header[HEADER_STRUCT.size:HEADER_STRUCT.size + layout_size]
+    return header_size, sample_rate, tuple(json.loads(layout.decode('utf-8')))
+
+
+class RecordingWriter(threading.Thread):
+    # 后台写盘线程：采集线程只把批次放入队列，写文件、刷新和fsync都在这里完成
+    def __init__(self, directory, sample_rate, channels=DEFAULT_CHANNELS):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.channels = tuple(channels)
+        self.dtype = record_dtype(self.channels)
+        self._queue = queue.Queue()
+        self._segment_number = 0
+        self._segment_records = 0
+        self._data_file = None
+        self._index_file = None
+        self._beats_file = None
+        self._last_fsync = time.time()
+        os.makedirs(directory, exist_ok=True)
+
+    # values 为 (样本数, 通道数) 的二维数组，列顺序与 channels 一致
+    def write(self, timestamps, values):
+        self._queue.put(('samples', np.asarray(timestamps, dtype=float), np.asarray(values)))
+
+    def write_beats(self, timestamps, rr, bpm):
+        if len(timestamps):
+            self._queue.put(('beats', timestamps, rr, bpm))
+
+    def write_event(self, event):
+        self._queue.put(('event', event))
+
+    def close(self):
+        self._queue.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                # 一次取走队列中积压的所有批次，合并写出
+                batches = [item]
+                while item is not None:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batches.append(item)
+                closing = batches[-1] is None
+                samples = [batch[1:] for batch in batches if batch is not None and batch[0] == 'samples']
+                beats = [batch[1:] for batch in batches if batch is not None and batch[0] == 'beats']
+                if samples:
+                    self._write_records(samples)
+                if beats:
+                    self._write_beats(beats)
+                events = [batch[1] for batch in batches if batch is not None and batch[0] == 'event']
+                if events:
+                    self._write_events(events)
+                if closing:
+                    break
+        except OSError as e:
+            print(f"记录写入错误: {e}")
+        finally:
+            self._close_segment()
+            if self._beats_file is not None:
+                self._beats_file.close()
+
+    def _write_beats(self, batches):
+        if self._beats_file is None:
+            self._beats_file = open(os.path.join(self.directory, BEATS_FILE), 'ab')
+        beats = np.empty(sum(len(batch[0]) for batch in batches), dtype=BEAT_DTYPE)
+        for name, i in (('timestamp', 0), ('RR', 1), ('BPM', 2)):
+            beats[name] = np.concatenate([batch[i] for batch in batches])
+        self._beats_file.write(beats.tobytes())
+        self._beats_file.flush()
+
+    def _write_events(self, events):
+        append_events(os.path.join(self.directory, EVENTS_FILE), events)
+
+    def _open_segment(self):
+        base = os.path.join(self.directory, f"segment_{self._segment_number:05d}")
+        self._data_file = open(base + '.ecgrec', 'wb')
+        self._index_file = open(base + '.idx', 'wb')
+        write_header(self._data_file, self.sample_rate, self.channels)
+        self._segment_records = 0
+        self._segment_number += 1
+
+    def _close_segment(self):
+        if self._data_file is None:
+            return
+        self._sync()
+        self._data_file.close()
+        self._index_file.close()
+        self._data_file = None
+        self._index_file = None
+
+    def _sync(self):
+        for f in (self._data_file, self._index_file, self._beats_file):
+            if f is None:
+                continue
+            f.flush()
+            os.fsync(f.fileno())
+        self._last_fsync = time.time()
+
+    def _write_records(self, batches):
+        timestamps = np.concatenate([batch[0] for batch in batches])
+        values = np.concatenate([batch[1] for batch in batches])
+        records = np.empty(len(timestamps), dtype=self.dtype)
+        records['timestamp'] = timestamps
+        for i, name in enumerate(self.channels):
+            records[name] = values[:, i]
+
+        offset = 0
+        while offset < len(records):
+            if self._data_file is None or self._segment_records >= SEGMENT_RECORDS:
+                self._close_segment()
+                self._open_segment()
+            count = min(len(records) - offset, SEGMENT_RECORDS - self._segment_records)
+            chunk = records[offset:offset + count]
+
+            # 稀疏索引：记录号为 INDEX_INTERVAL 整数倍的样本
+            first = self._segment_records
+            positions = np.arange((-first) % INDEX_INTERVAL, count, INDEX_INTERVAL)
+            if len(positions):
+                index = np.empty(len(positions), dtype=INDEX_DTYPE)
+                index['record'] = first + positions
+                index['timestamp'] = chunk['timestamp'][positions]
+                self._index_file.write(index.tobytes())
+
+            self._data_file.write(chunk.tobytes())
+            self._segment_records += count
+            offset += count
+
+        self._data_file.flush()
+        self._index_file.flush()
+        if time.time() - self._last_fsync >= FSYNC_INTERVAL:
+            self._sync()
+
+
+class RecordingSegment:
+    def __init__(self, path):
+        header_size, self.sample_rate, self.channels = read_header(path)
+        dtype = record_dtype(self.channels)
+        # 只映射完整的记录，忽略崩溃时残留的半条记录
+        count = (os.path.getsize(path) - header_size) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=header_size, shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=dtype)
+
+        index_path = os.path.splitext(path)[0] + '.idx'
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE) if os.path.exists(index_path) else None
+        if index is not None:
+            index = index[index['record'] < count]
+        self.index = index
+
+    def __len__(self):
+        return len(self.records)
+
+    # 先在内存中的稀疏索引上二分，再只在对应的一小段记录内二分
+    def _search(self, value, side):
+        timestamps = self.records['timestamp']
+        if self.index is None or not len(self.index):
+            return int(np.searchsorted(timestamps, value, side=side))
+        block = int(np.searchsorted(self.index['timestamp'], value, side=side))
+        lo = int(self.index['record'][block - 1]) if block > 0 else 0
+        hi = int(self.index['record'][block]) + 1 if block < len(self.index) else len(timestamps)
+        return lo + int(np.searchsorted(timestamps[lo:hi], value, side=side))
+
+    def slice_range(self, start, end):
+        lo = self._search(start, 'left')
+        hi = self._search(end, 'right')
+        return self.records[lo:hi]
+
+
+class ECGRecording:
+    # 以内存映射方式打开磁盘上的录制目录，对外提供与 ECGDataStore 相同的读取接口
+    def __init__(self, directory):
+        self.directory = directory
+        paths = sorted(glob.glob(os.path.join(directory, 'segment_*.ecgrec')))
+        segments = [RecordingSegment(path) for path in paths]
+        self.segments = [segment for segment in segments if len(segment)]
+        if not paths:
+            raise ValueError(f"目录中没有心电记录: {directory}")
+        self.sample_rate = segments[0].sample_rate
+        self.channels = segments[0].channels
+        self.pyramid = None
+
+        beats_path = os.path.join(directory, BEATS_FILE)
+        if os.path.exists(beats_path):
+            count = os.path.getsize(beats_path) // BEAT_DTYPE.itemsize
+            self.beats = np.fromfile(beats_path, dtype=BEAT_DTYPE, count=count)
+        else:
+            self.beats = np.empty(0, dtype=BEAT_DTYPE)
+
+        self.events = EventIndex(load_events(os.path.join(directory, EVENTS_FILE)))
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def __bool__(self):
+        return bool(self.segments)
+
+    @property
+    def first_timestamp(self):
+        return float(self.segments[0].records['timestamp'][0]) if self.segments else None
+
+    @property
+    def last_timestamp(self):
+        return float(self.segments[-1].records['timestamp'][-1]) if self.segments else None
+
+    # 单个分段内的范围直接返回内存映射视图；跨分段时才拼接
+    def slice_range(self, start, end):
+        parts = [segment.slice_range(start, end) for segment in self.segments
+                 if segment.records['timestamp'][0] <= end and segment.records['timestamp'][-1] >= start]
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            records = np.empty(0, dtype=record_dtype(self.channels))
+        elif len(parts) == 1:
+            records = parts[0]
+        else:
+            records = np.concatenate(parts)
+        return {name: records[name] for name in ('timestamp',) + self.channels}
+
+    # 回看时添加的标记直接追加到记录目录的事件文件中
+    def append_event(self, event):
+        event = self.events.add(event)
+        append_events(os.path.join(self.directory, EVENTS_FILE), [event])
+
+    def beats_in_range(self, start, end):
+        timestamps = self.beats['timestamp']
+        lo = int(np.searchsorted(timestamps, start, side='left'))
+        hi = int(np.searchsorted(timestamps, end, side='right'))
+        return {name: self.beats[name][lo:hi] for name in BEAT_DTYPE.names}
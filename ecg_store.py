@@ -0,0 +1,335 @@
+import threading
+import numpy as np
+from ecg_pyramid import SummaryPyramid
+from channel_schema import DEFAULT_SCHEMA, schema_of
+from event_index import EventIndex
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# 启用保留策略时，超出保留窗口后每次成批移出内存的时长（秒），摊薄复制的开销
+SPILL_SECONDS = 300
+
+
+# 批量将epoch秒转换为本地时间字符串，只在输出环节调用
+def format_timestamps(timestamps, time_format=TIME_FORMAT):
+    import pandas as pd
+    from dateutil.tz import tzlocal
+    times = pd.to_datetime(np.asarray(timestamps), unit='s', utc=True).tz_convert(tzlocal())
+    return times.strftime(time_format)
+
+
+# 按倍数扩容一组等长的列数组，保留前 size 个元素；limit 为倍增的容量上限
+def grow_columns(columns, size, needed, limit=None):
+    capacity = len(next(iter(columns.values())))
+    if needed <= capacity:
+        return
+    new_capacity = max(needed, capacity * 2 if limit is None else min(capacity * 2, limit))
+    for name, column in columns.items():
+        grown = np.empty(new_capacity)
+        grown[:size] = column[:size]
+        columns[name] = grown
+
+
+# 从存储或录制中取出时间范围内的数据，并剔除主导联无效的样本（仅在确实存在时才复制）
+# 数据源带有R波检测结果时，附加 Beat 列标记R波所在样本
+def select_range(source, start, end):
+    data = source.slice_range(start, end)
+    if hasattr(source, 'beats_in_range') and len(data['timestamp']):
+        beat_times = source.beats_in_range(start, end)['timestamp']
+        beat = np.zeros(len(data['timestamp']), dtype=bool)
+        positions = np.searchsorted(data['timestamp'], beat_times)
+        beat[positions[positions < len(beat)]] = True
+        data['Beat'] = beat
+    valid = ~np.isnan(data[schema_of(source).primary_name])
+    if not valid.all():
+        data = {name: column[valid] for name, column in data.items()}
+    return data
+
+
+class StoreReader:
+    # ECGDataStore 与其快照共用的读取接口，只读取前 _size 个样本和前 _beat_size 个R波
+    # 主机端检测到的R波：时间戳、RR间期（秒）、由RR计算的心率
+    BEAT_COLUMNS = ('timestamp', 'RR', 'BPM')
+    # 按保留策略移出内存的部分：_cold 为已写盘数据的读取对象（没有时为 None），
+    # spilled 为累计移出的样本数，discarded 为其中确认不在已写盘数据中、只剩汇总金字塔的样本数
+    _cold = None
+    spilled = 0
+    discarded = 0
+
+    # 时间戳之后依次为通道声明中的原始通道和滤波后的通道
+    @property
+    def column_names(self):
+        return ('timestamp',) + self.schema.storage_names
+
+    @property
+    def channels(self):
+        return self.schema.storage_names
+
+    @property
+    def sample_rate(self):
+        return self.schema.sample_rate
+
+    def __len__(self):
+        if self._cold is None:
+            return self._size
+        return self._size + self.spilled - self.discarded
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @property
+    def capacity(self):
+        return len(self._columns['timestamp'])
+
+    # 内存中样本列和R波列占用的字节数（不含已移出的部分）
+    @property
+    def nbytes(self):
+        return (sum(column.nbytes for column in self._columns.values())
+                + sum(column.nbytes for column in self._beats.values()))
+
+    # 内存中全分辨率数据覆盖的时长（秒）
+    @property
+    def hot_seconds(self):
+        return float(self._columns['timestamp'][self._size - 1] - self._columns['timestamp'][0]) if self._size else 0.0
+
+    @property
+    def first_timestamp(self):
+        if self._cold is not None and self._cold.first_timestamp is not None:
+            return self._cold.first_timestamp
+        return float(self._columns['timestamp'][0]) if self._size else None
+
+    @property
+    def last_timestamp(self):
+        return float(self._columns['timestamp'][self._size - 1]) if self._size else None
+
+    # 返回某一列在内存中部分的只读视图（不复制）
+    def column(self, name):
+        column = self._columns[name][:self._size]
+        column.flags.writeable = False
+        return column
+
+    def view(self):
+        return {name: self.column(name) for name in self.column_names}
+
+    # 二分查找 [start, end] 闭区间内的样本，返回各列的连续只读切片
+    # 早于内存中第一个样本的部分从已写盘的数据中读取，与内存中的部分拼接
+    def slice_range(self, start, end):
+        timestamps = self.column('timestamp')
+        lo = int(np.searchsorted(timestamps, start, side='left'))
+        hi = int(np.searchsorted(timestamps, end, side='right'))
+        hot = {name: self.column(name)[lo:hi] for name in self.column_names}
+        cold = self._cold_range(self._cold.slice_range, timestamps, start, end) if self._cold is not None else None
+        if cold is None or not len(cold['timestamp']):
+            return hot
+        return {name: np.concatenate((cold[name], hot[name])) for name in self.column_names}
+
+    def beats_in_range(self, start, end):
+        timestamps = self._beats['timestamp'][:self._beat_size]
+        lo = int(np.searchsorted(timestamps, start, side='left'))
+        hi = int(np.searchsorted(timestamps, end, side='right'))
+        hot = {name: self._beats[name][lo:hi] for name in self.BEAT_COLUMNS}
+        cold = self._cold_range(self._cold.beats_in_range, timestamps, start, end) if self._cold is not None else None
+        if cold is None or not len(cold['timestamp']):
+            return hot
+        return {name: np.concatenate((cold[name], hot[name])) for name in self.BEAT_COLUMNS}
+
+    # 冷数据中 [start, end] 与内存部分之前重叠的一段，与内存中的部分不重复
+    @staticmethod
+    def _cold_range(read, hot_timestamps, start, end):
+        if len(hot_timestamps):
+            if start >= hot_timestamps[0]:
+                return None
+            end = min(end, np.nextafter(hot_timestamps[0], -np.inf))
+        return read(start, end)
+
+
+class StoreSnapshot(StoreReader):
+    # 存储在某一时刻的只读快照：只记下当时的长度和列数组引用，不复制数据
+    # 存储只追加、扩容时换新数组，快照范围内的数据不会再被修改，采集可以照常进行
+    # 移出内存的部分只由已写盘的数据提供，快照沿用当时的冷数据读取对象
+    def __init__(self, schema, columns, size, beats, beat_size, events, pyramid, cold=None, spilled=0, discarded=0):
+        self.schema = schema
+        self._cold = cold
+        self.spilled = spilled
+        self.discarded = discarded
+        self._columns = columns
+        self._size = size
+        self._beats = beats
+        self._beat_size = beat_size
+        self.events = events
+        # 汇总金字塔仍随采集更新，用于浏览时可能略多于快照范围，不影响显示
+        self.pyramid = pyramid
+
+
+class ECGDataStore(StoreReader):
+    # 列式、只追加的样本存储：每个通道一段连续的float64数组，按倍数扩容
+    # 通道由 schema 声明，每个原始通道另有一列滤波结果（见 ChannelSchema.storage_names）
+    # 写入只在采集线程上进行；扩容和长度更新在锁内完成，其他线程通过 snapshot() 读取一致的状态
+    # 保留策略：hot_seconds 为内存中保留的全分辨率时长，均为 None 时不限制；
+    # max_bytes 为内存上限，计入样本列、R波列和汇总金字塔（事件只有报警/标记，数量少，不计入），
+    # 金字塔随会话增长时内存中保留的时长相应缩短
+    # 超出时每次成批移出最早的 SPILL_SECONDS 秒（换新数组，已有快照不受影响）；
+    # open_cold() 返回已写盘数据的读取对象（如 ECGRecording），移出的部分之后透明地从中读取，
+    # 有冷数据时只移出已写盘的样本，除非达到上限；没有冷数据时移出的部分只剩汇总金字塔
+
+    # 同一时间戳的样本之间的最小间隔（秒），保证时间戳严格递增
+    TIMESTAMP_EPSILON = 1e-6
+
+    def __init__(self, schema=DEFAULT_SCHEMA, capacity=65536, hot_seconds=None, max_bytes=None, open_cold=None):
+        self.schema = schema
+        self._spill_samples = int(SPILL_SECONDS * schema.sample_rate)
+        self._hot_samples = int(hot_seconds * schema.sample_rate) + self._spill_samples \
+            if hot_seconds is not None else None
+        self.max_bytes = max_bytes
+        self._row_bytes = 8 * len(self.column_names)
+        if max_bytes is not None:
+            capacity = min(capacity, max(2, int(max_bytes) // self._row_bytes))
+        self.open_cold = open_cold
+        # 移出后尚未与冷数据核对的区间：[(起始时间, 结束时间, 样本数)]
+        self._unconfirmed = []
+        self._size = 0
+        self._columns = {name: np.empty(capacity) for name in self.column_names}
+        self._beat_size = 0
+        self._beats = {name: np.empty(1024) for name in self.BEAT_COLUMNS}
+        self._lock = threading.Lock()
+        # 报警、数据中断、用户标记等事件的有序索引（可由报警线程、界面线程写入）
+        # on_event(事件) 在每个新事件加入后调用，用于持久化
+        self.events = EventIndex()
+        self.on_event = None
+        # 多分辨率汇总，随追加增量更新（只覆盖原始通道）
+        self.pyramid = SummaryPyramid(schema.names)
+
+    def _monotonic(self, timestamps):
+        # 单调化：每个时间戳至少比前一个大 TIMESTAMP_EPSILON
+        n = len(timestamps)
+        eps = self.TIMESTAMP_EPSILON
+        offsets = np.arange(n) * eps
+        floor = self.last_timestamp + eps if self._size else -np.inf
+        return np.maximum.accumulate(np.maximum(timestamps, floor) - offsets) + offsets
+
+    # values 为 (样本数, 通道数) 的二维数组，列顺序与 schema.names 一致
+    # filtered 为对应 schema.filtered 各通道的滤波结果，未提供时与原始通道相同
+    def append(self, timestamps, values, filtered=None):
+        timestamps = np.asarray(timestamps, dtype=float)
+        n = len(timestamps)
+        if n == 0:
+            return
+        values = np.asarray(values, dtype=float)
+        if filtered is None:
+            filtered = values[:, list(self.schema.filtered)]
+        with self._lock:
+            limit = self._sample_limit()
+            if limit is not None and self._size + n > limit:
+                self._spill(n, limit)
+            grow_columns(self._columns, self._size, self._size + n, limit)
+
+            start = self._size
+            end = start + n
+            self._columns['timestamp'][start:end] = self._monotonic(timestamps)
+            for i, name in enumerate(self.schema.names):
+                self._columns[name][start:end] = values[:, i]
+            for i, name in enumerate(self.schema.filtered_names):
+                self._columns[name][start:end] = filtered[:, i]
+            self._size = end
+
+        self.pyramid.append(self._columns['timestamp'][start:end], values)
+
+    # 内存中最多保留的样本数：保留时长与内存上限（扣除R波列和汇总金字塔后）中较小的一个，不限制时为 None
+    def _sample_limit(self):
+        limit = self._hot_samples
+        if self.max_bytes is not None:
+            other = sum(column.nbytes for column in self._beats.values()) + self.pyramid.nbytes
+            by_bytes = max(2, int(self.max_bytes - other) // self._row_bytes)
+            limit = by_bytes if limit is None else min(limit, by_bytes)
+        return limit
+
+    # 在锁内调用：移出最早的样本，保留最近的部分并为本批样本和下一次移出留出空间
+    # 有冷数据时只移出已写盘的部分（时间戳不晚于冷数据的最后一个样本），除非上限迫使多移出
+    def _spill(self, incoming, limit):
+        spill = min(self._spill_samples, limit // 2)
+        drop = self._size - max(0, limit - spill - incoming)
+        if drop <= 0:
+            return
+        timestamps = self._columns['timestamp']
+        cold = self._open_cold()
+        if self.open_cold is None:
+            self.discarded += drop
+        else:
+            # 录制尚未写出第一个分段时打不开，全部待核对
+            persisted = cold.last_timestamp if cold is not None else None
+            saved = int(np.searchsorted(timestamps[:drop], persisted, side='right')) if persisted is not None else 0
+            # 写盘落后时：上限允许的话只移出已写盘的部分，否则照常整批移出，避免每批都重新打开冷数据
+            if saved >= self._size + incoming - limit:
+                drop = min(drop, saved)
+            # 移出的区间与冷数据核对，写盘已越过的立即确认，其余待下次打开时确认
+            self._unconfirmed.append((float(timestamps[0]), float(timestamps[drop - 1]), drop))
+            if cold is not None:
+                self._confirm_spilled(cold)
+        keep = self._size - drop
+        columns = {}
+        for name, column in self._columns.items():
+            columns[name] = np.empty(max(limit, keep + incoming))
+            columns[name][:keep] = column[drop:self._size]
+        self._columns = columns
+        self._size = keep
+        self.spilled += drop
+
+        # R波很少（每小时约 4000 个），只在已有写盘的R波可读时才一并移出
+        if cold is not None and len(cold.beats):
+            beat_times = self._beats['timestamp'][:self._beat_size]
+            last = min(timestamps[drop - 1], cold.beats['timestamp'][-1])
+            count = int(np.searchsorted(beat_times, last, side='right'))
+            beats = {}
+            for name, column in self._beats.items():
+                beats[name] = np.empty(len(column))
+                beats[name][:self._beat_size - count] = column[count:self._beat_size]
+            self._beats = beats
+            self._beat_size -= count
+        if cold is not None:
+            self._cold = cold
+
+    # 写盘已越过的待核对区间：冷数据中缺少的样本（写盘丢失或上限迫使移出后未能写出）才计入 discarded
+    def _confirm_spilled(self, cold):
+        persisted = cold.last_timestamp
+        pending = []
+        for start, end, count in self._unconfirmed:
+            if persisted is not None and persisted >= end:
+                self.discarded += count - len(cold.slice_range(start, end)['timestamp'])
+            else:
+                pending.append((start, end, count))
+        self._unconfirmed = pending
+
+    # 重新打开已写盘的数据，使其包含最新写出的分段；失败时沿用上一次打开的对象
+    def _open_cold(self):
+        if self.open_cold is None:
+            return self._cold
+        try:
+            cold = self.open_cold()
+        except (OSError, ValueError) as e:
+            print(f"打开已写盘数据失败: {e}")
+            return self._cold
+        self._confirm_spilled(cold)
+        return cold
+
+    def append_beats(self, timestamps, rr, bpm):
+        n = len(timestamps)
+        if n == 0:
+            return
+        with self._lock:
+            grow_columns(self._beats, self._beat_size, self._beat_size + n)
+            end = self._beat_size + n
+            self._beats['timestamp'][self._beat_size:end] = timestamps
+            self._beats['RR'][self._beat_size:end] = rr
+            self._beats['BPM'][self._beat_size:end] = bpm
+            self._beat_size = end
+
+    def append_event(self, event):
+        event = self.events.add(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    # 取得当前时刻的只读快照，开销与数据量无关
+    def snapshot(self):
+        with self._lock:
+            return StoreSnapshot(self.schema, dict(self._columns), self._size, dict(self._beats), self._beat_size,
+                                 self.events.copy(), self.pyramid, self._cold, self.spilled, self.discarded)
@@ -0,0 +1,108 @@
+import bisect
+import json
+import os
+import threading
+from collections import namedtuple
+from alarm_engine import AlarmEvent
+
+# 事件记录：kind 为 'alarm'（报警）、'dropout'（数据中断）、'marker'（用户标记）
+# R波数量大、已有各自的有序索引（beats_in_range），不重复保存，查询时按同样的方式合并进结果
+Annotation = namedtuple('Annotation', ['timestamp', 'kind', 'label', 'message'])
+EVENT_KINDS = ('alarm', 'dropout', 'marker')
+ALL_KINDS = EVENT_KINDS + ('beat',)
+KIND_NAMES = {'alarm': '报警', 'dropout': '数据中断', 'marker': '标记', 'beat': 'R波'}
+# 相邻两批样本之间超出正常采样间隔这么多秒，记为一次数据中断
+DROPOUT_SECONDS = 1.0
+
+
+# 报警事件转为索引中的记录
+def as_annotation(event):
+    if isinstance(event, Annotation):
+        return event
+    return Annotation(float(event.timestamp), 'alarm', event.rule, f"{event.state}: {event.message}")
+
+
+# events.jsonl 中的一行；旧录制中只有报警事件（AlarmEvent 的字段）
+def parse_event(record):
+    if 'kind' in record:
+        return Annotation(**record)
+    return as_annotation(AlarmEvent(**record))
+
+
+def load_events(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [parse_event(json.loads(line)) for line in f if line.strip()]
+
+
+def append_events(path, events):
+    with open(path, 'a', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event._asdict(), ensure_ascii=False) + '\n')
+
+
+class EventIndex:
+    # 按时间排序的事件索引：时间戳列表与事件列表一一对应，范围查询为两次二分
+    # 采集中的事件基本按时间顺序到达，直接追加；回看时添加的标记按时间插入
+    def __init__(self, events=()):
+        events = sorted((as_annotation(event) for event in events), key=lambda event: event.timestamp)
+        self._times = [event.timestamp for event in events]
+        self._events = events
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._events)
+
+    def __iter__(self):
+        return iter(list(self._events))
+
+    def add(self, event):
+        event = as_annotation(event)
+        with self._lock:
+            if not self._times or event.timestamp >= self._times[-1]:
+                self._times.append(event.timestamp)
+                self._events.append(event)
+                return event
+            i = bisect.bisect_right(self._times, event.timestamp)
+            self._times.insert(i, event.timestamp)
+            self._events.insert(i, event)
+        return event
+
+    def copy(self):
+        with self._lock:
+            index = EventIndex()
+            index._times = list(self._times)
+            index._events = list(self._events)
+        return index
+
+    # [start, end] 闭区间内的事件，kinds 为 None 时不按类型筛选
+    def query(self, start, end, kinds=None):
+        with self._lock:
+            lo = bisect.bisect_left(self._times, start)
+            hi = bisect.bisect_right(self._times, end)
+            events = self._events[lo:hi]
+        if kinds is not None:
+            events = [event for event in events if event.kind in kinds]
+        return events
+
+
+# 数据源（存储、快照、录制、归档）中 [start, end] 内的事件，按时间排序
+# kinds 含 'beat' 时把R波也列入；limit 限制返回条数（R波可能有上万条），返回 (事件列表, 是否被截断)
+def query_events(source, start, end, kinds=EVENT_KINDS, limit=None):
+    index = getattr(source, 'events', None)
+    events = index.query(start, end, kinds) if index is not None else []
+    truncated = False
+    if 'beat' in kinds and hasattr(source, 'beats_in_range'):
+        beats = source.beats_in_range(start, end)
+        if limit is not None and len(beats['timestamp']) > limit:
+            # R波只取前 limit 条，其他事件也截止到最后一条R波，结果仍是时间上连续的一段
+            beats = {name: column[:limit] for name, column in beats.items()}
+            events = [event for event in events if event.timestamp <= beats['timestamp'][-1]]
+            truncated = True
+        events = sorted(events + [
+            Annotation(float(t), 'beat', 'R波', f"RR {rr * 1000:.0f}ms  心率 {bpm:.0f}" if rr == rr else "")
+            for t, rr, bpm in zip(beats['timestamp'], beats['RR'], beats['BPM'])], key=lambda event: event.timestamp)
+    if limit is not None and len(events) > limit:
+        return events[:limit], True
+    return events, truncated
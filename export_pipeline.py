@@ -0,0 +1,166 @@
+import os
+from ecg_store import format_timestamps
+
+# xlsx单个工作表的行数上限（含表头）
+EXCEL_MAX_ROWS = 1048576
+# 每次格式化并写出的行数
+CHUNK_SIZE = 100000
+
+# 空数据时写出的表头（缺省通道声明）；有数据时列由数据中的通道决定
+EXPORT_COLUMNS = ('Time', 'ECG', 'Respiration', 'BPM')
+SUMMARY_COLUMNS = ('指标', '数值')
+SUMMARY_SHEET = '统计'
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+# 按块生成DataFrame，时间字符串只为当前块格式化
+# 列顺序：时间、各通道（原始在前、滤波后的在后，与数据中的顺序一致）、R波标记
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    import pandas as pd
+    channels = [name for name in data if name not in ('timestamp', 'Beat')]
+    total = len(data['timestamp'])
+    for start in range(0, total, chunk_size):
+        end = min(start + chunk_size, total)
+        chunk = pd.DataFrame({'Time': format_timestamps(data['timestamp'][start:end])})
+        for name in channels:
+            chunk[name] = data[name][start:end]
+        # 有R波检测结果时附加标记列
+        if 'Beat' in data:
+            chunk['Beat'] = data['Beat'][start:end].astype(int)
+        yield chunk
+
+
+def _check_cancel(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ExportCancelled()
+
+
+def _report(progress, done, total):
+    if progress is not None:
+        progress(done, total)
+
+
+def export_csv(file_path, data, progress=None, cancel_event=None):
+    total = len(data['timestamp'])
+    done = 0
+    # utf-8-sig 保证Excel直接打开CSV时中文不乱码
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        for chunk in iter_chunks(data):
+            _check_cancel(cancel_event)
+            chunk.to_csv(f, index=False, header=(done == 0))
+            done += len(chunk)
+            _report(progress, done, total)
+
+
+def export_parquet(file_path, data, progress=None, cancel_event=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    total = len(data['timestamp'])
+    done = 0
+    writer = None
+    try:
+        for chunk in iter_chunks(data):
+            _check_cancel(cancel_event)
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(file_path, table.schema)
+            writer.write_table(table)
+            done += len(chunk)
+            _report(progress, done, total)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_xlsx(file_path, data, progress=None, cancel_event=None, summary=None):
+    from openpyxl import Workbook
+
+    total = len(data['timestamp'])
+    done = 0
+    # 只写模式逐行流式写出，超过单表上限时自动换到下一个工作表
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = EXCEL_MAX_ROWS
+    for chunk in iter_chunks(data):
+        _check_cancel(cancel_event)
+        columns = list(chunk.columns)
+        rows = zip(*(chunk[name].tolist() for name in columns))
+        for row in rows:
+            if sheet_rows >= EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(f"ECG数据{len(workbook.worksheets) + 1}")
+                sheet.append(columns)
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+        done += len(chunk)
+        _report(progress, done, total)
+    if sheet is None:
+        workbook.create_sheet("ECG数据1").append(list(EXPORT_COLUMNS))
+    if summary:
+        summary_sheet = workbook.create_sheet(SUMMARY_SHEET)
+        summary_sheet.append(list(SUMMARY_COLUMNS))
+        for row in summary:
+            summary_sheet.append(list(row))
+    _check_cancel(cancel_event)
+    workbook.save(file_path)
+
+
+# CSV/Parquet 没有多工作表，统计汇总另存为同名的 _summary.csv
+def summary_path(file_path):
+    return os.path.splitext(file_path)[0] + '_summary.csv'
+
+
+def write_summary_csv(file_path, summary):
+    import csv
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        writer.writerows(summary)
+
+
+# 心电归档：分块压缩的原生格式，可按时间范围随机读取（见 ecg_archive）；events 和 beats（R波及其RR、心率）随数据一起保存
+def export_archive(file_path, data, progress=None, cancel_event=None, events=(), beats=None):
+    from ecg_archive import write_archive
+
+    def report(done, total):
+        _check_cancel(cancel_event)
+        _report(progress, done, total)
+    write_archive(file_path, data, report, events=events, beats=beats)
+
+
+EXPORTERS = {
+    '.csv': export_csv,
+    '.parquet': export_parquet,
+    '.xlsx': export_xlsx,
+    '.ecgz': export_archive
+}
+
+
+# 按扩展名选择导出格式；summary 为 [(指标, 数值), ...] 统计汇总，xlsx 写入单独工作表，CSV/Parquet 另存CSV
+# events 为范围内的事件（event_index.Annotation），beats 为范围内的R波（beats_in_range 的结果），只有归档格式保存
+# 取消或失败时删除写了一半的文件
+def export_data(file_path, data, progress=None, cancel_event=None, summary=None, events=(), beats=None):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in EXPORTERS:
+        raise ValueError(f"不支持的导出格式: {extension}")
+    written = [file_path]
+    try:
+        if extension == '.xlsx':
+            export_xlsx(file_path, data, progress, cancel_event, summary=summary)
+        elif extension == '.ecgz':
+            # 归档自带R波索引，统计量可随时重算，不另存汇总
+            export_archive(file_path, data, progress, cancel_event, events=events, beats=beats)
+        else:
+            EXPORTERS[extension](file_path, data, progress, cancel_event)
+            if summary:
+                written.append(summary_path(file_path))
+                write_summary_csv(written[-1], summary)
+    except BaseException:
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
@@ -0,0 +1,239 @@
+import math
+import threading
+from collections import deque
+from datetime import datetime
+import numpy as np
+from ecg_store import TIME_FORMAT
+from channel_schema import schema_of
+
+# 滚动统计窗口（秒）
+ANALYSIS_WINDOWS = (60, 300, 3600)
+# 参与HRV计算的RR间期范围（秒），超出视为误检或漏检，同时打断逐搏差分
+RR_RANGE = (0.3, 2.0)
+# 呼吸检测：基线与幅度包络的指数平均时间常数（秒），过零滞回占幅度包络的比例
+RESP_BASELINE_SECONDS = 10.0
+RESP_HYSTERESIS = 0.3
+# 呼吸间期范围（秒），约 4-60 次/分钟
+BREATH_RANGE = (1.0, 15.0)
+
+# 统计项及其中文名称，导出汇总表与界面共用
+STAT_LABELS = (
+    ('beats', '心搏数'),
+    ('mean_bpm', '平均心率 (bpm)'),
+    ('min_bpm', '最低心率 (bpm)'),
+    ('max_bpm', '最高心率 (bpm)'),
+    ('sdnn_ms', 'SDNN (ms)'),
+    ('rmssd_ms', 'RMSSD (ms)'),
+    ('resp_rate', '呼吸频率 (次/分钟)'),
+)
+
+
+class RollingWindow:
+    # 时间窗口内数值的滚动统计：运行和/平方和给出均值与标准差，单调双端队列给出最小/最大值
+    # 每次追加和淘汰均摊 O(1)，与会话时长无关
+    def __init__(self, duration):
+        self.duration = duration
+        self._items = deque()
+        self._min = deque()
+        self._max = deque()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        # 以第一个值为参考平移后再累加，减小平方和相减时的舍入误差
+        self._offset = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def push(self, t, value):
+        if self._offset is None:
+            self._offset = value
+        shifted = value - self._offset
+        self._items.append((t, value))
+        self._sum += shifted
+        self._sum_sq += shifted * shifted
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((t, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((t, value))
+
+    # 淘汰早于 now - duration 的数据
+    def expire(self, now):
+        limit = now - self.duration
+        items = self._items
+        while items and items[0][0] <= limit:
+            shifted = items.popleft()[1] - self._offset
+            self._sum -= shifted
+            self._sum_sq -= shifted * shifted
+        while self._min and self._min[0][0] <= limit:
+            self._min.popleft()
+        while self._max and self._max[0][0] <= limit:
+            self._max.popleft()
+        if not items:
+            self._sum = self._sum_sq = 0.0
+            self._offset = None
+
+    @property
+    def mean(self):
+        return self._offset + self._sum / len(self._items) if self._items else math.nan
+
+    @property
+    def std(self):
+        n = len(self._items)
+        if n < 2:
+            return math.nan
+        return math.sqrt(max(0.0, (self._sum_sq - self._sum * self._sum / n) / (n - 1)))
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else math.nan
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else math.nan
+
+
+class HRVEngine:
+    # 增量心率变异性与呼吸频率统计：每个R波、每次呼吸只做常数次更新
+    # update() 在采集线程上调用，stats()/summary() 可在任意线程读取
+    def __init__(self, windows=ANALYSIS_WINDOWS, sample_rate=250):
+        self.windows = tuple(windows)
+        self.sample_rate = sample_rate
+        self._bpm = {w: RollingWindow(w) for w in self.windows}
+        self._rr = {w: RollingWindow(w) for w in self.windows}
+        # 相邻RR间期差值的平方，其均值开方即 RMSSD
+        self._successive = {w: RollingWindow(w) for w in self.windows}
+        self._breaths = {w: RollingWindow(w) for w in self.windows}
+        self._last_rr = None
+        self._last_breath = None
+        self._resp_zi = None
+        self._resp_high = False
+        self._lock = threading.Lock()
+
+    def update(self, beat_times, rr, bpm, timestamps=None, resp=None):
+        with self._lock:
+            for t, interval, rate in zip(np.asarray(beat_times).tolist(), np.asarray(rr).tolist(),
+                                         np.asarray(bpm).tolist()):
+                self._add_beat(t, interval, rate)
+            if timestamps is not None and len(timestamps):
+                for t in self._detect_breaths(np.asarray(timestamps), np.asarray(resp, dtype=float)):
+                    self._add_breath(t)
+                now = float(timestamps[-1])
+            elif len(beat_times):
+                now = float(beat_times[-1])
+            else:
+                return
+            # 按最新时间淘汰，长时间没有R波时窗口也会随之清空
+            for window in self._all_windows():
+                window.expire(now)
+
+    def _all_windows(self):
+        for group in (self._bpm, self._rr, self._successive, self._breaths):
+            yield from group.values()
+
+    def _add_beat(self, t, interval, rate):
+        if not RR_RANGE[0] <= interval <= RR_RANGE[1]:
+            self._last_rr = None
+            return
+        for w in self.windows:
+            self._bpm[w].push(t, rate)
+            self._rr[w].push(t, interval)
+        if self._last_rr is not None:
+            difference = interval - self._last_rr
+            for w in self.windows:
+                self._successive[w].push(t, difference * difference)
+        self._last_rr = interval
+
+    def _add_breath(self, t):
+        if self._last_breath is not None:
+            interval = t - self._last_breath
+            if BREATH_RANGE[0] <= interval <= BREATH_RANGE[1]:
+                for w in self.windows:
+                    self._breaths[w].push(t, interval)
+        self._last_breath = t
+
+    # 呼吸波去基线后做滞回过零检测，返回本批每次吸气开始（上升过零）的时间
+    def _detect_breaths(self, timestamps, resp):
+        from scipy.signal import lfilter
+        valid = np.isfinite(resp)
+        timestamps, resp = timestamps[valid], resp[valid]
+        if not len(resp):
+            return []
+        alpha = 1.0 - math.exp(-1.0 / (RESP_BASELINE_SECONDS * self.sample_rate))
+        b, a = [alpha], [1.0, alpha - 1.0]
+        if self._resp_zi is None:
+            self._resp_zi = (np.array([(1 - alpha) * resp[0]]), np.array([0.0]))
+        baseline, baseline_zi = lfilter(b, a, resp, zi=self._resp_zi[0])
+        centered = resp - baseline
+        level, level_zi = lfilter(b, a, np.abs(centered), zi=self._resp_zi[1])
+        self._resp_zi = (baseline_zi, level_zi)
+
+        # 向量化的滞回状态：高于 +h 置1，低于 -h 置0，其余沿用前一个状态
+        threshold = RESP_HYSTERESIS * level
+        high = centered > threshold
+        low = centered < -threshold
+        decided = np.maximum.accumulate(np.where(high | low, np.arange(len(resp)), -1))
+        state = np.where(decided >= 0, high[np.maximum(decided, 0)], self._resp_high)
+        rising = np.flatnonzero(np.diff(np.concatenate(([self._resp_high], state)).astype(int)) > 0)
+        self._resp_high = bool(state[-1])
+        return timestamps[rising].tolist()
+
+    def stats(self, window):
+        with self._lock:
+            rr = self._rr[window]
+            breaths = self._breaths[window]
+            successive = self._successive[window]
+            return {
+                'beats': len(rr),
+                'mean_bpm': self._bpm[window].mean,
+                'min_bpm': self._bpm[window].min,
+                'max_bpm': self._bpm[window].max,
+                'sdnn_ms': rr.std * 1000,
+                'rmssd_ms': math.sqrt(max(0.0, successive.mean)) * 1000 if len(successive) else math.nan,
+                'resp_rate': 60.0 / breaths.mean if len(breaths) else math.nan,
+            }
+
+    def summary(self):
+        return {window: self.stats(window) for window in self.windows}
+
+
+# 对一段已存储的数据（实时存储快照或录制）整体计算统计量，作为导出的汇总表
+# 返回 [(指标, 数值), ...]
+def summarize_range(source, data):
+    timestamps = data['timestamp']
+    if not len(timestamps):
+        return []
+    start, end = float(timestamps[0]), float(timestamps[-1])
+    duration = end - start
+    sample_rate = getattr(source, 'sample_rate', None) or (
+        (len(timestamps) - 1) / duration if duration > 0 else 250)
+    engine = HRVEngine(windows=(duration + 1.0,), sample_rate=sample_rate)
+    schema = schema_of(source)
+    # 优先使用采集时记录的R波；范围内没有记录的R波（如保存R波之前的旧录制）时现场检测
+    beat_times = rr = bpm = np.empty(0)
+    if hasattr(source, 'beats_in_range'):
+        beats = source.beats_in_range(start, end)
+        beat_times, rr, bpm = beats['timestamp'], beats['RR'], beats['BPM']
+    if not len(beat_times):
+        from qrs_detector import QRSDetector, LEARNING_PERIOD
+        # 检测器先用开头一段学习阈值，该段本身不输出R波
+        detector = QRSDetector(sample_rate)
+        learning = int(LEARNING_PERIOD * sample_rate)
+        ecg = data[schema.primary_name]
+        detector.process(timestamps[:learning], ecg[:learning])
+        beat_times, rr, bpm = detector.process(timestamps[learning:], ecg[learning:])
+    engine.update(beat_times, rr, bpm)
+    if schema.resp is not None:
+        engine.update([], [], [], timestamps, data[schema.resp_name])
+    stats = engine.stats(engine.windows[0])
+
+    rows = [('开始时间', datetime.fromtimestamp(start).strftime(TIME_FORMAT)),
+            ('结束时间', datetime.fromtimestamp(end).strftime(TIME_FORMAT)),
+            ('时长 (秒)', round(duration, 3))]
+    for key, label in STAT_LABELS:
+        value = stats[key]
+        if isinstance(value, float):
+            value = None if math.isnan(value) else round(value, 2)
+        rows.append((label, value))
+    return rows
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class RingBuffer:
+    # 固定长度的环形缓冲区：按写指针覆盖最旧数据，不做任何数组搬移
+    # 写指针之后留出 gap 个 NaN，形成监护仪式的扫描刷新缺口
+    def __init__(self, size, gap=0):
+        self.size = size
+        self.gap = gap
+        self.data = np.full(size, np.nan)
+        self.index = 0
+
+    def write(self, values):
+        values = np.asarray(values)[-self.size:]
+        n = len(values)
+        if n == 0:
+            return
+        end = self.index + n
+        if end <= self.size:
+            self.data[self.index:end] = values
+        else:
+            first = self.size - self.index
+            self.data[self.index:] = values[:first]
+            self.data[:n - first] = values[first:]
+        self.index = end % self.size
+
+        if self.gap:
+            self.data[(self.index + np.arange(self.gap)) % self.size] = np.nan
+
+
+class HysteresisLimits:
+    # y轴范围只在数据越界或明显收缩时才调整，避免每帧重算坐标轴
+    def __init__(self, margin=0.2, shrink_ratio=0.5):
+        self.margin = margin
+        self.shrink_ratio = shrink_ratio
+
+    def update(self, ax, data):
+        if np.all(np.isnan(data)):
+            return False
+        lo = np.nanmin(data)
+        hi = np.nanmax(data)
+        cur_lo, cur_hi = ax.get_ylim()
+        if lo >= cur_lo and hi <= cur_hi and (hi - lo) >= self.shrink_ratio * (cur_hi - cur_lo):
+            return False
+
+        span = (hi - lo) or 1.0
+        ax.set_ylim(lo - span * self.margin, hi + span * self.margin)
+        return True
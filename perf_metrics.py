@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+
+# 最近耗时的指数滑动平均系数
+EWMA_ALPHA = 0.1
+
+
+class _NullTimer:
+    # 关闭统计时 timer() 返回的空上下文，不做任何计时
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    # 热路径上的计数器、瞬时值和分阶段耗时；enabled 为 False 时各方法立即返回
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counters = {}
+        self._gauges = {}
+        # 名称 -> [次数, 总耗时, 最近一次, 最大值, 滑动平均]
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self._gauges[name] = value
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, seconds, seconds, seconds, seconds]
+                return
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = seconds
+            timer[3] = max(timer[3], seconds)
+            timer[4] += EWMA_ALPHA * (seconds - timer[4])
+
+    # with metrics.timer('parse'): ... 统计代码块耗时
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, name)
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def recent(self, name):
+        timer = self._timers.get(name)
+        return timer[4] if timer is not None else None
+
+    def snapshot(self):
+        with self._lock:
+            timers = {name: {'count': count, 'mean_ms': total / count * 1000, 'last_ms': last * 1000,
+                             'max_ms': peak * 1000, 'recent_ms': recent * 1000}
+                      for name, (count, total, last, peak, recent) in self._timers.items()}
+            return {'counters': dict(self._counters), 'gauges': dict(self._gauges), 'timers': timers}
+
+
+class StartupTimer:
+    # 启动阶段计时：mark(名称) 记录自上一阶段以来的耗时
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self):
+        phases = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        return f"启动耗时: {phases}, 共 {(self._last - self.start) * 1000:.0f}ms"
+
+
+def collect(sources):
+    # sources: {名称: Metrics}，汇总为一个可JSON序列化的字典
+    return {'timestamp': time.time(),
+            'sources': {name: metrics.snapshot() for name, metrics in list(sources.items())}}
+
+
+class MetricsLogger(threading.Thread):
+    # 周期性把所有指标追加写入日志文件，每行一个JSON对象
+    def __init__(self, sources, file_path, interval=5.0):
+        super().__init__(daemon=True)
+        self.sources = sources
+        self.file_path = file_path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                with open(self.file_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(collect(self.sources), ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f"性能日志写入错误: {e}")
+
+
+class MetricsServer(threading.Thread):
+    # 只监听本机的HTTP端点，GET 任意路径返回当前指标的JSON
+    def __init__(self, sources, port, host='127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        super().__init__(daemon=True)
+        sources_ref = sources
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(collect(sources_ref), ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
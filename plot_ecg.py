@@ -1,51 +1,146 @@
+from perf_metrics import StartupTimer
+startup = StartupTimer()
 import serial
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.animation import FuncAnimation
 import time
+import math
 from matplotlib.widgets import Button
-import pandas as pd
-from matplotlib.widgets import TextBox
 from datetime import datetime
-import winsound
+from concurrent.futures import ThreadPoolExecutor
+from acquisition import AcquisitionPipeline, discover_ports
+import os
+import sys
+from live_plot import RingBuffer, HysteresisLimits
+from channel_schema import DEFAULT_SCHEMA, SCHEMAS
+from perf_metrics import Metrics, MetricsLogger, MetricsServer
+from stream_server import StreamServer
+startup.mark('导入模块')
+
+# 设备采样率（Hz）与实时窗口显示时长（秒）
+SAMPLE_RATE = 250
+WINDOW_SECONDS = 10
+# 界面刷新间隔（毫秒），与采集速率无关
+FRAME_INTERVAL = 30
+# 录制文件保存目录，每次运行一个子目录，每台设备再分一个子目录
+RECORDING_DIR = 'recordings'
+# 同时采集的设备数上限；未发现任何串口时尝试的默认串口
+MAX_DEVICES = 4
+DEFAULT_PORT = 'COM8'
+
+# 警报控制变量
+ALARM_INTERVAL = 3  # 警报间隔时间（秒）
+BPM_LOW = 40
+BPM_HIGH = 120
+
+# 工频陷波频率（Hz）：国内50Hz，北美等60Hz地区改为60
+MAINS_FREQUENCY = 50
+# 串口设备的通道声明（channel_schema.SCHEMAS 中的名称，如 'default'、'8lead'、'12lead'），
+# 决定每个样本的字段、导联数和采样率；合成/回放来源自带声明
+DEVICE_SCHEMA = 'default'
+# 多导联时导联子图网格的列数（12导联为 4 行 × 3 列）
+LEAD_GRID_COLUMNS = 3
+
+# 性能指标：图上叠加显示（运行中按 m 键切换）、周期日志文件、本机HTTP端口；全部关闭时不做统计
+SHOW_METRICS = False
+METRICS_LOG = None
+METRICS_PORT = None
+METRICS_LOG_INTERVAL = 5
+# 叠加信息每隔多少帧刷新一次
+METRICS_REFRESH_FRAMES = 15
+# 心电子图上的滚动统计（窗口秒数）及其刷新间隔（帧），约每秒一次
+LIVE_STATS_WINDOW = 60
+STATS_REFRESH_FRAMES = 30
+# 实时推流（TCP/WebSocket）端口，None 时不启动；仅本机查看用 127.0.0.1，供护士站等远程查看时改为 '0.0.0.0'
+# 慢速订阅者的处理方式：'decimate' 先抽取降低数据率，'drop' 直接丢弃最旧的数据
+STREAM_PORT = None
+STREAM_HOST = '127.0.0.1'
+STREAM_BACKPRESSURE = 'decimate'
+# 每台设备在内存中保留最近多少秒的全分辨率数据，更早的部分从录制文件中读取；None 表示全部保留
+RETENTION_SECONDS = 30 * 60
+# 每台设备存储的内存上限（字节，含样本、R波和汇总金字塔），先于保留时长达到时以此为准
+STORE_MEMORY_LIMIT = 512 * 1024 * 1024
 
 # 设置中文字体
 plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
 plt.rcParams['axes.unicode_minus'] = False
 
-# 查询所有串口并输出
-def list_serial_ports():
-    ports = ['COM%s' % (i + 1) for i in range(256)]
-    result = []
-    for port in ports:
+# 界面线程与各设备读取线程分别统计，避免跨线程争用
+metrics_enabled = bool(SHOW_METRICS or METRICS_LOG or METRICS_PORT)
+ui_metrics = Metrics(metrics_enabled)
+metrics_sources = {'界面': ui_metrics}
+
+# 推流服务先于设备启动，设备接入时登记
+stream_server = None
+if STREAM_PORT:
+    try:
+        stream_server = StreamServer(STREAM_PORT, STREAM_HOST, STREAM_BACKPRESSURE, metrics=Metrics(metrics_enabled))
+        metrics_sources['推流'] = stream_server.metrics
+        stream_server.start()
+        print(f"实时推流: tcp://{STREAM_HOST}:{STREAM_PORT}  ws://{STREAM_HOST}:{STREAM_PORT}/")
+    except OSError as e:
+        print(f"推流端口错误: {e}")
+
+session_dir = os.path.join(RECORDING_DIR, datetime.now().strftime("%Y%m%d_%H%M%S"))
+pipelines = []
+
+
+# 每个串口一条独立的采集链路 - 使用异常处理
+# ports 为 None 时先查询所有串口；未发现任何串口时尝试默认串口
+def connect_devices(ports=None):
+    if ports is None:
+        discovery_start = time.perf_counter()
+        ports = discover_ports()
+        print(f"串口查询耗时: {(time.perf_counter() - discovery_start) * 1000:.0f}ms")
+        if ports:
+            print("可用串口:")
+            for port in ports:
+                print(port)
+
+    connected = []
+    for port in ports[:MAX_DEVICES] or [DEFAULT_PORT]:
         try:
-            s = serial.Serial(port)
-            s.close()
-            result.append(port)
-        except (OSError, serial.SerialException):
-            pass
-    return result
-
-# 输出所有串口
-serial_ports = list_serial_ports()
-if serial_ports:
-    print("可用串口:")
-    for port in serial_ports:
-        print(port)
-
-# 配置串口 - 使用异常处理
-try:
-    # 如果有可用串口，使用第一个可用串口，否则使用COM8
-    default_port = serial_ports[0] if serial_ports else 'COM8'
-    ser = serial.Serial(default_port, 115200, timeout=1)
-    print(f"成功连接到串口: {default_port}")
-except (OSError, serial.SerialException) as e:
-    print(f"串口连接错误: {e}")
-
-
-# 创建图表和布局
+            pipeline = AcquisitionPipeline(port, SAMPLE_RATE, session_dir, BPM_LOW, BPM_HIGH, ALARM_INTERVAL,
+                                           metrics=Metrics(metrics_enabled), mains_frequency=MAINS_FREQUENCY,
+                                           schema=SCHEMAS[DEVICE_SCHEMA], stream=stream_server,
+                                           retention=RETENTION_SECONDS, memory_limit=STORE_MEMORY_LIMIT)
+            pipeline.start()
+            connected.append(pipeline)
+            print(f"成功连接到串口: {port}")
+        except (OSError, ValueError, serial.SerialException) as e:
+            print(f"串口连接错误: {e}")
+    return connected
+
+
+def add_pipelines(connected):
+    pipelines.extend(connected)
+    for pipeline in connected:
+        metrics_sources[pipeline.name] = pipeline.metrics
+
+
+# 命令行指定串口时直接连接；否则在窗口显示后于后台查询串口，不阻塞首帧
+discovery = None
+if sys.argv[1:]:
+    add_pipelines(connect_devices(sys.argv[1:]))
+else:
+    discovery = ThreadPoolExecutor(max_workers=1).submit(connect_devices)
+startup.mark('连接设备')
+
+metrics_threads = []
+if METRICS_LOG:
+    metrics_threads.append(MetricsLogger(metrics_sources, METRICS_LOG, METRICS_LOG_INTERVAL))
+if METRICS_PORT:
+    try:
+        metrics_threads.append(MetricsServer(metrics_sources, METRICS_PORT))
+        print(f"性能指标: http://127.0.0.1:{METRICS_PORT}/")
+    except OSError as e:
+        print(f"性能指标端口错误: {e}")
+for thread in metrics_threads:
+    thread.start()
+
+
 fig = plt.figure(figsize=(14, 10))
-gs = plt.GridSpec(3, 1, height_ratios=[5, 5, 1.5], hspace=0.6)
 
 # 设置全局样式
 plt.style.use('ggplot')
@@ -53,36 +148,174 @@ plt.rcParams['font.size'] = 10
 plt.rcParams['axes.titlesize'] = 12
 plt.rcParams['axes.labelsize'] = 10
 
-# 配置子图
-ax1 = fig.add_subplot(gs[0])
-ax2 = fig.add_subplot(gs[1])
-line1, = ax1.plot([], [], 'r-', linewidth=1.5)
-line2, = ax2.plot([], [], 'b-', linewidth=1.5)
-
-# 设置图表属性
-ax1.set_title('心电图信号', pad=10, fontsize=12, fontweight='bold')
-ax2.set_title('呼吸波形', pad=10, fontsize=12, fontweight='bold')
-ax1.set_xlabel('采样点')
-ax2.set_xlabel('采样点')
-ax1.set_ylabel('幅值')
-ax2.set_ylabel('幅值')
-
-ax1.set_xlim(0, 500)
-ax1.grid(True, alpha=0.3)
-ax2.set_xlim(0, 500)
-ax2.grid(True, alpha=0.3)
-
-# 启用自动缩放
-ax1.set_autoscale_on(True)
-ax2.set_autoscale_on(True)
-
-# 数据缓冲区
-data_buffer1 = np.zeros(500)
-data_buffer2 = np.zeros(500)
-
-# 添加按钮区域
-button_ax = fig.add_subplot(gs[2])
-button_ax.axis('off')
+# 所有设备共用y轴滞回逻辑
+ylimits = HysteresisLimits()
+
+
+class DevicePanel:
+    # 单台设备的实时显示：心电导联（多导联时排成网格）与呼吸子图，每个显示通道一个环形缓冲区
+    def __init__(self, pipeline, ecg_spec, resp_spec):
+        self.pipeline = pipeline
+        prefix = f"{pipeline.name} " if pipeline is not None and len(pipelines) > 1 else ""
+        schema = pipeline.schema if pipeline is not None else DEFAULT_SCHEMA
+        # 读取线程交给界面的是滤波后的通道，列顺序与 schema.filtered 一致
+        lead_columns = [k for k, i in enumerate(schema.filtered) if schema.channels[i].kind == 'ecg']
+        n_leads = len(lead_columns)
+        n_cols = min(n_leads, LEAD_GRID_COLUMNS)
+        n_rows = math.ceil(n_leads / n_cols)
+        lead_grid = ecg_spec.subgridspec(n_rows, n_cols, hspace=0.5, wspace=0.15)
+        self.axes = [fig.add_subplot(lead_grid[k // n_cols, k % n_cols]) for k in range(n_leads)]
+        self.columns = list(lead_columns)
+        titles = [prefix + '心电图信号'] if n_leads == 1 else [
+            prefix + schema.names[schema.filtered[k]] for k in lead_columns]
+        colors = ['r-'] * n_leads
+        if schema.resp is not None:
+            self.axes.append(fig.add_subplot(resp_spec))
+            self.columns.append(schema.filtered.index(schema.resp))
+            titles.append(prefix + '呼吸波形')
+            colors.append('b-')
+        # 数据缓冲区：按设备采样率确定长度的环形缓冲，写指针后留出扫描缺口
+        sample_rate = schema.sample_rate if pipeline is not None else SAMPLE_RATE
+        window_size = int(sample_rate * WINDOW_SECONDS)
+        self.buffers = [RingBuffer(window_size, gap=max(1, window_size // 50)) for _ in self.axes]
+        # 暂停期间读取线程照常处理，待显示的批次只保留最近一屏
+        if pipeline is not None:
+            pipeline.reader.max_pending = window_size
+        # x轴固定，每帧只更新y数据
+        x_seconds = np.arange(window_size) / sample_rate
+        # 导联网格中的小图只保留标题，坐标轴标签留给单导联和呼吸子图
+        compact = n_leads > 1
+        self.lines = []
+        for k, (ax, buffer, color, title) in enumerate(zip(self.axes, self.buffers, colors, titles)):
+            line, = ax.plot(x_seconds, buffer.data, color, linewidth=1.0 if compact else 1.5)
+            self.lines.append(line)
+
+            # 设置图表属性
+            ax.set_xlim(0, WINDOW_SECONDS)
+            ax.grid(True, alpha=0.3)
+            # 关闭自动缩放，y轴范围由滞回逻辑控制
+            ax.set_autoscale_on(False)
+            if compact and k < n_leads:
+                ax.set_title(title, pad=3, fontsize=9, fontweight='bold')
+                ax.tick_params(labelsize=7)
+                continue
+            ax.set_title(title, pad=10, fontsize=12, fontweight='bold')
+            ax.set_xlabel('时间 (秒)')
+            ax.set_ylabel('幅值')
+        # 最近一分钟的心率、HRV、呼吸频率，作为动画的一部分随blit刷新；导联网格中放不下时显示在呼吸子图上
+        stats_ax = self.axes[-1] if compact else self.axes[0]
+        self.stats_text = stats_ax.text(0.01, 0.97, '', transform=stats_ax.transAxes, va='top',
+                                        fontsize=9, family='monospace', animated=True)
+
+    def update_stats(self):
+        if self.pipeline is None:
+            return
+        stats = self.pipeline.analytics.stats(LIVE_STATS_WINDOW)
+
+        def fmt(value, digits=0):
+            return '--' if math.isnan(value) else f"{value:.{digits}f}"
+
+        heart_range = f" ({fmt(stats['min_bpm'])}-{fmt(stats['max_bpm'])})" if stats['beats'] else ""
+        self.stats_text.set_text(
+            f"心率 {fmt(stats['mean_bpm'])}{heart_range}  "
+            f"SDNN {fmt(stats['sdnn_ms'])}ms  RMSSD {fmt(stats['rmssd_ms'])}ms  "
+            f"呼吸 {fmt(stats['resp_rate'])}/min")
+
+    # 写入上一帧以来到达的样本，返回y轴范围是否发生变化
+    def update(self):
+        if self.pipeline is None:
+            return False
+        # 取走上一帧以来后台线程处理好的全部样本
+        batch = self.pipeline.reader.drain()
+        if batch is None:
+            return False
+
+        _, values = batch
+        # 一帧内到达的样本超过显示窗口时，较早的部分不会显示
+        if len(values) > self.buffers[0].size:
+            ui_metrics.count('display_dropped', len(values) - self.buffers[0].size)
+        changed = False
+        for ax, buffer, line, column in zip(self.axes, self.buffers, self.lines, self.columns):
+            # 更新数据缓冲区，一帧内到达的样本一次性写入
+            buffer.write(values[:, column])
+            line.set_ydata(buffer.data)
+            changed = ylimits.update(ax, buffer.data) or changed
+        return changed
+
+
+panels = []
+artists = []
+layout_axes = []
+
+# 性能叠加信息：作为动画的一部分随blit刷新；blit 按坐标轴分组重绘，因此放在图顶部一条专用的空白坐标轴上
+metrics_ax = fig.add_axes([0, 0.9, 1, 0.1])
+metrics_ax.axis('off')
+metrics_text = metrics_ax.text(0.01, 0.9, '', fontsize=8, va='top', family='monospace',
+                               visible=SHOW_METRICS, animated=True)
+# 后台查询串口期间的提示
+status_text = fig.text(0.5, 0.55, '正在查找串口…' if discovery is not None else '', ha='center', fontsize=14)
+
+
+# 创建图表和布局：每台设备一行，心电与呼吸左右排列；单台设备时保持上下排列
+# 设备列表变化（后台查询完成）时移除旧子图重新布局
+def layout_panels():
+    for ax in layout_axes:
+        ax.remove()
+    n_devices = max(1, len(pipelines))
+    if n_devices == 1:
+        # 多导联时心电网格按行数加高
+        lead_rows = math.ceil(len(pipelines[0].schema.leads) / LEAD_GRID_COLUMNS) if pipelines else 1
+        gs = plt.GridSpec(3, 1, height_ratios=[5 * max(1, lead_rows / 2), 5, 1.5], hspace=0.6)
+        panel_specs = [(gs[0], gs[1])]
+        button_spec = gs[2]
+    else:
+        gs = plt.GridSpec(n_devices + 1, 2, height_ratios=[5] * n_devices + [1.5], hspace=0.6)
+        panel_specs = [(gs[i, 0], gs[i, 1]) for i in range(n_devices)]
+        button_spec = gs[n_devices, :]
+
+    panels[:] = [DevicePanel(pipeline, *spec) for pipeline, spec in zip(pipelines or [None], panel_specs)]
+    artists[:] = [artist for panel in panels for artist in panel.lines + [panel.stats_text]] + [metrics_text]
+
+    # 添加按钮区域
+    button_ax = fig.add_subplot(button_spec)
+    button_ax.axis('off')
+    layout_axes[:] = [ax for panel in panels for ax in panel.axes] + [button_ax]
+
+
+layout_panels()
+
+
+def format_metrics():
+    fps_interval = ui_metrics.recent('frame_interval')
+    lines = [f"帧处理 {(ui_metrics.recent('frame') or 0) * 1000:.1f}ms  "
+             f"重绘 {(ui_metrics.recent('redraw') or 0) * 1000:.1f}ms  "
+             f"FPS {1 / fps_interval if fps_interval else 0:.1f}  "
+             f"显示丢弃 {ui_metrics.counter('display_dropped')}"]
+    for pipeline in pipelines:
+        snapshot = pipeline.metrics.snapshot()
+        gauges, counters, timers = snapshot['gauges'], snapshot['counters'], snapshot['timers']
+        stage = {name: timers[name]['recent_ms'] if name in timers else 0
+                 for name in ('parse', 'filter', 'store', 'detect')}
+        lines.append(f"{pipeline.name}: 积压 {gauges.get('backlog_bytes', 0)}B  "
+                     f"解析 {counters.get('samples_parsed', 0)}  格式错误 {counters.get('malformed', 0)}  "
+                     f"丢失 {counters.get('samples_dropped', 0)}  "
+                     f"解析/滤波/存储/检测 {stage['parse']:.2f}/{stage['filter']:.2f}/"
+                     f"{stage['store']:.2f}/{stage['detect']:.2f}ms  "
+                     f"内存 {gauges.get('store_bytes', 0) / 1e6:.1f}MB（最近 {gauges.get('store_hot_seconds', 0) / 60:.0f}分钟）  "
+                     f"已转存 {gauges.get('store_spilled_samples', 0)}")
+    if stream_server is not None:
+        gauges = stream_server.metrics.snapshot()['gauges']
+        lines.append(f"推流: 订阅 {gauges.get('stream_clients', 0)}  "
+                     f"丢弃 {stream_server.metrics.counter('stream_dropped')}  "
+                     f"最大抽取 {gauges.get('stream_max_decimation', 1)}")
+    return '\n'.join(lines)
+
+
+def toggle_metrics(event):
+    if event.key == 'm' and metrics_enabled:
+        metrics_text.set_visible(not metrics_text.get_visible())
+
+fig.canvas.mpl_connect('key_press_event', toggle_metrics)
 
 # 自定义按钮样式
 button_style = {'color': 'white',
@@ -106,17 +339,37 @@ for btn in [btn_start, btn_pause, btn_export]:
 # 动画控制变量
 is_running = True
 
-# 警报控制变量
-last_alarm_time = 0
-ALARM_INTERVAL = 3  # 警报间隔时间（秒）
+def stop_pipelines(stopped):
+    for pipeline in stopped:
+        pipeline.stop()
+
 
-runtime_data = {}
+def close_pipelines(event):
+    stop_pipelines(pipelines)
+    # 窗口关闭时后台查询仍未完成，则在其完成后立即停止新连接的设备
+    if discovery is not None:
+        discovery.add_done_callback(lambda future: stop_pipelines(future.result()))
+    for thread in metrics_threads:
+        thread.stop()
+    if stream_server is not None:
+        stream_server.stop()
 
+fig.canvas.mpl_connect('close_event', close_pipelines)
+
+
+export_window = None
 
 def export_data(event):
+    global export_window
     try:
+        import tkinter
         from ecg_export import show_export_window
-        show_export_window(runtime_data)
+        # 导出窗口作为实时窗口的子窗口共用同一事件循环，打开期间动画和采集不受影响；已打开时提到前台
+        if export_window is not None and not export_window.closed:
+            export_window.window.lift()
+            return
+        master = root if isinstance(root, tkinter.Misc) else None
+        export_window = show_export_window({pipeline.name: pipeline.store for pipeline in pipelines}, master)
     except Exception as e:
         print(f"导出错误: {e}")
 
@@ -137,70 +390,56 @@ btn_start.on_clicked(start)
 btn_pause.on_clicked(pause)
 btn_export.on_clicked(export_data)
 
+last_frame_time = None
+
+
+# 后台查询串口完成后接入设备并重新布局
+def finish_discovery():
+    global discovery
+    connected = discovery.result()
+    discovery = None
+    add_pipelines(connected)
+    status_text.set_text('' if connected else '未连接到任何串口')
+    layout_panels()
+    fig.canvas.draw()
+
+
 def update(frame): 
-    global data_buffer1, data_buffer2, last_alarm_time
- 
-    if ser.in_waiting:
-        try:
-            # 读取一行数据，尝试多种编码方式
-            raw_data = ser.readline()
-            try:
-                line_data = raw_data.decode('utf-8').strip()
-            except UnicodeDecodeError:
-                try:
-                    line_data = raw_data.decode('gbk').strip()
-                except UnicodeDecodeError:
-                    line_data = raw_data.decode('latin1').strip()
-            
-            values = line_data.split(',')
-            
-            if len(values) >= 3:
-                # 获取心电信号和呼吸波数据
-                ecg_value = float(values[0])
-                resp_value = float(values[1])
-                bpm_value = float(values[2])
-
-                # 在bpm < 40 或者 > 120 时，嘀嘀嘀 警报
-                if bpm_value < 40 or bpm_value > 120:
-                    current_time = time.time()
-                    if current_time - last_alarm_time >= ALARM_INTERVAL:
-                        winsound.Beep(1000, 500)
-                        last_alarm_time = current_time
-
-    
-
-                runtime_data[time.time()] = {
-                    'ECG': ecg_value,
-                    'Respiration': resp_value,
-                    'BPM': bpm_value
-                }
-                
-                # 更新数据缓冲区
-                data_buffer1 = np.roll(data_buffer1, -1)
-                data_buffer1[-1] = ecg_value
-                data_buffer2 = np.roll(data_buffer2, -1)
-                data_buffer2[-1] = resp_value
-                
-                # 更新图表
-                line1.set_data(np.arange(len(data_buffer1)), data_buffer1)
-                line2.set_data(np.arange(len(data_buffer2)), data_buffer2)
-                # 更新y轴范围
-                ax1.relim()
-                ax1.autoscale_view()
-                ax2.relim()
-                ax2.autoscale_view()
-                
-                # 强制重绘以更新坐标轴
-                fig.canvas.draw_idle()
-        except Exception as e:
-            print(f"数据处理错误: {e}")
-    
-    return [line1, line2]
-
-ani = FuncAnimation(fig, update, frames=500, interval=10)
+    global last_frame_time
+    frame_start = time.perf_counter()
+    if last_frame_time is not None:
+        ui_metrics.record('frame_interval', frame_start - last_frame_time)
+    else:
+        startup.mark('首帧')
+        print(startup.report())
+    last_frame_time = frame_start
+    try:
+        if discovery is not None and discovery.done():
+            finish_discovery()
+        # 所有设备共用一个动画和一次blit，y轴范围变化时才整图重绘
+        limits_changed = False
+        with ui_metrics.timer('frame'):
+            for panel in panels:
+                limits_changed = panel.update() or limits_changed
+        if limits_changed:
+            with ui_metrics.timer('redraw'):
+                fig.canvas.draw()
+        if frame % STATS_REFRESH_FRAMES == 0:
+            for panel in panels:
+                panel.update_stats()
+        if metrics_text.get_visible() and frame % METRICS_REFRESH_FRAMES == 0:
+            metrics_text.set_text(format_metrics())
+    except Exception as e:
+        print(f"数据处理错误: {e}")
+
+    return artists
+
+startup.mark('创建界面')
+ani = FuncAnimation(fig, update, frames=500, interval=FRAME_INTERVAL, blit=True)
 
 # 设置窗口标题
-root = plt.get_current_fig_manager().window
+# 非 Tk 后端（如无界面运行的 Agg）没有窗口对象
+root = getattr(plt.get_current_fig_manager(), 'window', None)
 #root.title("心电图实时监测")
 
 # 调整布局，但不使用tight_layout
@@ -1,12 +1,16 @@
 from tkinter import Toplevel, Frame, messagebox, Button
 from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+from datetime import datetime
 import numpy as np
-import pandas as pd
+from decimation import minmax_decimate
+from channel_schema import schema_of
 
 class ECGPlotter:
+    # figure 为后台线程中预先用 build_figure 生成的 (fig, ax)，缺省时在此生成
     @staticmethod
-    def create_plot_window(parent_window, data_list):
+    def create_plot_window(parent_window, data_list, pyramid=None, figure=None):
         if not data_list:
             ECGPlotter.show_no_data_message()
             return
@@ -24,54 +28,94 @@ class ECGPlotter:
         toolbar_frame = Frame(plot_window, bg="#e0e0e0")
         toolbar_frame.pack(fill="x", padx=5, pady=5)
         
+        # 创建matplotlib图表
+        fig, ax = figure if figure is not None else ECGPlotter.build_figure(data_list, pyramid)
+        
         # 添加保存按钮
         save_btn = Button(toolbar_frame, text="保存图表", command=lambda: ECGPlotter.save_figure(fig))
         save_btn.pack(side="left", padx=5)
         
-        # 创建matplotlib图表
-        fig = Figure(figsize=(10, 6), dpi=100)
-        ax = fig.add_subplot(111)
-        ax.set_title('心电图数据', pad=10, fontsize=12, fontweight='bold')
-        ax.set_xlabel('时间')
-        ax.set_ylabel('幅值')
-        ax.grid(True, alpha=0.3)
-        
         # 将matplotlib图表嵌入新窗口
         canvas = FigureCanvasTkAgg(fig, master=plot_frame)
         canvas.draw()
         canvas.get_tk_widget().pack(fill="both", expand=True)
         
-        # 绘制数据
-        df = pd.DataFrame(data_list)
-        df = df.sort_values('Time')
-        
-        if 'ECG' in df.columns and not pd.api.types.is_numeric_dtype(df['ECG']):
-            df['ECG'] = pd.to_numeric(df['ECG'], errors='coerce')
+        # 添加matplotlib导航工具栏（平移/缩放）
+        NavigationToolbar2Tk(canvas, toolbar_frame).pack(side="left", padx=5)
         
-        ax.plot(range(len(df)), df['ECG'].values, 'r-', linewidth=1)
+        return plot_window, fig, ax
+    
+    @staticmethod
+    def build_figure(data_list, pyramid=None, schema=None):
+        # 只依赖Figure对象，界面和无界面批处理共用同一套绘图逻辑
+        # 每个心电导联一个子图、共用x轴；返回的 ax 为主导联（R波检测所用导联）的子图
+        if schema is None:
+            schema = schema_of(data_list)
+        leads = [schema.names[i] for i in schema.leads]
+        fig = Figure(figsize=(10, max(6, 1.2 * len(leads))), dpi=100)
+        axes = fig.subplots(len(leads), 1, sharex=True, squeeze=False)[:, 0]
+        axes[0].set_title('心电图数据', pad=10, fontsize=12, fontweight='bold')
+        axes[-1].set_xlabel('时间')
         
-        # 设置x轴刻度
-        ECGPlotter.set_x_axis_labels(ax, df)
+        # 设置x轴刻度（共用x轴，只在最下方的子图显示）
+        ECGPlotter.set_x_axis_labels(axes[-1], data_list['timestamp'])
         
+        ax = axes[0]
+        for lead_ax, name in zip(axes, leads):
+            lead_ax.set_ylabel(name if len(leads) > 1 else '幅值')
+            lead_ax.grid(True, alpha=0.3)
+            # 绘制数据：按屏幕像素抽稀，缩放时从全分辨率数据重新抽稀
+            line, = lead_ax.plot([], [], 'r-', linewidth=1)
+            ECGPlotter.attach_decimation(lead_ax, line, data_list[name], data_list['timestamp'], pyramid, name)
+            if name == schema.primary_name:
+                ax = lead_ax
         fig.tight_layout()
-        return plot_window, fig, ax
+        
+        # 在主导联上标记主机端检测到的R波
+        if 'Beat' in data_list:
+            beat_positions = np.flatnonzero(data_list['Beat'])
+            ax.plot(beat_positions, data_list[schema.primary_name][beat_positions], 'bv', markersize=4, label='R波')
+        
+        return fig, ax
     
     @staticmethod
-    def set_x_axis_labels(ax, df):
-        num_ticks = min(5, len(df))
-        if len(df) > 1:
-            tick_positions = np.linspace(0, len(df)-1, num_ticks, dtype=int)
-            time_labels = [df['Time'].iloc[i] for i in tick_positions]
-            simplified_labels = []
-            for label in time_labels:
-                if ' ' in label:
-                    date_part, time_part = label.split(' ')
-                    simplified_labels.append(time_part)
-                else:
-                    simplified_labels.append(label)
+    def attach_decimation(ax, line, y, timestamps=None, pyramid=None, channel='ECG'):
+        def redecimate(ax):
+            lo, hi = ax.get_xlim()
+            start = max(0, int(np.floor(lo)))
+            end = min(len(y), int(np.ceil(hi)) + 1)
             
-            ax.set_xticks(tick_positions)
-            ax.set_xticklabels(simplified_labels, rotation=45)
+            # 长时间范围直接使用金字塔中合适层级的包络，代价与样本数无关
+            if pyramid is not None and end - start > 1:
+                level = pyramid.select_level(timestamps[start], timestamps[end - 1], ax.bbox.width)
+                if level is not None:
+                    bucket_times, envelope = level.envelope(channel, timestamps[start], timestamps[end - 1])
+                    line.set_data(np.searchsorted(timestamps, bucket_times), envelope)
+                    return
+            
+            x_visible, y_visible = minmax_decimate(y, start, end, ax.bbox.width)
+            line.set_data(x_visible, y_visible)
+        
+        ax.callbacks.connect('xlim_changed', redecimate)
+        
+        # y轴范围按全量数据确定一次，之后不随抽稀结果变化
+        y_min, y_max = np.nanmin(y), np.nanmax(y)
+        margin = (y_max - y_min) * 0.05 or 1.0
+        ax.set_ylim(y_min - margin, y_max + margin)
+        ax.set_xlim(0, max(len(y) - 1, 1))
+    
+    @staticmethod
+    def set_x_axis_labels(ax, timestamps):
+        # x轴为样本序号，刻度标签按需格式化为时间，缩放后自动跟随
+        def format_tick(position, _):
+            index = int(round(position))
+            if 0 <= index < len(timestamps):
+                return datetime.fromtimestamp(timestamps[index]).strftime("%H:%M:%S")
+            return ""
+        
+        ax.xaxis.set_major_locator(MaxNLocator(5, integer=True))
+        ax.xaxis.set_major_formatter(FuncFormatter(format_tick))
+        ax.tick_params(axis='x', labelrotation=45)
     
     @staticmethod
     def show_no_data_message():
@@ -0,0 +1,196 @@
+from collections import deque
+import numpy as np
+
+# Pan-Tompkins 风格的流式QRS检测：
+#   5-15Hz带通 -> 五点微分 -> 平方 -> 150ms滑动窗口积分 -> 积分与带通两套自适应阈值 + 200ms不应期
+#   -> T波鉴别（距上次R波不足 360ms 且最大斜率不到上次QRS一半的视为T波）
+#   -> 回溯搜索（超过近期RR中位数的 1.66 倍仍无R波时，在其间以一半阈值找最高的峰补检）
+# 每批样本整体向量化处理，滤波器状态和各级尾部样本在批次之间延续
+BANDPASS = (5.0, 15.0)
+INTEGRATION_WINDOW = 0.150
+REFRACTORY_PERIOD = 0.200
+LEARNING_PERIOD = 2.0
+T_WAVE_WINDOW = 0.360
+T_WAVE_SLOPE_RATIO = 0.5
+SEARCHBACK_FACTOR = 1.66
+RR_AVERAGE_BEATS = 8
+
+
+class QRSDetector:
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        # 滤波器在处理第一批样本时才设计（scipy.signal 导入较慢，放到读取线程上进行）
+        self.sos = None
+        self._zi = None
+        self._delay = 0
+        self._window = max(1, int(round(INTEGRATION_WINDOW * sample_rate)))
+        self._refractory = REFRACTORY_PERIOD
+        self._derivative_kernel = np.array([1, 2, 0, -2, -1]) * (sample_rate / 8.0)
+
+        # 跨批次延续的尾部数据
+        self._filtered_tail = np.zeros(4)
+        self._squared_tail = np.zeros(self._window - 1)
+        self._integrated_tail = np.empty(0)
+        self._history_times = np.empty(0)
+        self._history_filtered = np.empty(0)
+        self._history_slope = np.empty(0)
+
+        # 自适应阈值状态
+        self._learning = []
+        self._learning_samples = int(LEARNING_PERIOD * sample_rate)
+        self.signal_peak = None
+        self.noise_peak = None
+        # 带通信号幅度上的信号峰/噪声峰，候选峰须同时超过两套阈值
+        self.filtered_signal_peak = None
+        self.filtered_noise_peak = None
+        self.last_beat_time = None
+        self._last_slope = None
+        self._rr = deque(maxlen=RR_AVERAGE_BEATS)
+        # 上次R波以来低于阈值但高于一半阈值的峰：(R波时间, 积分峰值, 带通幅度, 斜率)，供回溯搜索
+        self._skipped = []
+
+    def _design_filter(self):
+        from scipy.signal import butter, sosfreqz
+        self.sos = butter(2, BANDPASS, btype='bandpass', fs=self.sample_rate, output='sos')
+        # 带通滤波器在通带中心的群延迟（样本数），回溯R波位置时扣除
+        center = np.mean(BANDPASS)
+        _, response = sosfreqz(self.sos, worN=[center - 0.5, center + 0.5], fs=self.sample_rate)
+        phase_step = np.angle(response[1] / response[0])
+        self._delay = int(round(-phase_step * self.sample_rate / (2 * np.pi)))
+
+    @property
+    def threshold(self):
+        return self.noise_peak + 0.25 * (self.signal_peak - self.noise_peak)
+
+    @property
+    def filtered_threshold(self):
+        return self.filtered_noise_peak + 0.25 * (self.filtered_signal_peak - self.filtered_noise_peak)
+
+    # 处理一批样本，返回本批检测到的R波时间戳、RR间期（秒）和心率
+    def process(self, timestamps, ecg):
+        ecg = np.nan_to_num(np.asarray(ecg, dtype=float))
+        timestamps = np.asarray(timestamps, dtype=float)
+        if not len(ecg):
+            return np.empty(0), np.empty(0), np.empty(0)
+        from scipy.signal import sosfilt, sosfilt_zi
+        if self.sos is None:
+            self._design_filter()
+        if self._zi is None:
+            self._zi = sosfilt_zi(self.sos) * ecg[0]
+
+        filtered, self._zi = sosfilt(self.sos, ecg, zi=self._zi)
+        extended = np.concatenate((self._filtered_tail, filtered))
+        self._filtered_tail = extended[-4:]
+        derivative = np.convolve(extended, self._derivative_kernel, mode='valid')
+
+        squared = np.concatenate((self._squared_tail, derivative ** 2))
+        self._squared_tail = squared[-(self._window - 1):] if self._window > 1 else np.empty(0)
+        cumulative = np.concatenate(([0.0], np.cumsum(squared)))
+        integrated = (cumulative[self._window:] - cumulative[:-self._window]) / self._window
+
+        # 保留最近一个积分窗口的带通信号，用于把积分峰回溯到真实R波位置
+        history_times = np.concatenate((self._history_times, timestamps))
+        history_filtered = np.concatenate((self._history_filtered, np.abs(filtered)))
+        history_slope = np.concatenate((self._history_slope, np.abs(derivative)))
+        offset = len(self._history_times)
+        keep = self._window + self._delay + 1
+        self._history_times = history_times[-keep:]
+        self._history_filtered = history_filtered[-keep:]
+        self._history_slope = history_slope[-keep:]
+
+        if self.signal_peak is None:
+            self._learn(integrated, np.abs(filtered))
+            self._integrated_tail = integrated[-2:]
+            return np.empty(0), np.empty(0), np.empty(0)
+
+        # 局部极大值判定需要左右各一个样本，最后一个样本连同其左邻留到下一批判定
+        signal = np.concatenate((self._integrated_tail, integrated))
+        tail_length = len(self._integrated_tail)
+        self._integrated_tail = signal[-2:]
+        if len(signal) < 3:
+            return np.empty(0), np.empty(0), np.empty(0)
+        candidates = np.flatnonzero((signal[1:-1] > signal[:-2]) & (signal[1:-1] >= signal[2:])) + 1
+
+        previous = self.last_beat_time if self.last_beat_time is not None else np.nan
+        beats = []
+        for index in candidates:
+            peak = signal[index]
+            position = index - tail_length + offset
+            self._search_back(history_times[min(position, len(history_times) - 1)], beats)
+            beat_time, amplitude = self._locate_r_peak(history_times, history_filtered, position)
+            if peak <= 0.5 * self.threshold or amplitude <= 0.5 * self.filtered_threshold:
+                self._update_noise(peak, amplitude)
+                continue
+            since = beat_time - self.last_beat_time if self.last_beat_time is not None else np.inf
+            if since < self._refractory:
+                continue
+            slope = self._max_slope(history_slope, position)
+            if since < T_WAVE_WINDOW and slope < T_WAVE_SLOPE_RATIO * self._last_slope:
+                # T波：按噪声峰更新，也不参与回溯
+                self._update_noise(peak, amplitude)
+            elif peak > self.threshold and amplitude > self.filtered_threshold:
+                self._accept(beat_time, peak, amplitude, slope, beats)
+            else:
+                self._update_noise(peak, amplitude)
+                self._skipped.append((beat_time, peak, amplitude, slope))
+        self._search_back(history_times[-1], beats)
+
+        beats = np.array(beats)
+        if not len(beats):
+            return beats, np.empty(0), np.empty(0)
+        rr = np.diff(np.concatenate(([previous], beats)))
+        with np.errstate(invalid='ignore'):
+            return beats, rr, 60.0 / rr
+
+    # 回溯补检的R波按更快的速度更新信号峰（Pan-Tompkins 中的 0.25）
+    def _accept(self, beat_time, peak, amplitude, slope, beats, searchback=False):
+        if self.last_beat_time is not None:
+            self._rr.append(beat_time - self.last_beat_time)
+        beats.append(beat_time)
+        self.last_beat_time = beat_time
+        weight = 0.25 if searchback else 0.125
+        self.signal_peak = weight * peak + (1 - weight) * self.signal_peak
+        self.filtered_signal_peak = weight * amplitude + (1 - weight) * self.filtered_signal_peak
+        self._last_slope = slope
+        self._skipped = []
+
+    def _update_noise(self, peak, amplitude):
+        self.noise_peak = 0.125 * peak + 0.875 * self.noise_peak
+        self.filtered_noise_peak = 0.125 * amplitude + 0.875 * self.filtered_noise_peak
+
+    # 距上次R波已超过近期RR中位数的 SEARCHBACK_FACTOR 倍时，把其间最高的次阈值峰补为R波
+    # （攒满 RR_AVERAGE_BEATS 个RR后才启用，并用中位数，学习期和个别误检的短RR不会把回溯间隔拉短）
+    def _search_back(self, now, beats):
+        if not self._skipped or len(self._rr) < self._rr.maxlen:
+            return
+        if now - self.last_beat_time <= SEARCHBACK_FACTOR * np.median(self._rr):
+            return
+        beat_time, peak, amplitude, slope = max(self._skipped, key=lambda skipped: skipped[1])
+        self._accept(beat_time, peak, amplitude, slope, beats, searchback=True)
+
+    def _learn(self, integrated, filtered):
+        self._learning.append((integrated, filtered))
+        if sum(len(chunk) for chunk, _ in self._learning) < self._learning_samples:
+            return
+        learned = np.concatenate([chunk for chunk, _ in self._learning])
+        learned_filtered = np.concatenate([chunk for _, chunk in self._learning])
+        self._learning = []
+        self.signal_peak = learned.max() / 3.0
+        self.noise_peak = learned.mean() / 2.0
+        self.filtered_signal_peak = learned_filtered.max() / 3.0
+        self.filtered_noise_peak = learned_filtered.mean() / 2.0
+
+    # 积分峰之前一个积分窗口内微分的最大幅度，即该波群的最大斜率
+    def _max_slope(self, slope, position):
+        lo = max(0, position - self._window)
+        hi = min(len(slope), position + 1)
+        return slope[lo:hi].max() if hi > lo else 0.0
+
+    # 返回R波时间及其带通幅度
+    def _locate_r_peak(self, times, filtered, position):
+        lo = max(0, position - self._window)
+        hi = min(len(filtered), position + 1)
+        if hi > lo:
+            position = lo + int(np.argmax(filtered[lo:hi]))
+        position = min(position, len(filtered) - 1)
+        return times[max(0, position - self._delay)], filtered[position]
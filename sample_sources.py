@@ -0,0 +1,231 @@
+import os
+import select
+import threading
+import time
+import numpy as np
+import serial
+from binary_protocol import encode_frames
+from channel_schema import DEFAULT_SCHEMA, LEADS_8, LEADS_12, infer_schema, lead_schema
+
+# 可替换的样本来源：与 serial.Serial 相同的 in_waiting / read / close 接口，SerialReader 无需区分
+# open_source 支持的来源描述：
+#   COM3 或 /dev/ttyUSB0          真实串口
+#   synthetic[:采样率[:噪声[:导联数]]]  合成心电信号，导联数为 8 或 12 时生成多导联数据
+#   replay:<录制目录>[@倍速|max]   回放已录制的会话
+#   bin:<上述合成/回放描述>         以二进制帧代替文本行发送
+#   pty:<上述任一描述>              经由本地伪终端走真实串口路径
+MAX_CHUNK_SAMPLES = 8192
+
+
+# 每行按列顺序输出各通道，最后一列（心率）保留一位小数
+def format_lines(values):
+    line = ','.join(['%.4f'] * (values.shape[1] - 1) + ['%.1f']) + '\n'
+    return ''.join(line % tuple(row) for row in values.tolist()).encode('ascii')
+
+
+class GeneratedSource:
+    # 按墙钟时间节拍产生文本行（binary 为 True 时产生二进制帧）；speed 为回放倍速，None 表示不限速
+    # schema 声明产生数据的通道排列，采集端按此解析
+    def __init__(self, sample_rate, speed=1.0, timeout=1.0, schema=DEFAULT_SCHEMA):
+        self.sample_rate = sample_rate
+        self.schema = schema.with_sample_rate(sample_rate)
+        self.speed = speed
+        self.timeout = timeout
+        self.binary = False
+        self._start_time = time.time()
+        self._produced = 0
+        self._buffer = b''
+        self._finished = False
+
+    def generate(self, start, count):
+        raise NotImplementedError
+
+    def _due(self):
+        if self.speed is None:
+            return MAX_CHUNK_SAMPLES
+        elapsed = time.time() - self._start_time
+        return min(int(elapsed * self.sample_rate * self.speed) - self._produced, MAX_CHUNK_SAMPLES)
+
+    def _fill(self):
+        if self._buffer or self._finished:
+            return
+        count = self._due()
+        if count <= 0:
+            return
+        values = self.generate(self._produced, count)
+        if not len(values):
+            self._finished = True
+            return
+        self._buffer = encode_frames(values, self._produced) if self.binary else format_lines(values)
+        self._produced += len(values)
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        deadline = time.time() + self.timeout
+        self._fill()
+        # 与串口超时行为一致：无数据时最多等待 timeout 秒
+        while not self._buffer and time.time() < deadline:
+            time.sleep(min(0.005, self.timeout))
+            self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        self._finished = True
+
+
+class SyntheticECGSource(GeneratedSource):
+    # P-QRS-T 高斯波形叠加呼吸调制、基线漂移和白噪声
+    # 每个波为 (幅值, 中心时刻, 宽度, 电轴角度)；多导联时各导联取各波在导联方向上的投影
+    WAVES = ((0.12, -0.20, 0.025, 60), (-0.15, -0.05, 0.010, -30), (1.00, 0.0, 0.012, 60),
+             (-0.25, 0.04, 0.010, -150), (0.30, 0.25, 0.040, 45))
+    # 导联方向（度）：肢体导联取额面六轴系统，胸导联近似为水平面内的方向
+    LEAD_ANGLES = {'I': 0, 'II': 60, 'III': 120, 'aVR': -150, 'aVL': -30, 'aVF': 90,
+                   'V1': 150, 'V2': 110, 'V3': 80, 'V4': 60, 'V5': 30, 'V6': 0}
+
+    def __init__(self, sample_rate=250, noise=0.02, bpm=72, resp_rate=15, speed=1.0, seed=None,
+                 schema=DEFAULT_SCHEMA):
+        super().__init__(sample_rate, speed, schema=schema)
+        self.noise = noise
+        self.bpm = bpm
+        self.resp_rate = resp_rate
+        self._random = np.random.default_rng(seed)
+        # (波, 导联) 投影系数；没有方向的导联（单导联 ECG）各波取原幅值
+        leads = [self.schema.names[i] for i in self.schema.leads]
+        self._gains = np.array([[np.cos(np.radians(self.LEAD_ANGLES[name] - axis)) if name in self.LEAD_ANGLES else 1.0
+                                 for name in leads] for _, _, _, axis in self.WAVES])
+
+    def generate(self, start, count):
+        t = (start + np.arange(count)) / self.sample_rate
+        rr = 60.0 / self.bpm
+        phase = (t + rr / 2) % rr - rr / 2
+        waves = np.column_stack([amplitude * np.exp(-((phase - center) / width) ** 2)
+                                 for amplitude, center, width, _ in self.WAVES])
+        ecg = waves @ self._gains
+        resp = np.sin(2 * np.pi * self.resp_rate / 60.0 * t)
+        ecg += 0.1 * resp[:, None] + self.noise * self._random.standard_normal(ecg.shape)
+
+        schema = self.schema
+        values = np.empty((count, len(schema)))
+        values[:, schema.leads] = ecg
+        if schema.resp is not None:
+            values[:, schema.resp] = resp
+        if schema.bpm is not None:
+            values[:, schema.bpm] = self.bpm
+        return values
+
+
+class ReplaySource(GeneratedSource):
+    # 按原始采样率（或倍速/不限速）回放录制目录中的会话
+    def __init__(self, directory, speed=1.0):
+        from ecg_recording import ECGRecording
+        self.recording = ECGRecording(directory)
+        # 只回放原始通道，滤波通道由采集端重新计算
+        super().__init__(self.recording.sample_rate, speed,
+                         schema=infer_schema(self.recording.channels, self.recording.sample_rate))
+        self._data = self.recording.slice_range(self.recording.first_timestamp or 0,
+                                                self.recording.last_timestamp or 0)
+
+    def generate(self, start, count):
+        end = min(start + count, len(self._data['timestamp']))
+        return np.column_stack([np.asarray(self._data[name][start:end], dtype=float) for name in self.schema.names])
+
+
+class PtySource:
+    # 把生成的数据写入伪终端主端，调用方以真实串口方式打开从端，覆盖完整的串口读取路径
+    def __init__(self, inner):
+        import pty
+        import tty
+        self.inner = inner
+        self.sample_rate = inner.sample_rate
+        self.schema = inner.schema
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port_name = os.ttyname(self._slave)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        pending = b''
+        while not self._stop_event.is_set():
+            if not pending:
+                pending = self.inner.read(self.inner.in_waiting or 1)
+                continue
+            # 从端没人读取时伪终端缓冲会写满，主端非阻塞写入并限时等待可写，以便及时响应停止
+            _, writable, _ = select.select([], [self._master], [], 0.1)
+            try:
+                if writable:
+                    pending = pending[os.write(self._master, pending):]
+            except BlockingIOError:
+                pass
+
+    # 停止数据泵并关闭伪终端两端
+    def close(self):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self.inner.close()
+        self._thread.join(timeout=2.0)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def open_serial(self, baudrate=115200):
+        ser = PtySerial(self, self.port_name, baudrate, timeout=1)
+        ser.sample_rate = self.sample_rate
+        ser.schema = self.schema
+        return ser
+
+
+class PtySerial(serial.Serial):
+    # 伪终端从端上的真实串口，关闭时一并关闭 PtySource
+    def __init__(self, source, *args, **kwargs):
+        self.source = source
+        super().__init__(*args, **kwargs)
+
+    def close(self):
+        super().close()
+        self.source.close()
+
+
+def _parse_generated(spec):
+    if spec.startswith('bin:'):
+        source = _parse_generated(spec[len('bin:'):])
+        if source is not None:
+            source.binary = True
+        return source
+    kind, _, arguments = spec.partition(':')
+    if kind == 'synthetic':
+        parts = [float(part) for part in arguments.split(':') if part]
+        sample_rate = parts[0] if parts else 250
+        noise = parts[1] if len(parts) > 1 else 0.02
+        leads = int(parts[2]) if len(parts) > 2 else 1
+        schema = {1: DEFAULT_SCHEMA, 8: lead_schema(LEADS_8, sample_rate),
+                  12: lead_schema(LEADS_12, sample_rate)}.get(leads)
+        if schema is None:
+            raise ValueError(f"合成来源只支持 1、8、12 导联: {spec}")
+        return SyntheticECGSource(sample_rate, noise, schema=schema)
+    if kind == 'replay':
+        directory, _, speed = arguments.rpartition('@') if '@' in arguments else (arguments, '', '')
+        if speed == 'max':
+            return ReplaySource(directory, speed=None)
+        return ReplaySource(directory, speed=float(speed) if speed else 1.0)
+    return None
+
+
+# 根据来源描述打开样本来源，普通串口名按真实串口打开
+def open_source(spec, baudrate=115200):
+    if spec.startswith('pty:'):
+        inner = _parse_generated(spec[len('pty:'):])
+        if inner is None:
+            raise ValueError(f"pty 来源只支持 synthetic/replay: {spec}")
+        return PtySource(inner).open_serial(baudrate)
+    source = _parse_generated(spec)
+    if source is not None:
+        return source
+    return serial.Serial(spec, baudrate, timeout=1)
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+import serial
+from perf_metrics import Metrics
+from binary_protocol import BinaryFrameDecoder
+from channel_schema import DEFAULT_SCHEMA
+
+# 协议自动识别：至少看到这么多字节、或连续几个校验通过的二进制帧后再下结论
+DETECT_MIN_BYTES = 64
+DETECT_MIN_FRAMES = 3
+# 超过该长度仍无法判断时按文本协议处理，兼容旧固件
+DETECT_MAX_BYTES = 4096
+
+
+# 将一段完整的文本行批量解析为 (n, n_fields) 的数组，列顺序与通道声明一致
+def parse_csv_block(block, n_fields=3):
+    try:
+        text = block.decode('utf-8')
+    except UnicodeDecodeError:
+        text = block.decode('latin1')
+
+    rows = [line.split(',')[:n_fields] for line in text.splitlines()]
+    rows = [row for row in rows if len(row) == n_fields]
+    if not rows:
+        return np.empty((0, n_fields)), 0
+
+    try:
+        # 整批交给numpy转换，绝大多数情况下一次完成
+        return np.array(rows, dtype=float), 0
+    except ValueError:
+        pass
+
+    # 批内存在格式错误的行时，逐行回退并丢弃坏行
+    values = []
+    malformed = 0
+    for row in rows:
+        try:
+            values.append([float(v) for v in row])
+        except ValueError:
+            malformed += 1
+    if not values:
+        return np.empty((0, n_fields)), malformed
+    return np.array(values, dtype=float), malformed
+
+
+class TextLineDecoder:
+    # 文本协议：每行按通道声明的顺序给出 n_fields 个逗号分隔的值（缺省 ecg,resp,bpm）
+    # 行尾之后的不完整数据留到下一块拼接
+    def __init__(self, n_fields=3):
+        self.n_fields = n_fields
+        self._pending = b''
+        self.malformed_count = 0
+
+    def feed(self, chunk):
+        data = self._pending + chunk
+        end = data.rfind(b'\n')
+        if end < 0:
+            self._pending = data
+            return np.empty((0, self.n_fields))
+        self._pending = data[end + 1:]
+
+        values, malformed = parse_csv_block(data[:end], self.n_fields)
+        self.malformed_count += malformed
+        return values
+
+
+# 根据开头的数据判断协议：返回 'binary'、'text'，数据不足时返回 None
+# 通道排列不支持二进制帧时只识别文本协议
+def detect_protocol(data, schema=DEFAULT_SCHEMA):
+    n_leads = schema.binary_leads
+    if n_leads is not None and len(BinaryFrameDecoder(n_leads).feed(data)) >= DETECT_MIN_FRAMES:
+        return 'binary'
+    if len(data) < DETECT_MIN_BYTES:
+        return None
+    lines = data.split(b'\n')[:-1]
+    if any(len(parse_csv_block(line, len(schema))[0]) for line in lines):
+        return 'text'
+    return 'text' if len(data) >= DETECT_MAX_BYTES else None
+
+
+class SerialReader(threading.Thread):
+    # 后台线程：批量读取串口数据，按文本行或二进制帧整块解码，供界面按帧取走
+    # on_batch(timestamps, values) 在读取线程上处理每个解析好的批次，返回 (时间戳, 数值) 作为供界面取走的批次
+    # （例如单调化后的时间戳和滤波后的波形）
+    # protocol 为 'text' 或 'binary' 时固定使用该协议，None 时根据最先收到的数据自动识别
+    # schema 为设备的通道声明，决定每个样本的字段数
+    def __init__(self, ser, on_batch=None, metrics=None, protocol=None, schema=DEFAULT_SCHEMA):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.schema = schema
+        self.on_batch = on_batch
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.protocol = None
+        self.decoder = None
+        self._detect_buffer = b''
+        if protocol is not None:
+            self._set_protocol(protocol)
+        # 等待界面取走的批次；max_pending 为最多保留的样本数（界面暂停时只留最近一屏），None 时不限制
+        self._batches = deque()
+        self._pending = 0
+        self.max_pending = None
+        self._last_arrival = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _set_protocol(self, protocol):
+        self.protocol = protocol
+        if protocol == 'binary':
+            if self.schema.binary_leads is None:
+                raise ValueError(f"通道声明不支持二进制帧: {self.schema}")
+            self.decoder = BinaryFrameDecoder(self.schema.binary_leads)
+        else:
+            self.decoder = TextLineDecoder(len(self.schema))
+
+    # 文本行格式错误或二进制帧校验失败的条数
+    @property
+    def malformed_count(self):
+        if self.decoder is None:
+            return 0
+        return getattr(self.decoder, 'malformed_count', 0) + getattr(self.decoder, 'corrupt_count', 0)
+
+    # 二进制帧序号缺口推算出的传输丢失样本数，文本协议无法统计
+    @property
+    def dropped_count(self):
+        return getattr(self.decoder, 'dropped_count', 0)
+
+    def run(self):
+        metrics = self.metrics
+        while not self._stop_event.is_set():
+            try:
+                # 没有积压时 read(1) 会阻塞到串口超时，避免空转
+                backlog = self.ser.in_waiting
+                chunk = self.ser.read(backlog or 1)
+            except (OSError, serial.SerialException) as e:
+                print(f"串口读取错误: {e}")
+                break
+            if metrics.enabled:
+                metrics.gauge('backlog_bytes', backlog)
+                metrics.count('bytes_received', len(chunk))
+            if chunk:
+                try:
+                    self.feed(chunk, time.time())
+                except Exception as e:
+                    print(f"数据处理错误: {e}")
+
+    def feed(self, chunk, arrival_time):
+        if self.decoder is None:
+            self._detect_buffer += chunk
+            protocol = detect_protocol(self._detect_buffer, self.schema)
+            if protocol is None:
+                return
+            self._set_protocol(protocol)
+            chunk, self._detect_buffer = self._detect_buffer, b''
+
+        metrics = self.metrics
+        if metrics.enabled:
+            malformed, dropped = self.malformed_count, self.dropped_count
+        with metrics.timer('parse'):
+            values = self.decoder.feed(chunk)
+        if metrics.enabled:
+            metrics.count('samples_parsed', len(values))
+            metrics.count('malformed', self.malformed_count - malformed)
+            metrics.count('samples_dropped', self.dropped_count - dropped)
+        if not len(values):
+            return
+
+        # 本批样本在上一次到达与本次到达之间均匀分配时间戳
+        previous = self._last_arrival if self._last_arrival is not None else arrival_time
+        timestamps = np.linspace(previous, arrival_time, len(values) + 1)[1:]
+        self._last_arrival = arrival_time
+
+        if self.on_batch is not None:
+            with metrics.timer('ingest'):
+                timestamps, values = self.on_batch(timestamps, values)
+
+        with self._lock:
+            self._batches.append((timestamps, values))
+            self._pending += len(values)
+            while self.max_pending is not None and self._pending - len(self._batches[0][1]) >= self.max_pending:
+                self._pending -= len(self._batches.popleft()[1])
+
+    # 取走自上次调用以来到达的全部样本
+    def drain(self):
+        with self._lock:
+            batches, self._batches = self._batches, deque()
+            self._pending = 0
+        if not batches:
+            return None
+        if len(batches) == 1:
+            return batches[0]
+        return (np.concatenate([b[0] for b in batches]),
+                np.concatenate([b[1] for b in batches]))
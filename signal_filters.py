@@ -0,0 +1,102 @@
+import numpy as np
+
+# 流式信号调理：高通去基线漂移 -> 工频陷波 -> 低通平滑，全部为二阶节(SOS)级联的因果IIR滤波
+# 每批样本整体调用一次 sosfilt，滤波器状态在批次之间延续，结果与整段一次性滤波一致
+# 不需要等待后续样本，不引入缓冲延迟；附加延迟只有滤波器本身的群延迟（见 FilterChain.latency），
+# 在默认参数下心电约 7ms、呼吸约 0.25s，与批次大小和采样率基本无关
+#
+# 各类通道的截止频率（Hz），None 表示不使用该级；陷波频率由工频决定（50 或 60Hz）
+ECG_FILTER = {'highpass': 0.5, 'notch': True, 'lowpass': 40.0}
+RESP_FILTER = {'highpass': 0.05, 'notch': False, 'lowpass': 2.0}
+FILTER_SPECS = {'ecg': ECG_FILTER, 'resp': RESP_FILTER}
+FILTER_ORDER = 2
+# 陷波器品质因数，越大陷波越窄
+NOTCH_Q = 30.0
+# 估计群延迟时参考的频率（Hz），取各类信号的主要频段
+LATENCY_REFERENCE = {'ecg': 10.0, 'resp': 0.3}
+
+
+def design_chain(sample_rate, highpass=None, notch=None, lowpass=None, order=FILTER_ORDER):
+    # 返回级联的SOS系数，截止频率不低于奈奎斯特频率的级自动跳过
+    from scipy.signal import butter, iirnotch, tf2sos
+    nyquist = sample_rate / 2.0
+    sections = []
+    if highpass and highpass < nyquist:
+        sections.append(butter(order, highpass, btype='highpass', fs=sample_rate, output='sos'))
+    if notch and notch < nyquist:
+        sections.append(tf2sos(*iirnotch(notch, NOTCH_Q, fs=sample_rate)))
+    if lowpass and lowpass < nyquist:
+        sections.append(butter(order, lowpass, btype='lowpass', fs=sample_rate, output='sos'))
+    return np.concatenate(sections) if sections else None
+
+
+def group_delay(sos, frequency, sample_rate):
+    # 在 frequency 附近用相位差分估计群延迟（秒）
+    from scipy.signal import sosfreqz
+    step = min(0.05, frequency / 10)
+    _, response = sosfreqz(sos, worN=[frequency - step, frequency + step], fs=sample_rate)
+    phase_step = np.angle(response[1] / response[0])
+    return max(0.0, -phase_step / (2 * np.pi * 2 * step))
+
+
+class FilterChain:
+    # 对 (样本数, 通道数) 的批次逐列滤波，kinds 为各列的通道类型（'ecg' / 'resp'），决定使用的滤波参数
+    # 同类通道共用一组系数，一次 sosfilt 沿样本轴处理全部列（多导联时仍是每批一次调用）
+    def __init__(self, sample_rate, mains_frequency=50.0, kinds=('ecg', 'resp')):
+        self.sample_rate = sample_rate
+        self.mains_frequency = mains_frequency
+        self.kinds = tuple(kinds)
+        # 类型 -> 该类型的列号
+        self._groups = {kind: [i for i, k in enumerate(self.kinds) if k == kind] for kind in dict.fromkeys(self.kinds)}
+        # 滤波器在处理第一批样本时才设计（scipy.signal 导入较慢，放到读取线程上进行）
+        self.sos = None
+        self._zi = None
+        self._latency = None
+
+    def _design(self):
+        self.sos = {}
+        for kind in self._groups:
+            spec = FILTER_SPECS.get(kind, {})
+            notch = self.mains_frequency if spec.get('notch') else None
+            self.sos[kind] = design_chain(self.sample_rate, spec.get('highpass'), notch, spec.get('lowpass'))
+        self._zi = dict.fromkeys(self._groups)
+
+    # 各类通道附加的延迟（秒）
+    @property
+    def latency(self):
+        if self._latency is None:
+            if self.sos is None:
+                self._design()
+            self._latency = {kind: group_delay(sos, LATENCY_REFERENCE.get(kind, 10.0), self.sample_rate)
+                             if sos is not None else 0.0 for kind, sos in self.sos.items()}
+        return self._latency
+
+    def process(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, None]
+        if self.sos is None:
+            self._design()
+        filtered = np.empty_like(values)
+        if not len(values):
+            return filtered
+        from scipy.signal import sosfilt, sosfilt_zi
+        for kind, columns in self._groups.items():
+            sos = self.sos[kind]
+            block = values[:, columns]
+            if sos is None:
+                filtered[:, columns] = block
+                continue
+            # 缺失样本按0送入滤波器，输出处保留NaN，避免NaN污染滤波器状态
+            missing = np.isnan(block)
+            has_missing = missing.any()
+            if has_missing:
+                block = np.where(missing, 0.0, block)
+            if self._zi[kind] is None:
+                # 以第一个样本作稳态初值，高通级的初值为0，开机时没有阶跃瞬态
+                self._zi[kind] = sosfilt_zi(sos)[:, :, None] * block[0]
+            result, self._zi[kind] = sosfilt(sos, block, axis=0, zi=self._zi[kind])
+            if has_missing:
+                result[missing] = np.nan
+            filtered[:, columns] = result
+        return filtered
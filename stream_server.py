@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from perf_metrics import Metrics
+
+# 实时数据推流：把各设备滤波后的样本批次和报警事件推送给任意数量的订阅者
+# 同一端口同时支持两种连接：
+#   TCP        连接后发送一行要订阅的设备名（逗号分隔，空行为全部），之后每行一条JSON消息
+#   WebSocket  GET /?devices=a,b 握手（缺省为全部设备），之后每个文本帧一条JSON消息
+# 消息：hello（各设备的通道与采样率）、device（新接入的设备）、samples（一段样本）、event（报警事件）
+#
+# 采集线程只把批次追加到待发送列表（没有订阅者时直接返回），编码和发送都在推流线程的事件循环中进行：
+# 每 STREAM_INTERVAL 秒合并一次，每个设备、每个抽取倍数只编码一次，各订阅者共用同一份字节串
+# 每个订阅者有独立的有界发送队列，慢速订阅者先逐级抽取降低数据率，队列仍满时丢弃最旧的样本消息，
+# 事件消息不丢弃；任何情况下都不会阻塞采集
+STREAM_INTERVAL = 0.1
+# 每个订阅者最多积压的消息数（约5秒）
+QUEUE_LIMIT = 50
+# 'decimate'：积压过半时抽取倍数加倍；'drop'：只丢弃最旧的消息
+BACKPRESSURE_POLICIES = ('decimate', 'drop')
+MAX_DECIMATION = 16
+# 连续多少次发送后队列都能清空，才把抽取倍数减半（避免在两档之间来回切换）
+RECOVER_FLUSHES = 20
+# 套接字发送缓冲达到该字节数后等待对方接收
+WRITE_BUFFER = 64 * 1024
+# 等待订阅请求行的时间（秒），超时按 TCP 订阅全部设备处理
+HANDSHAKE_TIMEOUT = 1.0
+# 订阅者发来的 WebSocket 帧只处理控制帧，超过该长度视为异常并断开
+WS_MAX_FRAME = 64 * 1024
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC11B8F'
+WS_TEXT, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x8, 0x9, 0xA
+# 推送的数值保留的小数位
+VALUE_DECIMALS = 4
+
+
+def ws_frame(payload, opcode=WS_TEXT):
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
+
+
+async def read_ws_frame(reader):
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0F
+    n = head[1] & 0x7F
+    if n == 126:
+        n = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if n > WS_MAX_FRAME:
+        raise ConnectionError("WebSocket 帧过长")
+    mask = await reader.readexactly(4) if head[1] & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask is not None:
+        key = np.resize(np.frombuffer(mask, dtype=np.uint8), n)
+        payload = (np.frombuffer(payload, dtype=np.uint8) ^ key).tobytes()
+    return opcode, payload
+
+
+# 一条消息的两种线上格式：TCP 行与 WebSocket 帧，编码一次供所有订阅者使用
+def encode_message(message):
+    payload = json.dumps(message, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    return payload + b'\n', ws_frame(payload)
+
+
+def _rounded(values):
+    values = np.round(values, VALUE_DECIMALS)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values.tolist()
+    # JSON 没有 NaN，缺失值写为 null
+    values = values.astype(object)
+    values[missing] = None
+    return values.tolist()
+
+
+class _Client:
+    def __init__(self, writer, websocket, devices):
+        self.writer = writer
+        self.websocket = websocket
+        # None 表示订阅全部设备
+        self.devices = devices
+        # (字节串, 是否可丢弃)
+        self.queue = deque()
+        self.wakeup = asyncio.Event()
+        self.decimation = 1
+        self.calm = 0
+        self.closed = False
+
+    def wants(self, device):
+        return self.devices is None or device in self.devices
+
+    def push(self, encoded, droppable):
+        self.queue.append((encoded[1] if self.websocket else encoded[0], droppable))
+        self.wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+
+class StreamServer(threading.Thread):
+    # 在后台线程上运行 asyncio 事件循环的推流服务；端口在构造时绑定，被占用时直接抛出 OSError
+    # 采集侧调用 register / publish / publish_event，均为线程安全且不阻塞
+    def __init__(self, port, host='127.0.0.1', backpressure='decimate', metrics=None):
+        super().__init__(daemon=True)
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"未知的背压策略: {backpressure}")
+        self.backpressure = backpressure
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._sock = socket.create_server((host, port))
+        self.address = self._sock.getsockname()[:2]
+        # 设备名 -> hello 中的描述
+        self.devices = {}
+        self._pending = {}
+        self._messages = []
+        # 各设备已推送的样本数，抽取时保持跨批次的相位连续
+        self._sample_counts = {}
+        self._clients = set()
+        self._handlers = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._stopped = None
+        self._stop_requested = False
+
+    def stop(self):
+        self._stop_requested = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def register(self, device, channels, sample_rate):
+        description = {'channels': list(channels), 'sample_rate': float(sample_rate)}
+        with self._lock:
+            self.devices[device] = description
+            # 之后连接的订阅者从 hello 中得到该设备
+            if self._clients:
+                self._messages.append((device, {'type': 'device', 'device': device, **description}))
+
+    # timestamps 为 (n,)，values 为 (n, 通道数)，列顺序与 register 时的 channels 一致
+    def publish(self, device, timestamps, values):
+        if not self._clients:
+            return
+        with self._lock:
+            self._pending.setdefault(device, []).append((timestamps, values))
+
+    def publish_event(self, device, event):
+        with self._lock:
+            self._messages.append((device, {'type': 'event', 'device': device, **event._asdict()}))
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._stop_requested:
+            return
+        server = await asyncio.start_server(self._handle, sock=self._sock)
+        flusher = asyncio.create_task(self._flush_loop())
+        async with server:
+            await self._stopped.wait()
+        flusher.cancel()
+        # 直接断开（不等待慢速订阅者收完缓冲），各连接的处理协程随之结束
+        for client in list(self._clients):
+            client.close()
+            client.writer.transport.abort()
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=1.0)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(STREAM_INTERVAL)
+            try:
+                self._flush()
+            except Exception as e:
+                print(f"推流错误: {e}")
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            messages, self._messages = self._messages, []
+        clients = [client for client in self._clients if not client.closed]
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.gauge('stream_clients', len(clients))
+            metrics.gauge('stream_max_decimation', max((client.decimation for client in clients), default=1))
+
+        for device, message in messages:
+            encoded = encode_message(message)
+            for client in clients:
+                if client.wants(device):
+                    client.push(encoded, droppable=False)
+
+        for device, batches in pending.items():
+            timestamps = np.concatenate([batch[0] for batch in batches])
+            values = np.concatenate([batch[1] for batch in batches])
+            start = self._sample_counts.get(device, 0)
+            self._sample_counts[device] = start + len(timestamps)
+            # 抽取倍数 -> 编码结果，同一倍数的订阅者共用
+            encoded = {}
+            for client in clients:
+                if not client.wants(device):
+                    continue
+                k = client.decimation
+                if k not in encoded:
+                    with metrics.timer('stream_encode'):
+                        phase = (-start) % k
+                        encoded[k] = encode_message({
+                            'type': 'samples', 'device': device, 'decimation': k,
+                            'timestamp': np.round(timestamps[phase::k], 6).tolist(),
+                            'values': _rounded(values[phase::k])})
+                self._deliver(client, encoded[k])
+
+    def _deliver(self, client, encoded):
+        queue = client.queue
+        if self.backpressure == 'decimate' and len(queue) >= QUEUE_LIMIT // 2 and client.decimation < MAX_DECIMATION:
+            client.decimation *= 2
+            client.calm = 0
+        if len(queue) >= QUEUE_LIMIT:
+            # 丢弃最旧的一条样本消息，事件消息保留
+            for i, (_, droppable) in enumerate(queue):
+                if droppable:
+                    del queue[i]
+                    self.metrics.count('stream_dropped')
+                    break
+        client.push(encoded, droppable=True)
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        client = None
+        try:
+            try:
+                line = await asyncio.wait_for(reader.readline(), HANDSHAKE_TIMEOUT)
+            except asyncio.TimeoutError:
+                line = b''
+            if line.startswith(b'GET '):
+                devices = await self._websocket_handshake(line, reader, writer)
+                if devices is False:
+                    return
+                client = _Client(writer, True, devices)
+            else:
+                names = [name.strip() for name in line.decode('utf-8', 'replace').split(',') if name.strip()]
+                client = _Client(writer, False, set(names) or None)
+            writer.transport.set_write_buffer_limits(high=WRITE_BUFFER)
+            with self._lock:
+                hello = {'type': 'hello', 'interval': STREAM_INTERVAL, 'devices': dict(self.devices)}
+            client.push(encode_message(hello), droppable=False)
+            self._clients.add(client)
+            watcher = asyncio.create_task(self._read_loop(client, reader))
+            try:
+                await self._write_loop(client)
+            finally:
+                watcher.cancel()
+        # 握手超时在 3.11 之前是 asyncio.TimeoutError（不属于 OSError），单独列出
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            if client is not None:
+                client.closed = True
+                self._clients.discard(client)
+            writer.close()
+            self._handlers.discard(task)
+
+    # 返回订阅的设备集合（None 为全部），握手失败返回 False
+    async def _websocket_handshake(self, request_line, reader, writer):
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), HANDSHAKE_TIMEOUT)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if headers.get('upgrade', '').lower() != 'websocket' or not key:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode('ascii'))
+        parts = request_line.decode('latin1').split()
+        query = parse_qs(urlsplit(parts[1]).query) if len(parts) > 1 else {}
+        names = [name for value in query.get('devices', []) for name in value.split(',') if name]
+        return set(names) or None
+
+    async def _write_loop(self, client):
+        writer = client.writer
+        metrics = self.metrics
+        while not client.closed:
+            await client.wakeup.wait()
+            client.wakeup.clear()
+            while client.queue:
+                data, _ = client.queue.popleft()
+                writer.write(data)
+                await writer.drain()
+                metrics.count('stream_messages')
+                metrics.count('stream_bytes', len(data))
+            # 持续跟得上时逐级恢复分辨率
+            if client.decimation > 1:
+                client.calm += 1
+                if client.calm >= RECOVER_FLUSHES:
+                    client.decimation //= 2
+                    client.calm = 0
+
+    # 订阅者只会发来断开或 WebSocket 控制帧
+    async def _read_loop(self, client, reader):
+        try:
+            if not client.websocket:
+                while await reader.read(4096):
+                    pass
+                return
+            while True:
+                opcode, payload = await read_ws_frame(reader)
+                if opcode == WS_PING:
+                    client.push((None, ws_frame(payload, WS_PONG)), droppable=False)
+                elif opcode == WS_CLOSE:
+                    client.push((None, ws_frame(payload[:2], WS_CLOSE)), droppable=False)
+                    return
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            client.close()
+
+
+# 测试用订阅者：连接推流端口，每秒打印各设备收到的样本数和当前抽取倍数
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="实时数据流订阅测试")
+    parser.add_argument('address', help="端口，或 主机:端口")
+    parser.add_argument('-d', '--devices', default='', help="只订阅这些设备（逗号分隔），缺省为全部")
+    parser.add_argument('-t', '--seconds', type=float, default=10.0, help="运行时长（秒）")
+    args = parser.parse_args(argv)
+    host, _, port = args.address.rpartition(':')
+
+    with socket.create_connection((host or '127.0.0.1', int(port))) as sock:
+        sock.sendall(args.devices.encode('utf-8') + b'\n')
+        sock.settimeout(0.2)
+        deadline = time.time() + args.seconds
+        report = time.time() + 1.0
+        received = {}
+        buffer = b''
+        while time.time() < deadline:
+            try:
+                chunk = sock.recv(65536)
+            except socket.timeout:
+                chunk = None
+            if chunk == b'':
+                print("连接已关闭")
+                break
+            if chunk:
+                *lines, buffer = (buffer + chunk).split(b'\n')
+                for line in lines:
+                    message = json.loads(line)
+                    if message['type'] == 'samples':
+                        count, _ = received.get(message['device'], (0, 1))
+                        received[message['device']] = (count + len(message['timestamp']), message['decimation'])
+                    else:
+                        print(message)
+            if time.time() >= report:
+                print('  '.join(f"{device}: {count} 样本/秒 (抽取 {k})" for device, (count, k) in received.items()))
+                received = {}
+                report += 1.0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import time
+import numpy as np
+from acquisition import AcquisitionPipeline
+from alarm_engine import NullBackend
+
+SAMPLE_RATE = 250
+BATCH = 25
+
+
+# 不启动读取线程，直接按批次调用 ingest；返回报警线程收到的事件
+def run_pipeline(tmp_path, values, device_bpm=None):
+    pipeline = AcquisitionPipeline('synthetic:250', SAMPLE_RATE, str(tmp_path), bpm_low=40, bpm_high=120)
+    backend = NullBackend()
+    pipeline.alarm_engine.backends = [backend]
+    pipeline.recorder.start()
+    pipeline.alarm_engine.start()
+    start = time.time()
+    try:
+        for offset in range(0, len(values), BATCH):
+            batch = values[offset:offset + BATCH].copy()
+            if device_bpm is not None:
+                batch[:, pipeline.schema.bpm] = device_bpm
+            pipeline.ingest(start + (offset + np.arange(len(batch))) / SAMPLE_RATE, batch)
+        # 等报警线程处理完队列
+        time.sleep(1.0)
+    finally:
+        pipeline.reader.stop()
+        pipeline.alarm_engine.stop()
+        pipeline.recorder.close()
+        pipeline.ser.close()
+    return pipeline, [event for event in backend.events if '心率越限' in event.rule]
+
+
+def synthetic(bpm, seconds):
+    from sample_sources import SyntheticECGSource
+    return SyntheticECGSource(SAMPLE_RATE, bpm=bpm, seed=0).generate(0, int(seconds * SAMPLE_RATE))
+
+
+def test_host_bpm_overrides_device_bpm(tmp_path):
+    _, events = run_pipeline(tmp_path, synthetic(150, 10), device_bpm=72)
+    assert [event.state for event in events][:1] == ['raised']
+    assert '150' in events[0].message
+
+
+def test_flatline_raises_low_rate_alarm(tmp_path):
+    values = synthetic(75, 10)
+    flat = np.zeros((20 * SAMPLE_RATE, values.shape[1]))
+    # 设备仍上报正常心率，报警只能来自主机端检测
+    flat[:, 2] = 75
+    pipeline, events = run_pipeline(tmp_path, np.vstack((values, flat)))
+    raised = [event for event in events if event.state == 'raised']
+    assert raised, "停搏后应触发低心率报警"
+    assert raised[0].timestamp - pipeline.store.first_timestamp < 10 + 60 / 40 + 2.0 + 1.0
+
+
+class RecordingStream:
+    def __init__(self):
+        self.events = []
+
+    def publish_event(self, device, event):
+        self.events.append(event)
+
+
+# 重复提醒推送给订阅方，但不重复写入事件索引
+def test_repeat_events_are_published_not_indexed(tmp_path):
+    from alarm_engine import AlarmEvent
+    pipeline = AcquisitionPipeline('synthetic:250', SAMPLE_RATE, str(tmp_path))
+    pipeline.stream = RecordingStream()
+    pipeline.recorder.start()
+    try:
+        raised = AlarmEvent(time.time(), '心率越限', 'raised', "心率异常: 30 bpm")
+        pipeline.record_event(raised)
+        pipeline.record_event(raised._replace(state='repeat'))
+    finally:
+        pipeline.recorder.close()
+        pipeline.ser.close()
+    assert [event.state for event in pipeline.stream.events] == ['raised', 'repeat']
+    assert len(pipeline.store.events) == 1
@@ -0,0 +1,21 @@
+import time
+from alarm_engine import AlarmEngine, BPMThresholdRule, NullBackend
+
+
+# 报警持续期间的重复提醒也要经过 on_event，推流订阅方才能收到
+def test_repeats_reach_on_event():
+    received = []
+    backend = NullBackend()
+    engine = AlarmEngine([BPMThresholdRule(low=40, high=120)], [backend], repeat_interval=0.2,
+                         tick_interval=0.05, on_event=received.append)
+    engine.start()
+    try:
+        engine.submit([time.time()], [30.0])
+        time.sleep(0.8)
+    finally:
+        engine.stop()
+        engine.join(timeout=2.0)
+    states = [event.state for event in received]
+    assert states[0] == 'raised'
+    assert 'repeat' in states
+    assert states == [event.state for event in backend.events]
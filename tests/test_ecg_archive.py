@@ -0,0 +1,48 @@
+import numpy as np
+from ecg_archive import ECGArchive
+from ecg_recording import ECGRecording, RecordingWriter
+from ecg_store import select_range
+from event_index import query_events
+from export_pipeline import export_data
+
+SAMPLE_RATE = 250
+START = 1.7e9
+
+
+# 两段数据中间断开 5 秒；R波每 0.8 秒一个，跨中断的RR为实际间隔
+def write_recording(directory):
+    writer = RecordingWriter(directory, SAMPLE_RATE)
+    writer.start()
+    beat_times = []
+    for offset in (0.0, 15.0):
+        timestamps = START + offset + np.arange(10 * SAMPLE_RATE) / SAMPLE_RATE
+        writer.write(timestamps, np.column_stack((np.sin(timestamps), np.cos(timestamps),
+                                                  np.full(len(timestamps), 75.0))))
+        beat_times.extend(timestamps[::SAMPLE_RATE * 4 // 5])
+    beat_times = np.array(beat_times)
+    rr = np.diff(beat_times, prepend=beat_times[0] - 0.8)
+    writer.write_beats(beat_times, rr, 60.0 / rr)
+    writer.close()
+
+
+def test_archive_round_trip_keeps_beats(tmp_path):
+    write_recording(str(tmp_path / 'rec'))
+    recording = ECGRecording(str(tmp_path / 'rec'))
+    # 从第二个R波之后开始导出，范围内第一个R波的RR指向范围外的R波
+    start, end = START + 1.0, recording.last_timestamp
+    data = select_range(recording, start, end)
+    beats = recording.beats_in_range(data['timestamp'][0], data['timestamp'][-1])
+    events, _ = query_events(recording, data['timestamp'][0], data['timestamp'][-1])
+    path = str(tmp_path / 'out.ecgz')
+    export_data(path, data, events=events, beats=beats)
+
+    archive = ECGArchive(path)
+    try:
+        restored = archive.beats_in_range(start, end)
+        for name in ('timestamp', 'RR', 'BPM'):
+            np.testing.assert_allclose(restored[name], beats[name], rtol=0, atol=1e-6)
+        assert np.isfinite(restored['RR']).all()
+        assert restored['RR'].max() > 5.0
+        np.testing.assert_array_equal(select_range(archive, start, end)['Beat'], data['Beat'])
+    finally:
+        archive.close()
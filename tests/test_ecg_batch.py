@@ -0,0 +1,28 @@
+import os
+import numpy as np
+import ecg_batch
+from ecg_recording import RecordingWriter
+
+
+def write_recording(directory, start, value):
+    writer = RecordingWriter(directory, 250)
+    writer.start()
+    writer.write(start + np.arange(500) / 250, np.full((500, 3), value))
+    writer.close()
+
+
+# 不同会话下的同名设备并行导出时输出文件名不能相同
+def test_same_device_in_two_sessions(tmp_path):
+    write_recording(str(tmp_path / 'rec' / 'sessA' / 'COM3'), 1.7e9, 1.0)
+    write_recording(str(tmp_path / 'rec' / 'sessB' / 'COM3'), 1.7e9, 2.0)
+    output_dir = tmp_path / 'out'
+    assert ecg_batch.main([str(tmp_path / 'rec'), '-f', 'csv', '-o', str(output_dir), '-j', '2']) == 0
+    outputs = sorted(name for name in os.listdir(output_dir) if not name.endswith('_summary.csv'))
+    assert len(outputs) == 2
+    assert outputs[0].startswith('sessA_COM3_') and outputs[1].startswith('sessB_COM3_')
+
+
+def test_output_names_only_extend_clashes():
+    names = ecg_batch.output_names(['rec/sessA/COM3', 'rec/sessB/COM3', 'rec/sessB/COM4', 'old/COM5.ecgz'])
+    assert names == {'rec/sessA/COM3': 'sessA_COM3', 'rec/sessB/COM3': 'sessB_COM3',
+                     'rec/sessB/COM4': 'COM4', 'old/COM5.ecgz': 'COM5'}
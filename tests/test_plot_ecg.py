@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# plot_ecg 是脚本，导入即建图并连接设备，放到子进程中以 Agg 后端运行，连接合成来源后按 blit 方式画几帧
+FRAME_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+sys.argv = ['plot_ecg.py', 'synthetic:250']
+import plot_ecg
+time.sleep(0.3)
+plot_ecg.fig.canvas.draw()
+plot_ecg.ani._init_draw()
+for frame in range(3):
+    plot_ecg.ani._draw_next_frame(frame, blit=True)
+plot_ecg.metrics_text.set_visible(True)
+plot_ecg.ani._draw_next_frame(plot_ecg.METRICS_REFRESH_FRAMES, blit=True)
+for pipeline in plot_ecg.pipelines:
+    pipeline.stop()
+print('frames ok', len(plot_ecg.panels[0].buffers[0].data))
+"""
+
+
+def test_blitted_frames(tmp_path):
+    result = subprocess.run([sys.executable, '-c', FRAME_SCRIPT.format(root=ROOT)], cwd=tmp_path,
+                            env=dict(os.environ, MPLBACKEND='Agg'), capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'frames ok' in result.stdout
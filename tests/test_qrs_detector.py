@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from qrs_detector import QRSDetector
+from sample_sources import SyntheticECGSource
+
+SECONDS = 120
+# 学习期结束、开始检测的时间
+LEARNING_END = 2.5
+# 与真实R波相差不超过该值的检出算作命中
+TOLERANCE = 0.05
+
+
+# 按 0.1 秒一批送入检测器，返回全部R波时间和RR
+def detect(rate, ecg):
+    timestamps = np.arange(len(ecg)) / rate
+    detector = QRSDetector(rate)
+    batch = rate // 10
+    beats, rrs = [], []
+    for offset in range(0, len(ecg), batch):
+        found, rr, _ = detector.process(timestamps[offset:offset + batch], ecg[offset:offset + batch])
+        beats.extend(found)
+        rrs.extend(rr)
+    return np.array(beats), np.array(rrs)
+
+
+# 合成信号的R波位于 k*60/bpm 秒；跳过学习期和末尾尚未确认的部分
+def ground_truth(bpm):
+    truth = np.arange(0, SECONDS, 60.0 / bpm)
+    return truth[(truth > LEARNING_END) & (truth < SECONDS - 0.5)]
+
+
+@pytest.mark.parametrize('rate', [250, 500, 1000])
+@pytest.mark.parametrize('noise', [0.02, 0.05, 0.1])
+@pytest.mark.parametrize('bpm', [50, 72, 150])
+def test_beats_match_ground_truth(rate, noise, bpm):
+    ecg = SyntheticECGSource(rate, noise=noise, bpm=bpm, seed=1).generate(0, SECONDS * rate)[:, 0]
+    beats, rrs = detect(rate, ecg)
+    truth = ground_truth(bpm)
+    beats = beats[(beats > LEARNING_END) & (beats < SECONDS - 0.5)]
+
+    matched = np.min(np.abs(beats[:, None] - truth[None, :]), axis=0) < TOLERANCE
+    assert matched.all()
+    # T波误检会多出RR约为真实RR三分之一的心搏
+    assert len(beats) - len(truth) <= 1
+    assert np.median(rrs[1:]) == pytest.approx(60.0 / bpm, abs=0.01)
+    assert np.sum(rrs[1:] < 0.5 * 60.0 / bpm) <= 1
+
+
+# 把一个QRS衰减到原幅度的 35%，主阈值检测不到，由回溯搜索补回
+@pytest.mark.parametrize('rate', [250, 500, 1000])
+def test_search_back_recovers_weak_beat(rate):
+    ecg = SyntheticECGSource(rate, noise=0.02, bpm=60, seed=1).generate(0, 30 * rate)[:, 0].copy()
+    timestamps = np.arange(len(ecg)) / rate
+    ecg[(timestamps > 19.7) & (timestamps < 20.4)] *= 0.35
+    beats, _ = detect(rate, ecg)
+    assert np.any(np.abs(beats - 20.0) < TOLERANCE)
+    assert np.all(np.diff(beats) > 0.9)